@@ -0,0 +1,5 @@
+"""
+# Transdoc / Benchmarks
+
+Performance benchmarks for Transdoc.
+"""
@@ -0,0 +1,162 @@
+"""
+# Transdoc / Benchmarks / Corpus
+
+Generate synthetic source trees and rule files for benchmarking.
+"""
+import random
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any
+
+
+@dataclass(frozen=True)
+class CorpusParams:
+    """
+    Parameters describing a synthetic corpus.
+    """
+    files: int = 200
+    """Number of Python files in the tree"""
+    file_size: int = 8_000
+    """Approximate size of each file, in bytes"""
+    density: float = 0.5
+    """Fraction of functions whose docstrings use rules"""
+    rules: int = 10
+    """Number of distinct rules defined by the rule file"""
+    rule_cost: float = 0.0
+    """Time spent by each call to a rule, in microseconds"""
+    seed: int = 0
+    """Seed used to generate the corpus, so that it is reproducible"""
+
+    def to_json(self) -> dict[str, Any]:
+        return asdict(self)
+
+
+@dataclass(frozen=True)
+class Corpus:
+    """
+    A synthetic corpus which was written to disk.
+    """
+    params: CorpusParams
+    input: Path
+    """Directory containing the generated source files"""
+    rule_file: Path
+    """Path to the generated rule file"""
+    files: list[Path]
+    """Paths to each generated source file"""
+    size: int
+    """Total size of all generated source files, in bytes"""
+    rule_uses: int
+    """Total number of uses of rules in the generated source files"""
+
+
+RULE_TEMPLATE = '''
+def rule_{index}(arg: str = "value") -> str:
+    spin()
+    return f"Generated by rule {index} for {{arg}}"
+'''
+
+RULE_FILE_HEADER = '''"""
+Rules for a synthetic Transdoc benchmark corpus.
+"""
+import time
+
+COST = {cost}
+"""Time spent by each call to a rule, in seconds"""
+
+
+def spin() -> None:
+    # Busy-wait rather than sleeping, so that short costs are accurate
+    end = time.perf_counter() + COST
+    while time.perf_counter() < end:
+        pass
+'''
+
+
+def make_rule_file(params: CorpusParams) -> str:
+    """
+    Generate the source code of a rule file defining `params.rules` rules.
+    """
+    return RULE_FILE_HEADER.format(cost=params.rule_cost / 1e6) + "".join(
+        RULE_TEMPLATE.format(index=index)
+        for index in range(params.rules)
+    )
+
+
+def make_function(
+    index: int,
+    params: CorpusParams,
+    rng: random.Random,
+) -> tuple[str, int]:
+    """
+    Generate a function, returning its source and the number of rules it
+    uses.
+    """
+    lines = [f"def function_{index}(value: int) -> int:"]
+    uses = 0
+    if rng.random() < params.density:
+        lines.append('    """')
+        lines.append(f"    Perform step {index} of the calculation.")
+        lines.append("")
+        for _ in range(rng.randint(1, 3)):
+            rule = rng.randrange(params.rules)
+            if rng.random() < 0.5:
+                lines.append(f"    {{{{rule_{rule}[item {index}]}}}}")
+            else:
+                lines.append(f"    See {{{{rule_{rule}('step {index}')}}}}")
+            uses += 1
+        lines.append('    """')
+    else:
+        lines.append(f'    """Perform step {index} of the calculation."""')
+    lines.extend([
+        f"    total = value * {rng.randint(2, 100)}",
+        "    for i in range(value):",
+        f"        total += i % {rng.randint(2, 10)}  # Accumulate",
+        "    return total",
+        "",
+        "",
+    ])
+    return "\n".join(lines), uses
+
+
+def make_file(params: CorpusParams, rng: random.Random) -> tuple[str, int]:
+    """
+    Generate the source code of a file of roughly `params.file_size` bytes,
+    returning its source and the number of rules it uses.
+    """
+    parts = ['"""\nA generated module.\n"""\n\n\n']
+    size = len(parts[0])
+    uses = 0
+    index = 0
+    while size < params.file_size:
+        function, function_uses = make_function(index, params, rng)
+        parts.append(function)
+        size += len(function)
+        uses += function_uses
+        index += 1
+    return "".join(parts), uses
+
+
+def generate_corpus(root: Path, params: CorpusParams) -> Corpus:
+    """
+    Write a synthetic corpus described by `params` into the given directory.
+    """
+    rng = random.Random(params.seed)
+    input = root.joinpath("input")
+    rule_file = root.joinpath("rules.py")
+    rule_file.parent.mkdir(parents=True, exist_ok=True)
+    rule_file.write_text(make_rule_file(params))
+
+    files: list[Path] = []
+    size = 0
+    rule_uses = 0
+    for index in range(params.files):
+        # Spread the files between a few packages
+        file = input.joinpath(f"package_{index % 8}", f"module_{index}.py")
+        file.parent.mkdir(parents=True, exist_ok=True)
+        source, uses = make_file(params, rng)
+        file.write_text(source)
+        files.append(file)
+        size += len(source.encode())
+        rule_uses += uses
+
+    return Corpus(params, input, rule_file, files, size, rule_uses)
@@ -0,0 +1,113 @@
+"""
+# Transdoc / Benchmarks / Scanner benchmark
+
+Micro-benchmark comparing the docstring scanner against the original
+character-by-character implementation.
+
+Usage: python -m benchmarks.scanner_benchmark
+"""
+from io import StringIO
+from timeit import timeit
+from typing import Callable
+
+from transdoc.__scanner import substitute_rules
+
+
+def legacy_substitute_rules(
+    docstring: str,
+    evaluate: Callable[[str], str],
+) -> str:
+    """
+    The original implementation of the docstring scanner, which visits each
+    character individually, with error reporting removed.
+    """
+    new_doc = StringIO()
+    cmd_buffer = StringIO()
+    in_cmd_buffer = False
+    brace_count = 0
+    col_offset = 3
+    line_offset = 0
+    for c in docstring:
+        if in_cmd_buffer:
+            if c == "}":
+                brace_count += 1
+                if brace_count == 2:
+                    cmd_buffer.seek(0)
+                    new_doc.write(evaluate(cmd_buffer.read()))
+                    cmd_buffer = StringIO()
+                    in_cmd_buffer = False
+                    brace_count = 0
+            else:
+                if brace_count == 1:
+                    cmd_buffer.write("}")
+                brace_count = 0
+                cmd_buffer.write(c)
+        else:
+            if c == "{":
+                brace_count += 1
+                if brace_count == 2:
+                    in_cmd_buffer = True
+                    brace_count = 0
+            else:
+                if brace_count == 1:
+                    new_doc.write("{")
+                brace_count = 0
+                new_doc.write(c)
+        if c == '\n':
+            line_offset += 1
+            col_offset = 0
+        else:
+            col_offset += 1
+    new_doc.seek(0)
+    return new_doc.read()
+
+
+RULES = [
+    "    {{license_notice}}",
+    "    See also: {{link[some.module.SomeClass]}}",
+    "    Documented {{docs('some/page', text='here')}}.",
+    "    {{table({'key': 'value', 'other': {'nested': 1}})}}",
+]
+"""Rules using each syntax, to be cycled through in generated docstrings"""
+
+
+def make_docstring(size: int, rule_every: int) -> str:
+    """
+    Generate a docstring of roughly `size` characters, containing a rule
+    every `rule_every` lines.
+    """
+    lines: list[str] = []
+    length = 0
+    while length < size:
+        if len(lines) % rule_every == 0:
+            line = RULES[len(lines) // rule_every % len(RULES)]
+        else:
+            line = "    Some generated {documentation} describing a value."
+        lines.append(line)
+        length += len(line) + 1
+    return "\n".join(lines)
+
+
+def run(size: int, rule_every: int, number: int) -> None:
+    docstring = make_docstring(size, rule_every)
+
+    legacy = timeit(
+        lambda: legacy_substitute_rules(docstring, lambda rule: "x"),
+        number=number,
+    )
+    current = timeit(
+        lambda: substitute_rules(docstring, lambda marker: "x"),
+        number=number,
+    )
+    print(
+        f"{size // 1000:>4} KB, rule every {rule_every:>3} lines: "
+        f"legacy {legacy / number * 1e3:8.3f} ms, "
+        f"current {current / number * 1e3:8.3f} ms "
+        f"({legacy / current:5.1f}x faster)"
+    )
+
+
+if __name__ == '__main__':
+    for size in [1_000, 10_000, 50_000]:
+        for rule_every in [1, 10, 100]:
+            run(size, rule_every, number=max(1, 200_000 // size))
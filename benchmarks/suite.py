@@ -0,0 +1,339 @@
+"""
+# Transdoc / Benchmarks / Suite
+
+Benchmark `transform()` and `main()` on a synthetic corpus, timing each
+phase of the transformation separately.
+
+Usage: python -m benchmarks.suite [--files N] [--json results.json]
+
+Use `--help` to see all options. Results can be saved as JSON, and compared
+against a previous run using `--compare`.
+"""
+import json
+import platform
+import sys
+import tempfile
+import tokenize
+import tracemalloc
+from dataclasses import dataclass
+from io import StringIO
+from pathlib import Path
+from time import perf_counter
+from typing import Any, Callable, Optional
+
+import click
+
+from transdoc import main, transform
+from transdoc.__collect_rules import collect_rules
+from transdoc.__consts import VERSION
+from transdoc.__evaluator import Deferred, RuleEvaluator
+from transdoc.__processor import load_rule_file
+from transdoc.__rule import Rule
+from transdoc.__transformer import ENGINES, Engine
+
+from .corpus import Corpus, CorpusParams, generate_corpus
+
+
+PHASES = ("parse", "scan", "evaluate", "codegen", "write")
+"""
+Phases of a transformation:
+
+* `parse`: parsing (libcst) or tokenizing (tokenize) the source code.
+* `scan`: finding docstrings, and the rules within them.
+* `evaluate`: calling the rules.
+* `codegen`: producing the transformed source code.
+* `write`: writing the transformed code to disk.
+"""
+
+
+@dataclass(frozen=True)
+class Measurement:
+    """
+    Time taken to process a corpus, and the peak memory used.
+    """
+    seconds: float
+    files: int
+    size: int
+    peak_memory: Optional[int] = None
+    """Peak memory allocated while processing, in bytes"""
+
+    def to_json(self) -> dict[str, Any]:
+        return {
+            "seconds": self.seconds,
+            "files_per_second": self.files / self.seconds,
+            "mb_per_second": self.size / 1e6 / self.seconds,
+            "peak_memory": self.peak_memory,
+        }
+
+
+def measure(
+    run: Callable[[], object],
+    corpus: Corpus,
+    *,
+    repeat: int,
+) -> Measurement:
+    """
+    Measure the best time of `repeat` runs, then measure the peak memory
+    used by a separate run, since tracing memory slows everything down.
+    """
+    best = min(time_once(run) for _ in range(repeat))
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return Measurement(best, len(corpus.files), corpus.size, peak)
+
+
+def time_once(run: Callable[[], object]) -> float:
+    start = perf_counter()
+    run()
+    return perf_counter() - start
+
+
+def time_phases(
+    sources: list[str],
+    rules: dict[str, Rule],
+    engine: Engine,
+    output: Path,
+) -> dict[str, float]:
+    """
+    Transform the given sources, writing them into the output directory,
+    returning the total time spent in each phase.
+
+    Rules are evaluated after scanning each file, using a deferring
+    evaluator, so that their cost is measured separately.
+    """
+    from transdoc.__libcst_engine import DocTransformer
+    from transdoc.__tokenize_engine import tokenize_rewrite
+    import libcst as cst
+
+    timings = dict.fromkeys(PHASES, 0.0)
+    evaluator = RuleEvaluator(rules)
+    output.mkdir(parents=True, exist_ok=True)
+
+    for index, source in enumerate(sources):
+        deferring = RuleEvaluator(rules, defer=True)
+        start = perf_counter()
+        if engine == "libcst":
+            module = cst.parse_module(source)
+            parsed = perf_counter()
+            updated = module.visit(DocTransformer(deferring, module))
+            scanned = perf_counter()
+            code = updated.code
+            codegen = perf_counter() - scanned
+        else:
+            for _ in tokenize.generate_tokens(StringIO(source).readline):
+                pass
+            parsed = perf_counter()
+            # The tokenize engine tokenizes the code again while scanning,
+            # so exclude the time taken to tokenize it
+            code, _ = tokenize_rewrite(source, deferring)
+            scanned = perf_counter() - (parsed - start)
+            codegen = 0.0
+        timings["parse"] += parsed - start
+        timings["scan"] += scanned - parsed
+
+        start = perf_counter()
+        for invocation in deferring.deferred():
+            assert isinstance(invocation.result, Deferred)
+            invocation.result = evaluator.call_rule(invocation.result.rule)
+        timings["evaluate"] += perf_counter() - start
+
+        start = perf_counter()
+        code = deferring.substitute(code)
+        timings["codegen"] += codegen + perf_counter() - start
+
+        start = perf_counter()
+        output.joinpath(f"{index}.py").write_text(code, encoding="utf-8")
+        timings["write"] += perf_counter() - start
+
+    return timings
+
+
+def benchmark_engine(
+    corpus: Corpus,
+    rules: dict[str, Rule],
+    engine: Engine,
+    work_dir: Path,
+    *,
+    repeat: int,
+) -> dict[str, Any]:
+    """
+    Benchmark the given engine on the given corpus.
+    """
+    sources = [file.read_text() for file in corpus.files]
+
+    phases = [
+        time_phases(sources, rules, engine, work_dir.joinpath("phases"))
+        for _ in range(repeat)
+    ]
+    best_phases = {
+        phase: min(timings[phase] for timings in phases)
+        for phase in PHASES
+    }
+
+    def run_transform() -> None:
+        for source in sources:
+            transform(source, rules, engine=engine)
+
+    def run_main() -> None:
+        status = main(
+            corpus.input,
+            corpus.rule_file,
+            work_dir.joinpath("main"),
+            force=True,
+            engine=engine,
+        )
+        assert status == 0, "Transformation failed"
+
+    return {
+        "phases": best_phases,
+        "transform": measure(run_transform, corpus, repeat=repeat).to_json(),
+        "main": measure(run_main, corpus, repeat=repeat).to_json(),
+    }
+
+
+def run_suite(
+    params: CorpusParams,
+    *,
+    engines: tuple[Engine, ...] = ENGINES,
+    repeat: int = 3,
+) -> dict[str, Any]:
+    """
+    Generate a corpus using the given parameters, and benchmark each of the
+    given engines, returning the results.
+    """
+    with tempfile.TemporaryDirectory() as temp:
+        root = Path(temp)
+        corpus = generate_corpus(root.joinpath("corpus"), params)
+        rules = collect_rules(load_rule_file(corpus.rule_file))
+        results = {
+            engine: benchmark_engine(
+                corpus,
+                rules,
+                engine,
+                root.joinpath(engine),
+                repeat=repeat,
+            )
+            for engine in engines
+        }
+    return {
+        "transdoc": VERSION,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": params.to_json(),
+        "corpus": {
+            "files": len(corpus.files),
+            "size": corpus.size,
+            "rule_uses": corpus.rule_uses,
+        },
+        "engines": results,
+    }
+
+
+def print_results(
+    results: dict[str, Any],
+    baseline: Optional[dict[str, Any]] = None,
+) -> None:
+    """
+    Print a summary of the given results, comparing them to the baseline if
+    one is given.
+    """
+    corpus = results["corpus"]
+    print(
+        f"Corpus: {corpus['files']} files, {corpus['size'] / 1e6:.2f} MB, "
+        f"{corpus['rule_uses']} rule uses"
+    )
+
+    def compare(path: list[str], value: float) -> str:
+        if baseline is None:
+            return ""
+        previous: Any = baseline
+        for key in path:
+            if not isinstance(previous, dict) or key not in previous:
+                return ""
+            previous = previous[key]
+        return f" ({previous / value:5.2f}x)" if value else ""
+
+    for engine, engine_results in results["engines"].items():
+        print(f"\n{engine}")
+        for phase, seconds in engine_results["phases"].items():
+            change = compare(["engines", engine, "phases", phase], seconds)
+            print(f"  {phase:<9} {seconds * 1e3:10.2f} ms{change}")
+        for name in ["transform", "main"]:
+            result = engine_results[name]
+            change = compare(
+                ["engines", engine, name, "seconds"],
+                result["seconds"],
+            )
+            print(
+                f"  {name + '()':<11} {result['seconds'] * 1e3:8.2f} ms"
+                f"{change}, {result['files_per_second']:8.1f} files/s, "
+                f"{result['mb_per_second']:6.2f} MB/s, "
+                f"peak {result['peak_memory'] / 1e6:7.2f} MB"
+            )
+    if baseline is not None:
+        print("\nSpeedups relative to the baseline are shown in brackets")
+
+
+@click.command()
+@click.option('--files', type=int, default=CorpusParams.files)
+@click.option('--file-size', type=int, default=CorpusParams.file_size)
+@click.option('--density', type=float, default=CorpusParams.density)
+@click.option('--rules', type=int, default=CorpusParams.rules)
+@click.option(
+    '--rule-cost',
+    type=float,
+    default=CorpusParams.rule_cost,
+    help='Time spent by each rule call, in microseconds',
+)
+@click.option('--seed', type=int, default=CorpusParams.seed)
+@click.option(
+    '--engine',
+    'engines',
+    type=click.Choice(ENGINES),
+    multiple=True,
+    default=ENGINES,
+)
+@click.option('--repeat', type=click.IntRange(min=1), default=3)
+@click.option(
+    '--json',
+    'json_output',
+    type=click.Path(path_type=Path),
+    help='Save the results as JSON',
+)
+@click.option(
+    '--compare',
+    type=click.Path(exists=True, path_type=Path),
+    help='Compare the results against a previous JSON output',
+)
+def cli(
+    files: int,
+    file_size: int,
+    density: float,
+    rules: int,
+    rule_cost: float,
+    seed: int,
+    engines: tuple[Engine, ...],
+    repeat: int,
+    json_output: Optional[Path],
+    compare: Optional[Path],
+) -> None:
+    """
+    Benchmark Transdoc using a synthetic corpus.
+    """
+    params = CorpusParams(files, file_size, density, rules, rule_cost, seed)
+    results = run_suite(params, engines=engines, repeat=repeat)
+    baseline = None
+    if compare is not None:
+        baseline = json.loads(compare.read_text())
+    print_results(results, baseline)
+    if json_output is not None:
+        json_output.write_text(json.dumps(results, indent=2) + "\n")
+        print(f"\nSaved results to '{json_output}'", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    cli()
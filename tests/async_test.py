@@ -0,0 +1,218 @@
+"""
+# Transdoc / Tests / Async test
+
+Test cases for rules which are async.
+"""
+import asyncio
+import threading
+from pathlib import Path
+import pytest
+from transdoc import (
+    RuleCache,
+    main,
+    main_async,
+    pure,
+    transform,
+    transform_async,
+)
+from transdoc.errors import TransdocTransformationError
+from .processor_test import make_tree
+
+
+class SlowRule:
+    """Async rule which records how many calls were in progress at once"""
+
+    def __init__(self) -> None:
+        self.__name__ = "slow"
+        self.calls = 0
+        self.running = 0
+        self.max_running = 0
+
+    async def __call__(self, text: str = "") -> str:
+        self.calls += 1
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        await asyncio.sleep(0.01)
+        self.running -= 1
+        return f"<{text}>"
+
+
+async def afail(text: str) -> str:
+    raise ValueError(text)
+
+
+def sfail(text: str) -> str:
+    raise ValueError(text)
+
+
+SOURCE = '''
+def function():
+    """
+    {{slow[a]}}
+    {{slow[b]}}
+    {{slow[c]}}
+    """
+'''
+
+EXPECTED = '''
+def function():
+    """
+    <a>
+    <b>
+    <c>
+    """
+'''
+
+
+###############################################################################
+
+
+@pytest.mark.parametrize("engine", ["libcst", "tokenize"])
+def test_async_rules(engine):
+    rule = SlowRule()
+
+    assert transform(SOURCE, [rule], engine=engine) == EXPECTED
+    assert rule.max_running == 3
+
+
+def test_concurrency_limit():
+    rule = SlowRule()
+
+    assert transform(SOURCE, [rule], concurrency=1) == EXPECTED
+    assert rule.max_running == 1
+
+
+def test_multiline_results_indented():
+    async def lines() -> str:
+        return "a\nb"
+
+    source = '''
+def function():
+    """
+    {{lines}}
+    """
+'''
+    assert transform(source, [lines]) == source.replace(
+        "{{lines}}", "a\n    b")
+
+
+def test_transform_async():
+    rule = SlowRule()
+
+    assert asyncio.run(transform_async(SOURCE, [rule])) == EXPECTED
+
+
+def test_sync_rules_do_not_block_event_loop():
+    """Sync rules are evaluated outside of the event loop's thread"""
+    threads = []
+
+    def sync(text: str) -> str:
+        threads.append(threading.get_ident())
+        return text
+
+    async def run() -> tuple[str, int]:
+        result = await transform_async(
+            '"""{{sync[a]}} {{slow[b]}}"""',
+            [sync, SlowRule()],
+        )
+        return result, threading.get_ident()
+
+    result, loop_thread = asyncio.run(run())
+    assert result == '"""a <b>"""'
+    assert threads and loop_thread not in threads
+
+
+def test_transform_inside_event_loop():
+    async def run() -> str:
+        return transform(SOURCE, [SlowRule()])
+
+    with pytest.raises(RuntimeError, match="transform_async"):
+        asyncio.run(run())
+
+
+@pytest.mark.parametrize("engine", ["libcst", "tokenize"])
+def test_errors_in_source_order(engine):
+    """Errors from async rules are reported in the same order as sync rules"""
+    source = '"""{{afail[a]}} {{sfail[b]}} {{afail[c]}}"""'
+
+    with pytest.raises(TransdocTransformationError) as exc:
+        transform(source, [afail, sfail], engine=engine)
+    with pytest.raises(TransdocTransformationError) as sync_exc:
+        transform(
+            source.replace("afail", "sfail"),
+            [sfail],
+            engine=engine,
+        )
+
+    assert [str(e.error_info) for e in exc.value.args] == ["a", "b", "c"]
+    assert (
+        [e.position for e in exc.value.args]
+        == [e.position for e in sync_exc.value.args]
+    )
+
+
+def test_async_pure_rule_cached():
+    rule = pure(SlowRule())
+    cache = RuleCache()
+
+    transform('"""{{slow[a]}}"""', [rule], cache=cache)
+    transform('"""{{slow[a]}}"""', [rule], cache=cache)
+
+    assert rule.calls == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+###############################################################################
+
+
+ASYNC_RULES = '''
+import asyncio
+
+async def hi():
+    await asyncio.sleep(0)
+    return "hi"
+'''
+
+
+def test_main_with_async_rules(tmp_path: Path):
+    input = make_tree(tmp_path.joinpath("input"), {
+        "a.py": '"""{{hi}}"""',
+        "b/c.py": '"""{{hi}} there"""',
+    })
+    rule_file = tmp_path.joinpath("rules.py")
+    rule_file.write_text(ASYNC_RULES)
+    output = tmp_path.joinpath("output")
+
+    assert main(input, rule_file, output) == 0
+
+    assert output.joinpath("a.py").read_text() == '"""hi"""'
+    assert output.joinpath("b", "c.py").read_text() == '"""hi there"""'
+
+
+def test_main_async(tmp_path: Path):
+    input = make_tree(tmp_path.joinpath("input"), {
+        "a.py": '"""{{hi}}"""',
+        "b/c.py": '"""{{hi}} there"""',
+        "data.txt": "data",
+    })
+    rule_file = tmp_path.joinpath("rules.py")
+    rule_file.write_text(ASYNC_RULES)
+    output = tmp_path.joinpath("output")
+
+    assert asyncio.run(main_async(input, rule_file, output)) == 0
+
+    assert output.joinpath("a.py").read_text() == '"""hi"""'
+    assert output.joinpath("b", "c.py").read_text() == '"""hi there"""'
+    assert output.joinpath("data.txt").read_text() == "data"
+
+
+def test_main_async_errors(tmp_path: Path):
+    input = make_tree(tmp_path.joinpath("input"), {
+        "a.py": '"""{{missing}}"""',
+    })
+    rule_file = tmp_path.joinpath("rules.py")
+    rule_file.write_text(ASYNC_RULES)
+
+    assert asyncio.run(
+        main_async(input, rule_file, tmp_path.joinpath("output"))
+    ) == 1
@@ -0,0 +1,250 @@
+"""
+# Transdoc / Tests / Batch test
+
+Test cases for deduplicating rules across many files, and for batch rules.
+"""
+import re
+from pathlib import Path
+import pytest
+from click.testing import CliRunner
+from transdoc import RuleCache, Stats, batch, main, pure, transform
+from transdoc.__cli import cli
+from transdoc.__processor import (
+    FileMapping,
+    ProcessOptions,
+    process_files_deduplicated,
+)
+from .processor_test import make_tree
+
+
+class CountingRule:
+    """Rule which records the arguments it was called with"""
+
+    def __init__(self) -> None:
+        self.calls: list[str] = []
+        self.__name__ = "rule"
+
+    def __call__(self, text: str = "") -> str:
+        self.calls.append(text)
+        return f"<{text}>"
+
+
+class CountingBatch:
+    """Batch rule which records the calls in each batch"""
+
+    def __init__(self) -> None:
+        self.batches: list[list] = []
+        self.__name__ = "many"
+
+    def __call__(self, calls):
+        self.batches.append(list(calls))
+        return [
+            ValueError(args[0]) if args[0] == "bad" else f"[{args[0]}]"
+            for args, _ in calls
+        ]
+
+
+def make_mappings(input: Path, output: Path) -> list[FileMapping]:
+    return [
+        FileMapping(file, output.joinpath(file.relative_to(input)), True)
+        for file in sorted(input.rglob("*.py"))
+    ]
+
+
+def process(tmp_path: Path, files: dict[str, str], rules, **kwargs):
+    input = make_tree(tmp_path.joinpath("input"), files)
+    output = tmp_path.joinpath("output")
+    results = list(process_files_deduplicated(
+        make_mappings(input, output),
+        rules,
+        ProcessOptions(deduplicate=True),
+        **kwargs,
+    ))
+    return output, results
+
+
+###############################################################################
+
+
+@pytest.mark.parametrize("jobs", [1, 4])
+def test_deduplicated_across_files(tmp_path: Path, jobs: int):
+    rule = CountingRule()
+
+    output, results = process(tmp_path, {
+        "a.py": '"""{{rule[x]}} {{rule[y]}}"""',
+        "b.py": '"""{{rule[x]}}"""',
+        "c/d.py": '"""{{rule[y]}} {{rule[x]}} {{rule}}"""',
+    }, {"rule": rule}, jobs=jobs)
+
+    assert sorted(rule.calls) == ["", "x", "y"]
+    assert [r.error_report for r in results] == [None, None, None]
+    assert output.joinpath("a.py").read_text() == '"""<x> <y>"""'
+    assert output.joinpath("b.py").read_text() == '"""<x>"""'
+    assert output.joinpath("c", "d.py").read_text() == '"""<y> <x> <>"""'
+
+
+def test_batch_rule_called_once(tmp_path: Path):
+    many = CountingBatch()
+
+    output, _ = process(tmp_path, {
+        "a.py": '"""{{many[a]}} {{many("b")}}"""',
+        "b.py": '"""{{many[a]}} {{many[c]}}"""',
+    }, {"many": batch(many)})
+
+    assert many.batches == [[(("a",), {}), (("b",), {}), (("c",), {})]]
+    assert output.joinpath("a.py").read_text() == '"""[a] [b]"""'
+    assert output.joinpath("b.py").read_text() == '"""[a] [c]"""'
+
+
+def test_batch_rule_non_literal_arguments(tmp_path: Path):
+    """Uses with non-literal arguments are evaluated individually"""
+    many = CountingBatch()
+
+    output, _ = process(tmp_path, {
+        "a.py": '"""{{many[a]}} {{many("b" + "c")}}"""',
+    }, {"many": batch(many)})
+
+    assert many.batches == [[(("a",), {})], [(("bc",), {})]]
+    assert output.joinpath("a.py").read_text() == '"""[a] [bc]"""'
+
+
+def test_errors_reported_at_each_use(tmp_path: Path):
+    _, results = process(tmp_path, {
+        "a.py": '"""{{many[bad]}} {{many[ok]}}"""',
+        "b.py": '"""{{missing}}\n{{many[bad]}}"""',
+        "c.py": '"""{{many[bad]}}"""',
+    }, {"many": batch(CountingBatch())})
+
+    assert results[0].error_report is not None
+    assert len(re.findall(
+        r"[0-9]+:[0-9]+ +ValueError: bad",
+        results[0].error_report,
+    )) == 1
+    assert results[1].error_report is not None
+    assert "unknown rule 'missing'" in results[1].error_report
+    assert "ValueError: bad" in results[1].error_report
+    assert results[2].error_report is not None
+
+
+def test_batch_rule_failure(tmp_path: Path):
+    @batch
+    def fails(calls):
+        raise RuntimeError("oops")
+
+    _, results = process(tmp_path, {
+        "a.py": '"""{{fails[a]}} {{fails[b]}}"""',
+    }, {"fails": fails})
+
+    assert results[0].error_report is not None
+    assert len(re.findall(
+        r"[0-9]+:[0-9]+ +RuntimeError: oops",
+        results[0].error_report,
+    )) == 2
+
+
+def test_async_rules(tmp_path: Path):
+    calls = []
+
+    async def slow(text: str) -> str:
+        calls.append(text)
+        return text.upper()
+
+    output, _ = process(tmp_path, {
+        "a.py": '"""{{slow[a]}}"""',
+        "b.py": '"""{{slow[a]}} {{slow[b]}}"""',
+    }, {"slow": slow}, jobs=2)
+
+    assert sorted(calls) == ["a", "b"]
+    assert output.joinpath("b.py").read_text() == '"""A B"""'
+
+
+def test_batch_rule_used_individually():
+    many = CountingBatch()
+
+    assert transform('"""{{many[a]}}"""', [batch(many)]) == '"""[a]"""'
+    assert many.batches == [[(("a",), {})]]
+
+
+def test_cached_batch_rule(tmp_path: Path):
+    many = CountingBatch()
+    rules = {"many": pure(batch(many))}
+    cache = RuleCache()
+    input = make_tree(tmp_path.joinpath("input"), {
+        "a.py": '"""{{many[a]}} {{many[b]}}"""',
+    })
+    assert transform('"""{{many[a]}}"""', rules, cache=cache) == '"""[a]"""'
+
+    for _ in range(2):
+        results = list(process_files_deduplicated(
+            make_mappings(input, tmp_path.joinpath("output")),
+            rules,
+            ProcessOptions(deduplicate=True, cache=cache),
+        ))
+        assert [r.error_report for r in results] == [None]
+
+    # Only uses which weren't already cached are passed to the batch rule
+    assert many.batches == [[(("a",), {})], [(("b",), {})]]
+    assert cache.misses == 2
+    assert cache.hits == 3
+    assert tmp_path.joinpath("output", "a.py").read_text() \
+        == '"""[a] [b]"""'
+
+
+def test_batch_rule_stats(tmp_path: Path):
+    stats = Stats()
+
+    output, _ = process(tmp_path, {
+        "a.py": '"""{{many[a]}} {{many[b]}}"""',
+    }, stats.wrap({"many": batch(CountingBatch())}))
+
+    assert output.joinpath("a.py").read_text() == '"""[a] [b]"""'
+    assert [(rule.name, rule.calls) for rule in stats.rules()] \
+        == [("many", 1)]
+
+
+###############################################################################
+
+
+BATCH_RULES = '''
+import transdoc
+
+@transdoc.batch
+def upper(calls):
+    return [args[0].upper() for args, kwargs in calls]
+'''
+
+
+def test_main_deduplicate(tmp_path: Path):
+    input = make_tree(tmp_path.joinpath("input"), {
+        "a.py": '"""{{upper[a]}}"""',
+        "b/c.py": '"""{{upper[a]}} {{upper[b]}}"""',
+        "data.txt": "{{upper[a]}}",
+    })
+    rule_file = tmp_path.joinpath("rules.py")
+    rule_file.write_text(BATCH_RULES)
+    output = tmp_path.joinpath("output")
+
+    assert main(input, rule_file, output, deduplicate=True, jobs=2) == 0
+
+    assert output.joinpath("a.py").read_text() == '"""A"""'
+    assert output.joinpath("b", "c.py").read_text() == '"""A B"""'
+    assert output.joinpath("data.txt").read_text() == "{{upper[a]}}"
+
+
+def test_cli_deduplicate(tmp_path: Path):
+    input = make_tree(tmp_path.joinpath("input"), {
+        "a.py": '"""{{upper[a]}}"""',
+    })
+    rule_file = tmp_path.joinpath("rules.py")
+    rule_file.write_text(BATCH_RULES)
+    output = tmp_path.joinpath("output")
+
+    result = CliRunner().invoke(cli, [
+        str(input),
+        "-r", str(rule_file),
+        "-o", str(output),
+        "--deduplicate",
+    ])
+
+    assert result.exit_code == 0, result.output
+    assert output.joinpath("a.py").read_text() == '"""A"""'
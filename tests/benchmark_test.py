@@ -0,0 +1,18 @@
+"""
+# Transdoc / Tests / Benchmark test
+
+Check that the benchmark suite runs, so that it doesn't break unnoticed.
+"""
+from benchmarks.corpus import CorpusParams
+from benchmarks.suite import PHASES, run_suite
+
+
+def test_benchmark_suite():
+    results = run_suite(CorpusParams(files=2, file_size=500), repeat=1)
+
+    assert results["corpus"]["files"] == 2
+    for engine in ["libcst", "tokenize"]:
+        engine_results = results["engines"][engine]
+        assert set(engine_results["phases"]) == set(PHASES)
+        assert engine_results["main"]["files_per_second"] > 0
+        assert engine_results["transform"]["peak_memory"] > 0
@@ -0,0 +1,179 @@
+"""
+# Transdoc / Tests / Build backend test
+
+Test cases for the build backend, which wraps a fake build backend defined
+in this file.
+"""
+import base64
+import hashlib
+import os
+import tarfile
+import zipfile
+from pathlib import Path
+import pytest
+from transdoc import build_backend
+from transdoc.errors import TransdocTransformationError
+
+
+SOURCE = '''
+def function():
+    """{{hi}}"""
+'''
+
+TRANSFORMED = SOURCE.replace("{{hi}}", "hi")
+
+DATA = bytes(range(256)) * 4096
+"""Large binary data file, which is staged without being transformed"""
+
+WHEEL = "example-1.0-py3-none-any.whl"
+SDIST = "example-1.0.tar.gz"
+
+staged_inodes: list[int] = []
+"""Inodes of the data file seen by the fake backend"""
+
+
+def record_hash(data: bytes) -> str:
+    digest = hashlib.sha256(data).digest()
+    return "sha256=" + base64.urlsafe_b64encode(digest).rstrip(b"=").decode()
+
+
+def package_files() -> dict[str, bytes]:
+    """Files of the package, read from the working directory"""
+    staged_inodes.append(os.stat("example/data.bin").st_ino)
+    return {
+        path.as_posix(): path.read_bytes()
+        for path in sorted(Path("example").rglob("*"))
+        if path.is_file()
+    }
+
+
+def build_wheel(
+    wheel_directory,
+    config_settings=None,
+    metadata_directory=None,
+):
+    files = package_files()
+    files["example-1.0.dist-info/METADATA"] = b"Name: example\n"
+    record = "".join(
+        f"{name},{record_hash(data)},{len(data)}\n"
+        for name, data in files.items()
+    ) + "example-1.0.dist-info/RECORD,,\n"
+    with zipfile.ZipFile(Path(wheel_directory, WHEEL), "w") as wheel:
+        for name, data in files.items():
+            wheel.writestr(name, data)
+        wheel.writestr("example-1.0.dist-info/RECORD", record)
+    return WHEEL
+
+
+def build_sdist(sdist_directory, config_settings=None):
+    staged_inodes.append(os.stat("example/data.bin").st_ino)
+    with tarfile.open(Path(sdist_directory, SDIST), "w:gz") as sdist:
+        sdist.add("example", "example-1.0/example")
+        sdist.add("pyproject.toml", "example-1.0/pyproject.toml")
+    return SDIST
+
+
+def get_requires_for_build_wheel(config_settings=None):
+    return ["fake-requirement"]
+
+
+@pytest.fixture
+def project(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    tmp_path.joinpath("pyproject.toml").write_text(
+        '[tool.transdoc]\n'
+        'backend = "tests.build_backend_test"\n'
+        'rule-file = "rules.py"\n'
+        'engine = "tokenize"\n'
+    )
+    tmp_path.joinpath("rules.py").write_text("def hi():\n    return 'hi'\n")
+    tmp_path.joinpath(".gitignore").write_text("*.log\n")
+    package = tmp_path.joinpath("example")
+    package.mkdir()
+    package.joinpath("__init__.py").write_text(SOURCE)
+    package.joinpath("data.txt").write_text("{{hi}}")
+    package.joinpath("data.bin").write_bytes(DATA)
+    package.joinpath("debug.log").write_text("ignored")
+    tmp_path.joinpath("dist").mkdir()
+    monkeypatch.chdir(tmp_path)
+    staged_inodes.clear()
+    return tmp_path
+
+
+def test_build_wheel(project: Path):
+    name = build_backend.build_wheel("dist")
+
+    assert name == WHEEL
+    with zipfile.ZipFile(project.joinpath("dist", WHEEL)) as wheel:
+        assert wheel.read("example/__init__.py").decode() == TRANSFORMED
+        assert wheel.read("example/data.txt") == b"{{hi}}"
+        assert wheel.read("example/data.bin") == DATA
+        assert "example/debug.log" not in wheel.namelist()
+        record = wheel.read("example-1.0.dist-info/RECORD").decode()
+    assert (
+        f"example/__init__.py,{record_hash(TRANSFORMED.encode())},"
+        f"{len(TRANSFORMED)}"
+    ) in record.splitlines()
+    # The original source is untouched, and nothing is left behind
+    assert project.joinpath("example", "__init__.py").read_text() == SOURCE
+    assert os.getcwd() == str(project)
+    assert sorted(os.listdir(project)) == [
+        ".gitignore",
+        "dist",
+        "example",
+        "pyproject.toml",
+        "rules.py",
+    ]
+
+
+def test_build_sdist(project: Path):
+    name = build_backend.build_sdist("dist")
+
+    with tarfile.open(project.joinpath("dist", name)) as sdist:
+        contents = sdist.extractfile("example-1.0/example/__init__.py")
+        assert contents is not None
+        assert contents.read().decode() == TRANSFORMED
+        assert sdist.getmember("example-1.0/example").isdir()
+
+
+def test_only_python_files_are_read(
+    project: Path,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    transformed: list[str] = []
+    transform = build_backend.SourceTransformer.transform
+
+    def record(self, name: str, data: bytes) -> bytes:
+        transformed.append(name)
+        return transform(self, name, data)
+
+    monkeypatch.setattr(build_backend.SourceTransformer, "transform", record)
+    build_backend.build_wheel("dist")
+    build_backend.build_sdist("dist")
+
+    assert sorted(transformed) == [
+        "example/__init__.py",
+        "example/__init__.py",
+        "rules.py",
+        "rules.py",
+    ]
+    # Other files are hard linked into the staging directory
+    data_inode = project.joinpath("example", "data.bin").stat().st_ino
+    assert staged_inodes == [data_inode, data_inode]
+
+
+def test_errors(project: Path):
+    project.joinpath("rules.py").write_text("")
+
+    with pytest.raises(TransdocTransformationError):
+        build_backend.build_wheel("dist")
+
+    # The wrapped backend isn't used if files can't be transformed
+    assert not project.joinpath("dist", WHEEL).exists()
+    assert staged_inodes == []
+
+
+def test_optional_hooks(project: Path):
+    assert build_backend.get_requires_for_build_wheel() == [
+        "fake-requirement",
+    ]
+    assert not hasattr(build_backend, "build_editable")
@@ -0,0 +1,138 @@
+"""
+# Transdoc / Tests / Cache test
+
+Test cases for caching the results of rules.
+"""
+from pathlib import Path
+import pytest
+from transdoc import RuleCache, main, pure, transform
+from .processor_test import make_tree
+
+
+class CountingRule:
+    """Rule which counts the number of times it was called"""
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.__name__ = "rule"
+
+    def __call__(self, text: str = "") -> str:
+        self.calls += 1
+        return f"<{text}>"
+
+
+def test_pure_rule_cached_across_syntaxes():
+    rule = pure(CountingRule())
+    cache = RuleCache()
+
+    result = transform(
+        '"""{{rule[x]}} {{rule("x")}} {{rule(text="x")}} {{rule}}"""',
+        [rule],
+        cache=cache,
+    )
+
+    assert result == '"""<x> <x> <x> <>"""'
+    # `rule(text="x")` uses a keyword argument, so has a different key
+    assert rule.calls == 3
+    assert (cache.hits, cache.misses) == (1, 3)
+
+
+def test_impure_rule_not_cached():
+    rule = CountingRule()
+    cache = RuleCache()
+
+    transform('"""{{rule}} {{rule}}"""', [rule], cache=cache)
+
+    assert rule.calls == 2
+    assert (cache.hits, cache.misses) == (0, 0)
+
+
+def test_cache_all():
+    rule = CountingRule()
+    cache = RuleCache(cache_all=True)
+
+    transform('"""{{rule}} {{rule}}"""', [rule], cache=cache)
+
+    assert rule.calls == 1
+
+
+def test_cache_shared_between_transforms():
+    rule = pure(CountingRule())
+    cache = RuleCache()
+
+    transform('"""{{rule}}"""', [rule], cache=cache)
+    transform('"""{{rule}}"""', [rule], cache=cache)
+
+    assert rule.calls == 1
+
+
+def test_least_recently_used_evicted():
+    rule = CountingRule()
+    cache = RuleCache(2)
+
+    cache.call("rule", rule, ("a",), {})
+    cache.call("rule", rule, ("b",), {})
+    cache.call("rule", rule, ("a",), {})
+    cache.call("rule", rule, ("c",), {})
+
+    assert len(cache) == 2
+    cache.call("rule", rule, ("a",), {})
+    assert rule.calls == 3
+    cache.call("rule", rule, ("b",), {})
+    assert rule.calls == 4
+
+
+def test_argument_types_distinguished():
+    cache = RuleCache()
+
+    assert cache.call("rule", repr, (1,), {}) == "1"
+    assert cache.call("rule", repr, (True,), {}) == "True"
+
+
+def test_unhashable_arguments_not_cached():
+    cache = RuleCache()
+
+    assert cache.call("rule", repr, ([1],), {}) == "[1]"
+    assert cache.call("rule", repr, ([1],), {}) == "[1]"
+
+    assert len(cache) == 0
+    assert cache.misses == 2
+
+
+def test_errors_not_cached():
+    def fail():
+        raise ValueError("Oh no")
+
+    cache = RuleCache(cache_all=True)
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            cache.call("fail", fail, (), {})
+    assert cache.misses == 2
+
+
+###############################################################################
+
+
+PURE_RULES = '''
+import transdoc
+
+@transdoc.pure
+def notice():
+    return "notice"
+'''
+
+
+@pytest.mark.parametrize("jobs", [1, 4])
+def test_cache_lasts_for_whole_run(tmp_path: Path, jobs: int):
+    input = make_tree(tmp_path.joinpath("input"), {
+        f"mod{i}.py": '"""{{notice}}"""\n' for i in range(8)
+    })
+    rule_file = tmp_path.joinpath("rules.py")
+    rule_file.write_text(PURE_RULES)
+    cache = RuleCache()
+
+    assert main(input, rule_file, dryrun=True, jobs=jobs, cache=cache) == 0
+
+    assert cache.hits + cache.misses == 8
+    # Each worker process has its own cache
+    assert cache.misses <= jobs
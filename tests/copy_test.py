@@ -0,0 +1,131 @@
+"""
+# Transdoc / Tests / Copy test
+
+Test cases for passing files which aren't transformed through to the output.
+"""
+import os
+from pathlib import Path
+import pytest
+from transdoc import main
+import transdoc.__copy as copy
+from transdoc.__copy import copy_file
+from .processor_test import WITH_RULE, make_rule_file, make_tree
+
+
+def make_data(tmp_path: Path, size: int = 1 << 20) -> Path:
+    data = tmp_path.joinpath("data.bin")
+    data.write_bytes(os.urandom(size))
+    return data
+
+
+def test_copy(tmp_path: Path):
+    data = make_data(tmp_path)
+    output = tmp_path.joinpath("output", "data.bin")
+
+    assert copy_file(data, output)
+
+    assert output.read_bytes() == data.read_bytes()
+    assert output.stat().st_mtime_ns == data.stat().st_mtime_ns
+    assert not os.path.samefile(data, output)
+
+
+def test_copy_skips_matching(tmp_path: Path):
+    data = make_data(tmp_path)
+    output = tmp_path.joinpath("output.bin")
+    copy_file(data, output)
+
+    assert not copy_file(data, output)
+
+    data.write_bytes(b"changed")
+    assert copy_file(data, output)
+    assert output.read_bytes() == b"changed"
+
+
+def test_copy_fallback(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    """Data is copied correctly even if the kernel can't copy it"""
+    def unsupported(*args) -> int:
+        raise OSError("Not supported")
+
+    monkeypatch.setattr(copy, "reflink", lambda copy_in, copy_out: False)
+    monkeypatch.setattr(copy, "KERNEL_COPIES", [unsupported])
+    data = make_data(tmp_path)
+    output = tmp_path.joinpath("output.bin")
+
+    copy_file(data, output)
+
+    assert output.read_bytes() == data.read_bytes()
+
+
+@pytest.mark.parametrize("kernel_copy", copy.KERNEL_COPIES)
+def test_kernel_copies(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    kernel_copy,
+):
+    monkeypatch.setattr(copy, "reflink", lambda copy_in, copy_out: False)
+    monkeypatch.setattr(copy, "KERNEL_COPIES", [kernel_copy])
+    monkeypatch.setattr(copy, "COPY_CHUNK_SIZE", 1000)
+    data = make_data(tmp_path, 12345)
+    output = tmp_path.joinpath("output.bin")
+
+    copy_file(data, output)
+
+    assert output.read_bytes() == data.read_bytes()
+
+
+def test_hardlink(tmp_path: Path):
+    data = make_data(tmp_path)
+    output = tmp_path.joinpath("output.bin")
+
+    assert copy_file(data, output, "hardlink")
+
+    assert os.path.samefile(data, output)
+    assert not copy_file(data, output, "hardlink")
+
+
+def test_symlink(tmp_path: Path):
+    data = make_data(tmp_path)
+    output = tmp_path.joinpath("output.bin")
+
+    assert copy_file(data, output, "symlink")
+
+    assert output.is_symlink()
+    assert output.read_bytes() == data.read_bytes()
+    assert not copy_file(data, output, "symlink")
+
+
+@pytest.mark.parametrize("previous", ["hardlink", "symlink"])
+def test_copy_replaces_links(tmp_path: Path, previous):
+    """Copying over a link doesn't write to the linked input"""
+    data = make_data(tmp_path)
+    contents = data.read_bytes()
+    output = tmp_path.joinpath("output.bin")
+    copy_file(data, output, previous)
+
+    assert copy_file(data, output, "copy")
+
+    assert not output.is_symlink()
+    assert not os.path.samefile(data, output)
+    assert data.read_bytes() == contents
+
+
+###############################################################################
+
+
+def test_force_keeps_unchanged_copies(tmp_path: Path):
+    input = make_tree(tmp_path.joinpath("input"), {
+        "a.py": WITH_RULE,
+        "data/model.bin": "model",
+    })
+    rule_file = make_rule_file(tmp_path)
+    output = tmp_path.joinpath("output")
+    assert main(input, rule_file, output) == 0
+    inode = output.joinpath("data", "model.bin").stat().st_ino
+    make_tree(output, {"stale.txt": "", "stale/file.txt": ""})
+
+    assert main(input, rule_file, output, force=True) == 0
+
+    assert output.joinpath("data", "model.bin").stat().st_ino == inode
+    assert not output.joinpath("stale.txt").exists()
+    assert not output.joinpath("stale").exists()
+    assert output.joinpath("a.py").exists()
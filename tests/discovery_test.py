@@ -0,0 +1,211 @@
+"""
+# Transdoc / Tests / Discovery test
+
+Test cases for finding the files to process within a directory.
+"""
+import re
+from pathlib import Path
+import pytest
+from transdoc import main
+from transdoc.__discovery import FileFilter, translate_glob
+from transdoc.__processor import FileMapping, find_files
+from .processor_test import WITH_RULE, make_rule_file, make_tree
+
+
+def found(root: Path, **kwargs) -> set[str]:
+    """
+    Returns the paths of the files found within the given root, relative to
+    the root.
+    """
+    return {
+        relative
+        for _, relative in FileFilter(str(root), **kwargs).walk()
+    }
+
+
+def glob_matches(pattern: str, path: str, is_dir: bool = False) -> bool:
+    regex, dir_only = translate_glob(pattern)
+    return (
+        (is_dir or not dir_only)
+        and re.fullmatch(regex, path) is not None
+    )
+
+
+###############################################################################
+
+
+@pytest.mark.parametrize(("pattern", "path", "expected"), [
+    ("*.py", "a.py", True),
+    ("*.py", "a/b/c.py", True),
+    ("*.py", "a.pyc", False),
+    ("a/*.py", "a/b.py", True),
+    ("a/*.py", "a/b/c.py", False),
+    ("a/*.py", "x/a/b.py", False),
+    ("/a.py", "a.py", True),
+    ("/a.py", "b/a.py", False),
+    ("**/gen_*.py", "gen_x.py", True),
+    ("**/gen_*.py", "a/b/gen_x.py", True),
+    ("a/**/b.py", "a/b.py", True),
+    ("a/**/b.py", "a/x/y/b.py", True),
+    ("a/**", "a/x/y.py", True),
+    ("a/**", "a", False),
+    ("file?.py", "file1.py", True),
+    ("file?.py", "file10.py", False),
+    ("file[0-9].py", "file1.py", True),
+    ("file[!0-9].py", "file1.py", False),
+    ("file[!0-9].py", "filex.py", True),
+    ("\\*.py", "*.py", True),
+    ("\\*.py", "a.py", False),
+])
+def test_translate_glob(pattern: str, path: str, expected: bool):
+    assert glob_matches(pattern, path) == expected
+
+
+def test_dir_only_glob():
+    assert glob_matches("build/", "build", is_dir=True)
+    assert glob_matches("build/", "src/build", is_dir=True)
+    assert not glob_matches("build/", "build", is_dir=False)
+
+
+def test_default_excludes(tmp_path: Path):
+    make_tree(tmp_path, {
+        "a.py": "",
+        "pkg/b.py": "",
+        ".git/config": "",
+        "pkg/__pycache__/b.cpython-311.pyc": "",
+        "node_modules/x/index.js": "",
+        ".venv/lib/site.py": "",
+        ".gitignore": "",
+    })
+    assert found(tmp_path) == {"a.py", "pkg/b.py", ".gitignore"}
+
+
+def test_no_excludes(tmp_path: Path):
+    make_tree(tmp_path, {"a.py": "", ".git/config": ""})
+    assert found(tmp_path, exclude=()) == {"a.py", ".git/config"}
+
+
+def test_include_and_exclude(tmp_path: Path):
+    make_tree(tmp_path, {
+        "a.py": "",
+        "README.md": "",
+        "pkg/b.py": "",
+        "pkg/gen_c.py": "",
+        "tests/test_a.py": "",
+        "docs/conf.py": "",
+    })
+    assert found(
+        tmp_path,
+        include=["*.py"],
+        exclude=["tests/", "gen_*.py", "/docs"],
+    ) == {"a.py", "pkg/b.py"}
+
+
+def test_gitignore(tmp_path: Path):
+    make_tree(tmp_path, {
+        ".gitignore": "*.log\nbuild/\n/generated.py\n!keep.log\n",
+        "a.py": "",
+        "a.log": "",
+        "keep.log": "",
+        "generated.py": "",
+        "build/out.py": "",
+        "pkg/generated.py": "",
+        "pkg/.gitignore": "local.py\n",
+        "pkg/local.py": "",
+        "pkg/b.log": "",
+        "local.py": "",
+    })
+    assert found(tmp_path, gitignore=True) == {
+        ".gitignore",
+        "a.py",
+        "keep.log",
+        "pkg/generated.py",
+        "pkg/.gitignore",
+        "local.py",
+    }
+    # Only used if requested
+    assert "a.log" in found(tmp_path)
+
+
+def test_gitignore_of_parent_directory(tmp_path: Path):
+    make_tree(tmp_path, {
+        ".git/HEAD": "",
+        ".gitignore": "src/ignored.py\n*.tmp\n",
+        "src/ignored.py": "",
+        "src/kept.py": "",
+        "src/x.tmp": "",
+    })
+    assert found(tmp_path / "src", gitignore=True) == {"kept.py"}
+
+
+def test_skip_directory(tmp_path: Path):
+    make_tree(tmp_path, {"a.py": "", "build/a.py": ""})
+    assert found(tmp_path, skip=str(tmp_path / "build")) == {"a.py"}
+
+
+def test_matches(tmp_path: Path):
+    make_tree(tmp_path, {
+        ".gitignore": "ignored/\n",
+        "a.py": "",
+        "ignored/b.py": "",
+        ".git/config": "",
+    })
+    file_filter = FileFilter(str(tmp_path), gitignore=True)
+    assert file_filter.matches(str(tmp_path / "a.py"))
+    assert not file_filter.matches(str(tmp_path / "ignored/b.py"))
+    assert not file_filter.matches(str(tmp_path / ".git/config"))
+    assert not file_filter.matches(str(tmp_path.parent / "other.py"))
+
+
+def test_find_files_keeps_relative_paths(tmp_path: Path, monkeypatch):
+    make_tree(tmp_path, {"src/pkg/a.py": "", "src/b.txt": ""})
+    monkeypatch.chdir(tmp_path)
+    mappings = {
+        (mapping.input, mapping.output, mapping.transform)
+        for mapping in find_files(Path("src"), Path("out"))
+    }
+    assert mappings == {
+        (Path("src/pkg/a.py"), Path("out/pkg/a.py"), True),
+        (Path("src/b.txt"), Path("out/b.txt"), False),
+    }
+
+
+def test_file_mapping_uses_slots():
+    mapping = FileMapping(Path("a.py"), None, True)
+    assert not hasattr(mapping, "__dict__")
+
+
+def test_main_skips_excluded_files(tmp_path: Path):
+    input = make_tree(tmp_path / "input", {
+        "a.py": WITH_RULE,
+        "b.py": WITH_RULE,
+        ".git/hooks/c.py": WITH_RULE,
+        ".gitignore": "b.py\n",
+        "data/d.py": WITH_RULE,
+    })
+    output = tmp_path / "output"
+    assert main(
+        input,
+        make_rule_file(tmp_path),
+        output,
+        exclude=[".git/", "data/"],
+        gitignore=True,
+    ) == 0
+    assert {
+        path.relative_to(output).as_posix()
+        for path in output.rglob("*")
+        if path.is_file()
+    } == {"a.py", ".gitignore"}
+
+
+@pytest.mark.parametrize("jobs", [1, 4])
+def test_main_output_within_input(tmp_path: Path, jobs: int):
+    files = {f"pkg/file_{i}.py": WITH_RULE for i in range(20)}
+    input = make_tree(tmp_path / "input", files)
+    output = input / "build"
+    assert main(input, make_rule_file(tmp_path), output, jobs=jobs) == 0
+    assert {
+        path.relative_to(output).as_posix()
+        for path in output.rglob("*")
+        if path.is_file()
+    } == set(files)
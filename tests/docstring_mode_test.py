@@ -0,0 +1,85 @@
+"""
+# Transdoc / Tests / Docstring mode test
+
+Test cases ensuring that only real docstrings are processed by default, and
+that all engines agree on which strings are docstrings.
+"""
+from pathlib import Path
+import pytest
+from transdoc import main, transform
+from transdoc.__transformer import ENGINES, Engine
+
+
+def hi():
+    return "hi"
+
+
+PROCESSED = [
+    '"""{{hi}}"""\n',
+    '#!/usr/bin/env python\n# Comment\n\n"""{{hi}}"""\n',
+    'class A:\n    """{{hi}}"""\n',
+    'def f():\n    """{{hi}}"""\n',
+    'async def f():\n    """{{hi}}"""\n',
+    'def f(): """{{hi}}"""\n',
+    'class A: """{{hi}}"""\n',
+    '@decorator\ndef f(\n    x: int = 1,\n) -> None:\n    """{{hi}}"""\n',
+    'x = 1\n"""{{hi}}"""\n',
+    'class A:\n    x: int = 1\n    """{{hi}}"""\n',
+    'class A:\n    x: int\n    """{{hi}}"""\n',
+    'x = 1; """{{hi}}"""\n',
+    'x = {\n    "a": 1,\n}\n"""{{hi}}"""\n',
+    'match = 1\n"""{{hi}}"""\n',
+    'if x:\n    y = 1\n    """{{hi}}"""\n',
+]
+
+SKIPPED = [
+    'QUERY = """SELECT {{hi}}"""\n',
+    'def f():\n    return """{{hi}}"""\n',
+    'def f():\n    x = 1\n    print(x)\n    """{{hi}}"""\n',
+    'if x:\n    pass\n"""{{hi}}"""\n',
+    'if x: pass\n"""{{hi}}"""\n',
+    'def f(): pass\n"""{{hi}}"""\n',
+    'def f():\n    if x:\n        pass\n    """{{hi}}"""\n',
+    'print(1)\n"""{{hi}}"""\n',
+    'f("""{{hi}}""")\n',
+    '("""{{hi}}""")\n',
+    'x = 1\n"""{{hi}}""" + y\n',
+    'if x:\n    """{{hi}}"""\n',
+    'for x in y:\n    """{{hi}}"""\n',
+    'lambda: 1\n"""{{hi}}"""\n',
+    'match x:\n    case 1:\n        """{{hi}}"""\n',
+]
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize("source", PROCESSED)
+def test_docstrings_processed(source: str, engine: Engine):
+    assert transform(source, [hi], engine=engine) \
+        == source.replace("{{hi}}", "hi")
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize("source", SKIPPED)
+def test_other_strings_skipped(source: str, engine: Engine):
+    assert transform(source, [hi], engine=engine) == source
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize("source", PROCESSED + SKIPPED)
+def test_all_mode_processes_every_string(source: str, engine: Engine):
+    assert transform(source, [hi], engine=engine, docstrings="all") \
+        == source.replace("{{hi}}", "hi")
+
+
+def test_main_docstring_mode(tmp_path: Path):
+    rules = tmp_path / "rules.py"
+    rules.write_text("def hi():\n    return 'hi'\n")
+    source = tmp_path / "source.py"
+    source.write_text('"""{{hi}}"""\nQUERY = """{{hi}}"""\n')
+
+    assert main(source, rules, tmp_path / "precise.py") == 0
+    assert (tmp_path / "precise.py").read_text() \
+        == '"""hi"""\nQUERY = """{{hi}}"""\n'
+    assert main(source, rules, tmp_path / "all.py", docstrings="all") == 0
+    assert (tmp_path / "all.py").read_text() \
+        == '"""hi"""\nQUERY = """hi"""\n'
@@ -0,0 +1,91 @@
+"""
+# Transdoc / Tests / Engine test
+
+Test cases ensuring that all transformation engines produce identical results.
+"""
+import subprocess
+import sys
+from pathlib import Path
+import pytest
+from transdoc import transform
+from transdoc.__transformer import DOCSTRING_MODES, DocstringMode
+from transdoc.errors import TransdocTransformationError
+
+
+def multiline():
+    return "hi\nhi\nhi"
+
+
+def error():
+    raise ValueError("Oh no")
+
+
+RULES = [multiline, error]
+
+SOURCES = [
+    'def f():\n    """{{multiline}}"""\n',
+    'def f():\n\t"""\n\t{{multiline}}\n\t"""\n',
+    "class A:\n    '''{{multiline}}'''\n    x = 1\n    '''{{multiline}}'''\n",
+    'x = """{{multiline}}"""\n',
+    'def f(): """{{multiline}}"""\n',
+    'x = (\n    "not a docstring {{multiline}}"\n    """{{multiline}}"""\n)\n',
+    'x = f"""{{multiline}}"""\ny = r"""{{multiline}}"""\n',
+    'def f():\r\n    """{{multiline}}"""\r\n',
+    'def f():\n    x = 1\n    ("""{{multiline}}""")\n',
+    'def f():\n    (  """{{multiline}}""")\n',
+]
+
+ERROR_SOURCES = [
+    'def f():\n    """\n    {{error}} {{unknown}}\n    {{error[x]}}"""\n',
+    'x = """{{error}}"""\n',
+    'def f():\n    """{{unclosed"""\n',
+]
+
+
+@pytest.mark.parametrize("docstrings", DOCSTRING_MODES)
+@pytest.mark.parametrize("source", SOURCES)
+def test_engines_identical(source: str, docstrings: DocstringMode):
+    assert transform(source, RULES, engine="tokenize", docstrings=docstrings) \
+        == transform(source, RULES, engine="libcst", docstrings=docstrings)
+
+
+def get_errors(source: str, engine) -> list:
+    with pytest.raises(TransdocTransformationError) as e:
+        transform(source, RULES, engine=engine, docstrings="all")
+    return [
+        (error.position, type(error.error_info), str(error.error_info))
+        for error in e.value.args
+    ]
+
+
+@pytest.mark.parametrize("source", ERROR_SOURCES)
+def test_engines_identical_errors(source: str):
+    assert get_errors(source, "tokenize") == get_errors(source, "libcst")
+
+
+def test_engines_identical_module():
+    mod_path = Path(__file__).parent.joinpath("data", "module.py")
+    mod_txt = mod_path.read_text()
+
+    def hi():
+        return "hi"
+
+    assert transform(mod_txt, [hi], engine="tokenize") \
+        == transform(mod_txt, [hi], engine="libcst")
+
+
+def test_tokenize_engine_does_not_import_libcst():
+    code = "\n".join([
+        "import sys",
+        "import transdoc",
+        "def hi():",
+        "    return 'hi'",
+        "transdoc.transform('\"\"\"{{hi}}\"\"\"', [hi], engine='tokenize')",
+        "assert 'libcst' not in sys.modules",
+    ])
+    subprocess.run([sys.executable, "-c", code], check=True)
+
+
+def test_unknown_engine():
+    with pytest.raises(ValueError):
+        transform('"""{{multiline}}"""', RULES, engine="nope")  # type: ignore
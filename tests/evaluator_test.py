@@ -0,0 +1,63 @@
+"""
+# Transdoc / Tests / Evaluator test
+
+Test cases for evaluating rules using the function call syntax.
+"""
+from transdoc import transform
+from transdoc.__evaluator import compile_rule
+
+
+def repeat(text: str, n: int = 2) -> str:
+    return " ".join([text] * n)
+
+
+def append(items: list) -> str:
+    items.append("x")
+    return ",".join(items)
+
+
+def test_literal_call_planned():
+    plan = compile_rule('repeat("a", n=-3)')
+
+    assert plan.code is None
+    assert plan.name == "repeat"
+    assert plan.args == ("a",)
+    assert plan.kwargs == {"n": -3}
+
+
+def test_non_literal_call_compiled():
+    plan = compile_rule('repeat("a", n=1 + 1)')
+
+    assert plan.code is not None
+    assert transform('"""{{repeat("a", n=1 + 1)}}"""', [repeat]) \
+        == '"""a a"""'
+
+
+def test_nested_rule_calls():
+    assert transform('"""{{repeat(repeat("a"), 2)}}"""', [repeat]) \
+        == '"""a a a a"""'
+
+
+def test_mutable_literals_not_shared():
+    """Mutable arguments are created separately for each use of a rule"""
+    assert compile_rule('append([])').code is not None
+    assert transform('"""{{append([])}} {{append([])}}"""', [append]) \
+        == '"""x x"""'
+
+
+def test_plans_cached():
+    compile_rule.cache_clear()
+
+    transform('"""{{repeat("b")}} {{repeat("b")}}"""', [repeat])
+
+    info = compile_rule.cache_info()
+    assert (info.hits, info.misses) == (1, 1)
+
+
+def test_rules_not_modified():
+    """Evaluating expressions doesn't add `__builtins__` to the rules"""
+    rules = {"repeat": repeat}
+
+    transform('"""{{repeat(str(1))}}"""', rules)
+
+    assert rules == {"repeat": repeat}
@@ -0,0 +1,106 @@
+"""
+# Transdoc / Tests / Import hook test
+
+Test cases for transforming modules as they are imported.
+"""
+import importlib
+import os
+import sys
+from pathlib import Path
+from typing import Iterator
+import pytest
+from transdoc import install_import_hook
+from transdoc.__import_hook import TransdocFinder
+
+
+CALLS: list[str] = []
+
+
+def hi() -> str:
+    CALLS.append("hi")
+    return "hi"
+
+
+@pytest.fixture
+def package(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> Iterator[Path]:
+    package = tmp_path.joinpath("hooked")
+    package.mkdir()
+    package.joinpath("__init__.py").write_text('"""Package {{hi}}"""\n')
+    package.joinpath("module.py").write_text('"""Module {{hi}}"""\n')
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.setattr(sys, "dont_write_bytecode", False)
+    CALLS.clear()
+    yield package
+    for name in ["hooked", "hooked.module"]:
+        sys.modules.pop(name, None)
+
+
+@pytest.fixture
+def hook() -> Iterator[TransdocFinder]:
+    finder = install_import_hook([hi], ["hooked"])
+    yield finder
+    finder.uninstall()
+
+
+def reimport(name: str):
+    for module in ["hooked", "hooked.module"]:
+        sys.modules.pop(module, None)
+    importlib.invalidate_caches()
+    return importlib.import_module(name)
+
+
+def test_transforms_on_import(package: Path, hook: TransdocFinder):
+    module = reimport("hooked.module")
+
+    assert module.__doc__ == "Module hi"
+    assert sys.modules["hooked"].__doc__ == "Package hi"
+
+
+def test_bytecode_cached(package: Path, hook: TransdocFinder):
+    module = reimport("hooked.module")
+    assert len(CALLS) == 2
+    assert module.__cached__ is not None
+    assert ".opt-transdoc" in module.__cached__
+    assert Path(module.__cached__).exists()
+
+    # Warm imports use the cached bytecode
+    assert reimport("hooked.module").__doc__ == "Module hi"
+    assert len(CALLS) == 2
+
+    # Modified modules are transformed again
+    source = package.joinpath("module.py")
+    source.write_text('"""Changed {{hi}}"""\n')
+    os.utime(source, (0, source.stat().st_mtime + 10))
+    assert reimport("hooked.module").__doc__ == "Changed hi"
+    assert len(CALLS) == 3
+
+
+def test_rule_changes_change_tag(hook: TransdocFinder):
+    def hi() -> str:
+        return "different"
+
+    other = TransdocFinder({"hi": hi}, ["hooked"])
+
+    assert other.cache_tag is not None
+    assert other.cache_tag != hook.cache_tag
+
+
+def test_other_modules_untouched(package: Path, hook: TransdocFinder):
+    hook.uninstall()
+    finder = install_import_hook([hi], ["hooked.module"])
+    try:
+        assert reimport("hooked.module").__doc__ == "Module hi"
+        assert sys.modules["hooked"].__doc__ == "Package {{hi}}"
+    finally:
+        finder.uninstall()
+
+
+def test_errors(package: Path, hook: TransdocFinder):
+    package.joinpath("broken.py").write_text('"""{{missing}}"""\n')
+
+    with pytest.raises(ImportError, match="broken.py"):
+        reimport("hooked.broken")
+    sys.modules.pop("hooked.broken", None)
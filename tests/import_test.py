@@ -0,0 +1,61 @@
+"""
+# Transdoc / Tests / Import test
+
+Test cases to ensure that importing Transdoc is cheap.
+"""
+import subprocess
+import sys
+import pytest
+import transdoc
+
+
+SLOW_MODULES = [
+    "libcst",
+    "click",
+    "asyncio",
+    "sqlite3",
+    "transdoc.__transformer",
+    "transdoc.__processor",
+]
+"""Modules which shouldn't be imported until they are used"""
+
+
+def imported_modules(statement: str) -> set[str]:
+    """
+    Returns the modules imported by running the given statement in a fresh
+    interpreter.
+    """
+    output = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            f"{statement}; import sys; print('\\n'.join(sys.modules))",
+        ],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return set(output.splitlines())
+
+
+@pytest.mark.parametrize(
+    "module",
+    ["transdoc", "transdoc.rules", "transdoc.errors"],
+)
+def test_import_is_cheap(module: str):
+    assert imported_modules(f"import {module}").isdisjoint(SLOW_MODULES)
+
+
+def test_lazy_attributes():
+    for name in transdoc.__all__:
+        assert getattr(transdoc, name) is not None
+        assert name in dir(transdoc)
+    # Imported when first used
+    assert "transdoc.__transformer" in imported_modules(
+        "from transdoc import transform"
+    )
+
+
+def test_missing_attribute():
+    with pytest.raises(AttributeError):
+        transdoc.not_an_attribute  # type: ignore
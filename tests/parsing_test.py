@@ -181,6 +181,33 @@ def test_transformation_function_call_kwargs():
 ###############################################################################
 
 
+def lookup(mapping: dict, key: str):
+    """Rule accepting a dictionary"""
+    return mapping[key]
+
+
+def fn_call_nested_braces():
+    """{{lookup({"a": {"b": "}}"}}["a"], "b")}}"""
+
+
+fn_call_nested_braces_result = \
+    '''def fn_call_nested_braces():
+    """}}"""
+'''
+
+
+def test_transformation_function_call_nested_braces():
+    """
+    Test a transformation using the function-call syntax, where the arguments
+    contain nested braces, including `}}` within a string
+    """
+    assert transform(fn_call_nested_braces, [lookup]) \
+        == fn_call_nested_braces_result
+
+
+###############################################################################
+
+
 class Greeter:  # pragma: no cover
     """
     This class is useful for saying hi to people and stuff
@@ -250,3 +277,21 @@ def test_transform_module():
     mod_txt = open(mod_path).read()
 
     assert transform(mod_txt, [hi]) == mod_txt.replace("{{hi}}", "hi")
+
+
+###############################################################################
+
+
+def test_positions_not_resolved_for_docstrings(monkeypatch):
+    """
+    Node positions are expensive to calculate, so shouldn't be resolved when
+    transforming docstrings successfully
+    """
+    import transdoc.__libcst_engine
+
+    def fail(*args, **kwargs):
+        assert False, "Positions were resolved"
+
+    monkeypatch.setattr(transdoc.__libcst_engine, "MetadataWrapper", fail)
+
+    assert transform(Greeter, [hi]) == class_result
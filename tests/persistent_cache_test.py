@@ -0,0 +1,182 @@
+"""
+# Transdoc / Tests / Persistent cache test
+
+Test cases for the on-disk cache of rule results.
+"""
+from pathlib import Path
+import pytest
+from click.testing import CliRunner
+from transdoc import RuleCache, transform
+from transdoc.__cli import cli
+from transdoc.__collect_rules import collect_rules
+from transdoc.__persistent_cache import PersistentCache
+from transdoc.__processor import load_rule_file
+from .processor_test import WITH_RULE, make_tree
+
+
+PURE_RULES = '''
+import transdoc
+
+@transdoc.pure
+def hi(name="world"):
+    return f"hi {name}"
+'''
+
+
+def load_rules(rule_file: Path):
+    return collect_rules(load_rule_file(rule_file))
+
+
+def run(cache_dir: Path, rule_file: Path, source: str) -> RuleCache:
+    """Simulate a separate run, which only shares the persistent cache"""
+    persistent = PersistentCache(cache_dir)
+    cache = RuleCache(persistent=persistent)
+    rules = load_rules(rule_file)
+    transform(source, rules, cache=cache)
+    persistent.close()
+    return cache
+
+
+def test_results_reused_between_runs(tmp_path: Path):
+    rule_file = tmp_path.joinpath("rules.py")
+    rule_file.write_text(PURE_RULES)
+    cache_dir = tmp_path.joinpath("cache")
+
+    first = run(cache_dir, rule_file, '"""{{hi}} {{hi[you]}}"""')
+    second = run(cache_dir, rule_file, '"""{{hi}} {{hi[you]}}"""')
+
+    assert (first.misses, first.persistent_hits) == (2, 0)
+    assert (second.misses, second.persistent_hits) == (0, 2)
+
+
+def test_rule_changes_invalidate_results(tmp_path: Path):
+    rule_file = tmp_path.joinpath("rules.py")
+    rule_file.write_text(PURE_RULES)
+    cache_dir = tmp_path.joinpath("cache")
+
+    run(cache_dir, rule_file, '"""{{hi}}"""')
+    rule_file.write_text(PURE_RULES.replace('f"hi', 'f"hello'))
+    persistent = PersistentCache(cache_dir)
+    rules = load_rules(rule_file)
+
+    assert transform(
+        '"""{{hi}}"""',
+        rules,
+        cache=RuleCache(persistent=persistent),
+    ) == '"""hello world"""'
+
+
+def test_non_literal_arguments_not_stored(tmp_path: Path):
+    rule_file = tmp_path.joinpath("rules.py")
+    rule_file.write_text(PURE_RULES)
+    persistent = PersistentCache(tmp_path.joinpath("cache"))
+    rules = load_rules(rule_file)
+
+    transform(
+        '"""{{hi(["you"])}}"""',
+        rules,
+        cache=RuleCache(persistent=persistent),
+    )
+
+    assert persistent.stats().entries == 0
+
+
+def test_impure_rules_not_stored(tmp_path: Path):
+    """Rules may read files, so only pure rules are stored between runs"""
+    data = tmp_path.joinpath("data.txt")
+    data.write_text("old")
+
+    def file_contents() -> str:
+        return data.read_text()
+
+    for expected in ["old", "new"]:
+        persistent = PersistentCache(tmp_path.joinpath("cache"))
+        assert transform(
+            '"""{{file_contents}}"""',
+            [file_contents],
+            cache=RuleCache(cache_all=True, persistent=persistent),
+        ) == f'"""{expected}"""'
+        assert persistent.stats().entries == 0
+        persistent.close()
+        data.write_text("new")
+
+
+def test_evict_by_age(tmp_path: Path):
+    persistent = PersistentCache(tmp_path, max_age=-1)
+    persistent.put("a", "rule", "result")
+
+    assert persistent.evict() == 1
+    assert persistent.get("a") is None
+
+
+def test_evict_least_recently_used(tmp_path: Path):
+    persistent = PersistentCache(tmp_path, max_size=10)
+    persistent.put("a", "rule", "a" * 4)
+    persistent.put("b", "rule", "b" * 4)
+    persistent.put("c", "rule", "c" * 4)
+    persistent.get("a")
+
+    assert persistent.evict() == 1
+    assert persistent.get("b") is None
+    assert persistent.get("a") == "aaaa"
+
+
+def test_stats_and_clear(tmp_path: Path):
+    persistent = PersistentCache(tmp_path)
+    persistent.put("a", "one", "abc")
+    persistent.put("b", "two", "de")
+
+    stats = persistent.stats()
+    assert (stats.entries, stats.size) == (2, 5)
+    assert stats.rules == {"one": 1, "two": 1}
+
+    persistent.clear()
+    assert persistent.stats().entries == 0
+
+
+###############################################################################
+
+
+def test_cli_persistent_cache(tmp_path: Path):
+    input = make_tree(tmp_path.joinpath("input"), {"a.py": WITH_RULE})
+    rule_file = tmp_path.joinpath("rules.py")
+    rule_file.write_text(PURE_RULES)
+    cache_dir = tmp_path.joinpath("cache")
+    cache_args = ["--cache-dir", str(cache_dir)]
+    runner = CliRunner()
+
+    result = runner.invoke(cli, [
+        str(input),
+        "-r", str(rule_file),
+        "-o", str(tmp_path.joinpath("output")),
+        "--persistent-cache",
+        *cache_args,
+    ])
+    assert result.exit_code == 0, result.output
+
+    result = runner.invoke(cli, ["cache", "stats", *cache_args])
+    assert "Entries: 1" in result.output
+
+    result = runner.invoke(cli, ["cache", "clear", *cache_args])
+    assert result.exit_code == 0
+    assert PersistentCache(cache_dir).stats().entries == 0
+
+
+def test_cli_input_named_like_subcommand(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    make_tree(tmp_path.joinpath("cache"), {"a.py": WITH_RULE})
+    tmp_path.joinpath("rules.py").write_text(PURE_RULES)
+    monkeypatch.chdir(tmp_path)
+    runner = CliRunner()
+
+    result = runner.invoke(cli, ["cache", "-r", "rules.py", "-o", "out"])
+    assert result.exit_code == 0, result.output
+    assert tmp_path.joinpath("out", "a.py").read_text() \
+        == WITH_RULE.replace("{{hi}}", "hi world")
+
+    # Subcommands of the subcommand can still be used
+    result = runner.invoke(cli, ["cache", "stats", "--cache-dir", "c"])
+    assert result.exit_code == 0, result.output
+    assert "No cache found" in result.output
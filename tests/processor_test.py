@@ -0,0 +1,442 @@
+"""
+# Transdoc / Tests / Processor test
+
+Test cases for processing entire files and directories.
+"""
+import asyncio
+import os
+from pathlib import Path
+import pytest
+from transdoc import main, process_iter
+from transdoc.errors import TransdocTransformationError
+import transdoc.__processor as processor
+from transdoc.__transformer import Engine, may_contain_rules
+
+
+RULES = '''
+def hi():
+    return "hi"
+'''
+
+WITH_RULE = '''
+def function():
+    """{{hi}}"""
+'''
+
+WITHOUT_RULE = '''
+def function():
+    """No rules here"""
+'''
+
+
+def make_tree(root: Path, files: dict[str, str]) -> Path:
+    """
+    Create a directory tree containing the given files, returning its path.
+    """
+    for name, contents in files.items():
+        path = root.joinpath(name)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(contents)
+    return root
+
+
+def make_rule_file(tmp_path: Path) -> Path:
+    rule_file = tmp_path.joinpath("rules.py")
+    rule_file.write_text(RULES)
+    return rule_file
+
+
+###############################################################################
+
+
+def test_may_contain_rules():
+    assert may_contain_rules(WITH_RULE)
+    assert not may_contain_rules(WITHOUT_RULE)
+
+
+def test_may_contain_rules_no_triple_quotes():
+    """Rule markers outside of triple-quoted strings can't be rules"""
+    assert not may_contain_rules('x = f"{{escaped}}"\n')
+
+
+def test_process_directory(tmp_path: Path):
+    input = make_tree(tmp_path.joinpath("input"), {
+        "with_rule.py": WITH_RULE,
+        "without_rule.py": WITHOUT_RULE,
+        "data.txt": "{{hi}}",
+    })
+    output = tmp_path.joinpath("output")
+
+    assert main(input, make_rule_file(tmp_path), output) == 0
+
+    assert output.joinpath("with_rule.py").read_text() \
+        == WITH_RULE.replace("{{hi}}", "hi")
+    assert output.joinpath("without_rule.py").read_text() == WITHOUT_RULE
+    assert output.joinpath("data.txt").read_text() == "{{hi}}"
+
+
+def test_verbose_reports_fast_path(tmp_path: Path, capsys):
+    input = make_tree(tmp_path.joinpath("input"), {
+        "with_rule.py": WITH_RULE,
+        "a.py": WITHOUT_RULE,
+        "b.py": WITHOUT_RULE,
+    })
+    output = tmp_path.joinpath("output")
+
+    assert main(input, make_rule_file(tmp_path), output, verbose=True) == 0
+
+    assert "transformed 1 files, passed through 2 files without rules" \
+        in capsys.readouterr().out
+
+
+###############################################################################
+
+
+ERROR_RULES = '''
+def fail(message):
+    raise ValueError(message)
+'''
+
+
+def test_parallel_matches_serial(tmp_path: Path):
+    files = {
+        f"pkg{i}/mod{j}.py": WITH_RULE if j % 2 else WITHOUT_RULE
+        for i in range(3)
+        for j in range(5)
+    }
+    input = make_tree(tmp_path.joinpath("input"), files)
+    rule_file = make_rule_file(tmp_path)
+    serial = tmp_path.joinpath("serial")
+    parallel = tmp_path.joinpath("parallel")
+
+    assert main(input, rule_file, serial) == 0
+    assert main(input, rule_file, parallel, jobs=4) == 0
+
+    for name in files:
+        assert parallel.joinpath(name).read_text() \
+            == serial.joinpath(name).read_text()
+
+
+def test_parallel_errors_in_order(tmp_path: Path, capsys):
+    input = make_tree(tmp_path.joinpath("input"), {
+        f"mod{i}.py": f'"""{{{{fail("error {i}")}}}}"""\n'
+        for i in range(8)
+    })
+    rule_file = tmp_path.joinpath("rules.py")
+    rule_file.write_text(ERROR_RULES)
+
+    assert main(input, rule_file, dryrun=True) == 1
+    serial_errors = capsys.readouterr().err
+    assert "error 0" in serial_errors
+    assert main(input, rule_file, dryrun=True, jobs=4) == 1
+    assert capsys.readouterr().err == serial_errors
+
+
+def test_worker_loads_rules(tmp_path: Path):
+    """
+    If rules aren't inherited from the main process, workers load them from
+    the rule file
+    """
+    import transdoc.__processor as processor
+
+    processor._init_worker(make_rule_file(tmp_path))
+    try:
+        assert processor._worker_rules is not None
+        assert processor._worker_rules["hi"]() == "hi"
+    finally:
+        processor._worker_rules = None
+
+
+###############################################################################
+
+
+def test_incremental_only_rebuilds_changed(tmp_path: Path, capsys):
+    input = make_tree(tmp_path.joinpath("input"), {
+        "a.py": WITH_RULE,
+        "b.py": WITH_RULE,
+        "pkg/c.py": WITHOUT_RULE,
+    })
+    rule_file = make_rule_file(tmp_path)
+    output = tmp_path.joinpath("output")
+
+    assert main(input, rule_file, output, incremental=True) == 0
+    b_mtime = output.joinpath("b.py").stat().st_mtime_ns
+
+    input.joinpath("a.py").write_text(WITH_RULE + "\n# edited\n")
+    input.joinpath("pkg", "c.py").unlink()
+    capsys.readouterr()
+    assert main(input, rule_file, output, incremental=True, verbose=True) == 0
+
+    assert "1 files were already up to date" in capsys.readouterr().out
+    assert output.joinpath("a.py").read_text().endswith("# edited\n")
+    assert output.joinpath("b.py").stat().st_mtime_ns == b_mtime
+    assert not output.joinpath("pkg").exists()
+
+
+def test_incremental_rule_change_rebuilds(tmp_path: Path):
+    input = make_tree(tmp_path.joinpath("input"), {"a.py": WITH_RULE})
+    rule_file = make_rule_file(tmp_path)
+    output = tmp_path.joinpath("output")
+
+    assert main(input, rule_file, output, incremental=True) == 0
+    rule_file.write_text(RULES.replace('"hi"', '"hello"'))
+    assert main(input, rule_file, output, incremental=True) == 0
+
+    assert output.joinpath("a.py").read_text() \
+        == WITH_RULE.replace("{{hi}}", "hello")
+
+
+def test_incremental_option_change_rebuilds(tmp_path: Path, capsys):
+    input = make_tree(tmp_path.joinpath("input"), {
+        "a.py": WITH_RULE,
+        "sql.py": 'SQL = """{{hi}}"""\n',
+    })
+    rule_file = make_rule_file(tmp_path)
+    output = tmp_path.joinpath("output")
+
+    assert main(input, rule_file, output, incremental=True, docstrings="all") \
+        == 0
+    assert output.joinpath("sql.py").read_text() == 'SQL = """hi"""\n'
+    capsys.readouterr()
+    assert main(input, rule_file, output, incremental=True, verbose=True) == 0
+
+    assert "0 files were already up to date" in capsys.readouterr().out
+    assert output.joinpath("sql.py").read_text() == 'SQL = """{{hi}}"""\n'
+
+
+def test_incremental_retries_failures(tmp_path: Path):
+    input = make_tree(tmp_path.joinpath("input"), {
+        "a.py": '"""{{unknown}}"""\n',
+    })
+    rule_file = make_rule_file(tmp_path)
+    output = tmp_path.joinpath("output")
+
+    assert main(input, rule_file, output, incremental=True) == 1
+    assert main(input, rule_file, output, incremental=True) == 1
+
+
+def test_incremental_refuses_unknown_output(tmp_path: Path):
+    input = make_tree(tmp_path.joinpath("input"), {"a.py": WITH_RULE})
+    output = make_tree(tmp_path.joinpath("output"), {"other.txt": ""})
+
+    assert main(
+        input,
+        make_rule_file(tmp_path),
+        output,
+        incremental=True,
+    ) == 2
+
+
+###############################################################################
+
+
+def hi() -> str:
+    return "hi"
+
+
+def test_process_iter_in_memory(tmp_path: Path):
+    input = make_tree(tmp_path.joinpath("input"), {
+        "with_rule.py": WITH_RULE,
+        "without_rule.py": WITHOUT_RULE,
+        "broken.py": '"""{{missing}}"""',
+        "data.txt": "data",
+    })
+
+    results = {
+        result.input.name: result
+        for result in process_iter(input, [hi])
+    }
+
+    # Non-Python files are skipped when there is no output
+    assert set(results) == {"with_rule.py", "without_rule.py", "broken.py"}
+    assert results["with_rule.py"].status == "transformed"
+    assert results["with_rule.py"].text == WITH_RULE.replace("{{hi}}", "hi")
+    assert results["without_rule.py"].status == "unchanged"
+    assert results["without_rule.py"].text == WITHOUT_RULE
+    assert results["broken.py"].status == "failed"
+    assert isinstance(results["broken.py"].error, TransdocTransformationError)
+    assert results["broken.py"].text is None
+    assert not tmp_path.joinpath("output").exists()
+
+
+def test_process_iter_output(tmp_path: Path):
+    input = make_tree(tmp_path.joinpath("input"), {
+        "package/with_rule.py": WITH_RULE,
+        "data.txt": "data",
+    })
+    output = tmp_path.joinpath("output")
+
+    results = {
+        result.input.name: result
+        for result in process_iter(input, make_rule_file(tmp_path), output)
+    }
+
+    transformed = output.joinpath("package", "with_rule.py")
+    assert results["with_rule.py"].output == transformed
+    assert results["with_rule.py"].text is None
+    assert transformed.read_text() == WITH_RULE.replace("{{hi}}", "hi")
+    assert results["data.txt"].status == "copied"
+    assert output.joinpath("data.txt").read_text() == "data"
+
+
+@pytest.mark.parametrize("engine", ["libcst", "tokenize"])
+def test_process_iter_syntax_error(tmp_path: Path, engine: Engine):
+    input = make_tree(tmp_path.joinpath("input"), {
+        "a.py": WITH_RULE,
+        "b.py": 'def f(:\n    """{{hi}}"""\n',
+        "c.py": WITH_RULE,
+    })
+
+    results = {
+        result.input.name: result
+        for result in process_iter(input, [hi], engine=engine)
+    }
+
+    # The unparseable file doesn't prevent the others from being processed
+    assert set(results) == {"a.py", "b.py", "c.py"}
+    assert results["b.py"].status == "failed"
+    assert results["b.py"].error is not None
+    assert results["a.py"].status == "transformed"
+    assert results["c.py"].status == "transformed"
+
+
+def test_process_iter_is_lazy(tmp_path: Path):
+    input = make_tree(tmp_path.joinpath("input"), {
+        f"file_{i}.py": WITH_RULE
+        for i in range(5)
+    })
+    processed: list[None] = []
+
+    def hi() -> str:
+        processed.append(None)
+        return "hi"
+
+    results = process_iter(input, [hi])
+    next(results)
+
+    assert len(processed) == 1
+
+
+###############################################################################
+
+
+@pytest.mark.parametrize("deduplicate", [False, True])
+def test_in_place(tmp_path: Path, deduplicate: bool):
+    input = make_tree(tmp_path.joinpath("input"), {
+        "with_rule.py": WITH_RULE,
+        "without_rule.py": WITHOUT_RULE,
+        "data.txt": "data",
+    })
+    with_rule = input.joinpath("with_rule.py")
+    with_rule.chmod(0o755)
+    # Set the modification times in the past, so changes are detectable
+    for file in input.iterdir():
+        os.utime(file, ns=(0, 0))
+
+    assert main(
+        input,
+        make_rule_file(tmp_path),
+        in_place=True,
+        deduplicate=deduplicate,
+    ) == 0
+
+    assert with_rule.read_text() == WITH_RULE.replace("{{hi}}", "hi")
+    assert with_rule.stat().st_mtime_ns != 0
+    assert with_rule.stat().st_mode & 0o777 == 0o755
+    # Unchanged files aren't written
+    assert input.joinpath("without_rule.py").stat().st_mtime_ns == 0
+    assert input.joinpath("data.txt").stat().st_mtime_ns == 0
+    # No temporary files are left behind
+    assert sorted(file.name for file in input.iterdir()) == [
+        "data.txt",
+        "with_rule.py",
+        "without_rule.py",
+    ]
+
+    # Running again doesn't change anything
+    os.utime(with_rule, ns=(0, 0))
+    assert main(input, make_rule_file(tmp_path), in_place=True) == 0
+    assert with_rule.stat().st_mtime_ns == 0
+
+
+def test_in_place_errors_keep_input(tmp_path: Path):
+    input = make_tree(tmp_path.joinpath("input"), {
+        "broken.py": '"""{{missing}}"""',
+    })
+
+    assert main(input, make_rule_file(tmp_path), in_place=True) == 1
+
+    assert input.joinpath("broken.py").read_text() == '"""{{missing}}"""'
+
+
+def test_in_place_keeps_crlf_newlines(tmp_path: Path):
+    source = WITH_RULE.replace("\n", "\r\n")
+    unchanged = WITHOUT_RULE.replace("\n", "\r\n")
+    input = tmp_path.joinpath("input")
+    input.mkdir()
+    input.joinpath("a.py").write_bytes(source.encode())
+    input.joinpath("b.py").write_bytes(unchanged.encode())
+    os.utime(input.joinpath("b.py"), ns=(0, 0))
+
+    assert main(input, make_rule_file(tmp_path), in_place=True) == 0
+
+    assert input.joinpath("a.py").read_bytes() \
+        == source.replace("{{hi}}", "hi").encode()
+    # Files without rules aren't rewritten just because of their newlines
+    assert input.joinpath("b.py").stat().st_mtime_ns == 0
+
+
+@pytest.mark.skipif(not hasattr(os, "symlink"), reason="needs symlinks")
+def test_in_place_keeps_symlinks(tmp_path: Path):
+    target = make_tree(tmp_path.joinpath("target"), {"a.py": WITH_RULE})
+    input = tmp_path.joinpath("input")
+    input.mkdir()
+    input.joinpath("link.py").symlink_to(target.joinpath("a.py"))
+
+    assert main(input, make_rule_file(tmp_path), in_place=True) == 0
+
+    assert input.joinpath("link.py").is_symlink()
+    assert target.joinpath("a.py").read_text() \
+        == WITH_RULE.replace("{{hi}}", "hi")
+
+
+def test_in_place_rejects_output(tmp_path: Path):
+    input = make_tree(tmp_path.joinpath("input"), {"a.py": WITH_RULE})
+
+    assert main(
+        input,
+        make_rule_file(tmp_path),
+        tmp_path.joinpath("output"),
+        in_place=True,
+    ) == 2
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_rules_normalized_once_per_run(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    use_async: bool,
+):
+    input = make_tree(tmp_path.joinpath("input"), {
+        f"file_{i}.py": WITH_RULE for i in range(5)
+    })
+    calls = []
+
+    def normalize_rules(*args):
+        calls.append(args)
+        return original(*args)
+
+    original = processor.normalize_rules
+    monkeypatch.setattr(processor, "normalize_rules", normalize_rules)
+    output = tmp_path.joinpath("output")
+    if use_async:
+        code = asyncio.run(
+            processor.main_async(input, make_rule_file(tmp_path), output)
+        )
+    else:
+        code = main(input, make_rule_file(tmp_path), output)
+
+    assert code == 0
+    assert len(calls) == 1
+    assert output.joinpath("file_0.py").read_text() \
+        == WITH_RULE.replace("{{hi}}", "hi")
@@ -4,7 +4,7 @@
 Test cases for Transdoc's built-in `attributes` rule.
 """
 from transdoc import transform
-from transdoc.rules import attributes
+from transdoc.rules import attributes, attributes_generator, name_only_filter
 
 
 class Example:
@@ -35,3 +35,59 @@ class Example:
 
 def test_attributes():
     assert transform(Example, [attributes]) == EXPECTED
+
+
+class Lazy:
+    """
+    An object whose attributes shouldn't be accessed.
+    """
+    accesses = 0
+
+    @property
+    def expensive(self) -> int:
+        Lazy.accesses += 1
+        return 1
+
+
+LAZY = Lazy()
+
+
+def test_default_filter_skips_getattr():
+    before = Lazy.accesses
+
+    assert "* expensive" in attributes("tests.rules.attributes_test", "LAZY")
+
+    assert Lazy.accesses == before
+
+
+def test_attributes_cached():
+    calls = []
+
+    def filter(name: str, value: object) -> bool:
+        calls.append(name)
+        return name == "expensive"
+
+    first = attributes_generator(filter=filter)
+    second = attributes_generator(filter=filter)
+
+    assert first("tests.rules.attributes_test", "LAZY") == "* expensive"
+    count = len(calls)
+    assert second("tests.rules.attributes_test", "LAZY") == "* expensive"
+    # The listing is shared between the generated rules
+    assert len(calls) == count
+
+
+def test_name_only_filter():
+    before = Lazy.accesses
+
+    @name_only_filter
+    def filter(name: str, value: object) -> bool:
+        assert value is None
+        return name == "expensive"
+
+    assert attributes(
+        "tests.rules.attributes_test",
+        "LAZY",
+        filter=filter,
+    ) == "* expensive"
+    assert Lazy.accesses == before
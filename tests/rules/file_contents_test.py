@@ -3,8 +3,14 @@
 
 Test cases for the `file_contents` rule.
 """
+import os
+from pathlib import Path
+from typing import Optional
+import pytest
 from transdoc import transform
-from transdoc.rules import file_contents
+from transdoc.rules import file_contents, file_lines, file_region
+from transdoc.rules import __file_contents as file_contents_module
+from transdoc.rules.__file_contents import FileCache
 
 
 def example():
@@ -23,3 +29,107 @@ def example():
 
 def test_file_contents():
     assert transform(example, [file_contents]) == EXPECTED
+
+
+def test_file_contents_modified(tmp_path: Path):
+    file = tmp_path.joinpath("file.txt")
+    file.write_text("Before")
+    assert file_contents(str(file)) == "Before"
+
+    file.write_text("After!")
+    # Ensure the modification time changes on coarse filesystems
+    os.utime(file, ns=(0, file.stat().st_mtime_ns + 1_000_000_000))
+
+    assert file_contents(str(file)) == "After!"
+
+
+def test_cache_is_bounded(tmp_path: Path):
+    cache = FileCache(max_bytes=10)
+    for name in "abc":
+        file = tmp_path.joinpath(name)
+        file.write_text("12345")
+        cache.get(str(file), "contents", lambda path: ("12345", 5))
+
+    assert cache.size == 10
+
+
+LINES = "one\ntwo\nthree\nfour\n"
+
+
+@pytest.mark.parametrize(
+    ("start", "end", "expected"),
+    [
+        (1, 1, "one"),
+        (2, 3, "two\nthree"),
+        (3, None, "three\nfour"),
+        (4, 10, "four"),
+    ],
+)
+@pytest.mark.parametrize("mmap", [False, True])
+def test_file_lines(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    start: int,
+    end: Optional[int],
+    expected: str,
+    mmap: bool,
+):
+    if mmap:
+        monkeypatch.setattr(file_contents_module, "MMAP_THRESHOLD", 0)
+    file = tmp_path.joinpath("file.txt")
+    file.write_bytes(LINES.replace("\n", "\r\n").encode())
+
+    assert file_lines(str(file), start, end) == expected
+
+
+def test_file_lines_invalid(tmp_path: Path):
+    file = tmp_path.joinpath("file.txt")
+    file.write_text(LINES)
+
+    with pytest.raises(ValueError):
+        file_lines(str(file), 0)
+    with pytest.raises(ValueError):
+        file_lines(str(file), 3, 2)
+
+
+REGIONS = '''
+def unrelated():
+    pass
+
+# region: example
+def example():
+    print("Hello, world!")
+# endregion
+
+# region: empty
+# endregion
+'''
+
+
+@pytest.mark.parametrize("mmap", [False, True])
+def test_file_region(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    mmap: bool,
+):
+    if mmap:
+        monkeypatch.setattr(file_contents_module, "MMAP_THRESHOLD", 0)
+    file = tmp_path.joinpath("file.py")
+    file.write_text(REGIONS)
+
+    assert file_region(str(file), "# region: example") == (
+        'def example():\n    print("Hello, world!")'
+    )
+    assert file_region(str(file), "# region: empty") == ""
+    with pytest.raises(ValueError):
+        file_region(str(file), "# region: missing")
+
+
+def test_file_region_rule(tmp_path: Path):
+    file = tmp_path.joinpath("file.py")
+    file.write_text(REGIONS)
+    source = f'"""{{{{file_region({str(file)!r}, "# region: example")}}}}"""'
+
+    assert transform(source, [file_region]) == (
+        '"""def example():\n    print("Hello, world!")"""'
+    )
@@ -0,0 +1,88 @@
+"""
+# Transdoc / Tests / Scanner test
+
+Test cases for locating rules within docstrings.
+"""
+from time import perf_counter
+from transdoc.__scanner import find_rules, LineIndex, RuleMarker
+
+
+def test_find_rules():
+    assert list(find_rules("a {{b}} c {{d[e]}}")) == [
+        RuleMarker(2, 7, "b"),
+        RuleMarker(10, 18, "d[e]"),
+    ]
+
+
+def test_single_braces_ignored():
+    assert list(find_rules("{single} braces}")) == []
+
+
+def test_unclosed_rule():
+    assert list(find_rules("a {{b")) == [RuleMarker(2, 5, None)]
+
+
+def test_call_with_nested_dict():
+    assert list(find_rules('{{f({"a": {"b": 1}})}} x')) == [
+        RuleMarker(0, 22, 'f({"a": {"b": 1}})'),
+    ]
+
+
+def test_call_with_braces_in_string():
+    assert list(find_rules("{{f('}}', \"\\\"}}\")}}")) == [
+        RuleMarker(0, 19, "f('}}', \"\\\"}}\")"),
+    ]
+
+
+def test_unbalanced_call_closed_by_first_braces():
+    """
+    If the arguments of a call can't be balanced, the first `}}` closes the
+    rule, so that an error can be reported for it
+    """
+    assert list(find_rules("{{f(}} {{g}}")) == [
+        RuleMarker(0, 6, "f("),
+        RuleMarker(7, 12, "g"),
+    ]
+
+
+def test_unterminated_call_does_not_swallow_rules():
+    """
+    Brackets must be closed in order, so a call which is never closed
+    doesn't extend into the rules after it
+    """
+    assert list(find_rules("{{f(x}} {{g)}} {{h}}")) == [
+        RuleMarker(0, 7, "f(x"),
+        RuleMarker(8, 14, "g)"),
+        RuleMarker(15, 20, "h"),
+    ]
+    assert list(find_rules("{{f('x}} {{g}}")) == [
+        RuleMarker(0, 8, "f('x"),
+        RuleMarker(9, 14, "g"),
+    ]
+
+
+def test_unterminated_call_in_large_docstring():
+    """Arguments are scanned once, rather than once for each `}}`"""
+    docstring = "{{f(((" + "x}} " * 64_000 + "{{g}}"
+    start = perf_counter()
+    markers = list(find_rules(docstring))
+    assert perf_counter() - start < 1
+    assert markers[0] == RuleMarker(0, 9, "f(((x")
+    assert markers[-1].rule == "g"
+
+
+def test_square_bracket_text_not_balanced():
+    """Text within square brackets can contain unmatched quotes"""
+    assert list(find_rules("{{f[it's]}} {{f[it's]}}")) == [
+        RuleMarker(0, 11, "f[it's]"),
+        RuleMarker(12, 23, "f[it's]"),
+    ]
+
+
+def test_line_index():
+    index = LineIndex("ab\ncd\n\nef")
+    assert index.position(0) == (0, 0)
+    assert index.position(1) == (0, 1)
+    assert index.position(3) == (1, 0)
+    assert index.position(7) == (3, 0)
+    assert index.position(8) == (3, 1)
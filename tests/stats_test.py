@@ -0,0 +1,153 @@
+"""
+# Transdoc / Tests / Stats test
+
+Test cases for gathering statistics about transformations.
+"""
+import asyncio
+import time
+from pathlib import Path
+import pytest
+from click.testing import CliRunner
+from transdoc import RuleCache, Stats, main, pure, transform
+from transdoc.__cli import cli
+from transdoc.__stats import RuleStats
+from .processor_test import WITH_RULE, make_rule_file, make_tree
+
+
+def slow() -> str:
+    time.sleep(0.01)
+    return "slow"
+
+
+def fast(text: str = "") -> str:
+    return text
+
+
+###############################################################################
+
+
+@pytest.mark.parametrize("engine", ["libcst", "tokenize"])
+def test_transform_phases(engine):
+    stats = Stats()
+
+    transform(
+        '"""{{slow}} {{fast[a]}} {{fast[b]}}"""',
+        [slow, fast],
+        engine=engine,
+        stats=stats,
+    )
+
+    assert stats.phases["evaluate"] >= 0.01
+    # Time spent in rules isn't counted as part of scanning
+    assert stats.phases["scan"] < 0.01
+    if engine == "libcst":
+        assert stats.phases["parse"] > 0
+    assert [(rule.name, rule.calls) for rule in stats.rules()] == [
+        ("slow", 1),
+        ("fast", 2),
+    ]
+
+
+def test_cache_hits_not_counted():
+    stats = Stats()
+    cache = RuleCache()
+
+    transform(
+        '"""{{slow}} {{slow}}"""',
+        [pure(slow)],
+        cache=cache,
+        stats=stats,
+    )
+
+    assert stats.rules()[0].calls == 1
+
+
+def test_async_rules_timed():
+    async def sleepy() -> str:
+        await asyncio.sleep(0.01)
+        return "sleepy"
+
+    stats = Stats()
+    transform('"""{{sleepy}}"""', [sleepy], stats=stats)
+
+    [rule] = stats.rules()
+    assert rule.calls == 1
+    assert rule.total >= 0.01
+    assert stats.phases["evaluate"] >= 0.01
+
+
+def test_rule_stats():
+    stats = Stats()
+    for i in range(1, 101):
+        stats.record_rule("rule", i / 1000)
+
+    assert stats.rules() == [
+        RuleStats(
+            "rule",
+            100,
+            pytest.approx(5.05),
+            pytest.approx(0.0505),
+            0.096,
+        )
+    ]
+
+
+def test_merge():
+    stats = Stats()
+    stats.record_rule("rule", 1)
+    other = Stats()
+    other.record_rule("rule", 3)
+    other.record_file(Path("a.py"), 2)
+    other.phases["parse"] = 4
+
+    stats.merge(other)
+
+    assert stats.rules()[0].calls == 2
+    assert stats.slowest_files() == [(Path("a.py"), 2)]
+    assert stats.phases["parse"] == 4
+
+
+###############################################################################
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_main_stats(tmp_path: Path, jobs: int):
+    input = make_tree(tmp_path.joinpath("input"), {
+        "a.py": WITH_RULE,
+        "b.py": WITH_RULE,
+        "data.txt": "data",
+    })
+    stats = Stats()
+
+    assert main(
+        input,
+        make_rule_file(tmp_path),
+        tmp_path.joinpath("output"),
+        jobs=jobs,
+        stats=stats,
+    ) == 0
+
+    assert len(stats.files) == 3
+    assert stats.rules()[0].name == "hi"
+    assert stats.rules()[0].calls == 2
+    assert stats.phases["read"] > 0
+    assert stats.phases["write"] > 0
+
+
+def test_cli_stats(tmp_path: Path):
+    input = make_tree(tmp_path.joinpath("input"), {"a.py": WITH_RULE})
+    args = [
+        str(input),
+        "-r", str(make_rule_file(tmp_path)),
+        "-o", str(tmp_path.joinpath("output")),
+        "--stats",
+    ]
+
+    result = CliRunner().invoke(cli, args)
+
+    assert result.exit_code == 0, result.output
+    assert "slowest files (of 1)" in result.output
+    assert "hi" in result.output
+
+    result = CliRunner().invoke(cli, [*args, "--watch"])
+    assert result.exit_code != 0
@@ -0,0 +1,87 @@
+"""
+# Transdoc / Tests / Transform many test
+
+Test cases for transforming many sources at once.
+"""
+import itertools
+from types import ModuleType
+import pytest
+from transdoc import TransformResult, transform_many
+from transdoc.errors import TransdocTransformationError
+
+
+def hi() -> str:
+    return "Hi"
+
+
+def fail() -> str:
+    raise ValueError("Oh no")
+
+
+def documented():
+    """{{hi}}"""
+
+
+@pytest.mark.parametrize("jobs", [1, 4])
+def test_results_in_order(jobs: int):
+    sources = [f'"""{{{{hi}}}} {i}"""' for i in range(20)]
+
+    results = list(transform_many(sources, [hi], jobs=jobs))
+
+    assert [result.output for result in results] == [
+        f'"""Hi {i}"""' for i in range(20)
+    ]
+    assert all(result.error is None for result in results)
+
+
+def test_objects():
+    [result] = transform_many([documented], [hi])
+
+    assert result.unwrap() == 'def documented():\n    """Hi"""\n'
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_errors_attached(jobs: int):
+    results = list(transform_many(
+        ['"""{{fail}}"""', '"""{{hi}}"""', '"""{{missing}}"""'],
+        [hi, fail],
+        jobs=jobs,
+    ))
+
+    assert isinstance(results[0].error, TransdocTransformationError)
+    assert results[1] == TransformResult('"""{{hi}}"""', '"""Hi"""', None)
+    assert isinstance(results[2].error, TransdocTransformationError)
+    with pytest.raises(TransdocTransformationError):
+        results[0].unwrap()
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_lazy(jobs: int):
+    # An infinite iterator of sources is consumed lazily
+    sources = ('"""{{hi}}"""' for _ in itertools.count())
+
+    results = list(itertools.islice(
+        transform_many(sources, [hi], jobs=jobs),
+        5,
+    ))
+
+    assert len(results) == 5
+
+
+def test_rules_collected_once(monkeypatch: pytest.MonkeyPatch):
+    import transdoc.__transformer as transformer
+    calls = []
+    collect_rules = transformer.collect_rules
+
+    def counting_collect_rules(module: ModuleType):
+        calls.append(module)
+        return collect_rules(module)
+
+    monkeypatch.setattr(transformer, "collect_rules", counting_collect_rules)
+    module = ModuleType("rules")
+    module.hi = hi  # type: ignore
+
+    results = transform_many(['"""{{hi}}"""'] * 10, module)
+
+    assert [result.output for result in results] == ['"""Hi"""'] * 10
+    assert len(calls) == 1
@@ -0,0 +1,259 @@
+"""
+# Transdoc / Tests / Watch test
+
+Test cases for watching directories for changes.
+"""
+from pathlib import Path
+from typing import Optional
+import pytest
+from click.testing import CliRunner
+import transdoc.__cli as cli_module
+import transdoc.__processor as processor
+import transdoc.__watch as watch_module
+from transdoc.__cli import cli
+from transdoc.__transformer import Engine
+from transdoc.__watch import (
+    InotifyWatcher,
+    PollingWatcher,
+    Watcher,
+    WatchSession,
+    wait_for_batch,
+    watch,
+)
+from .processor_test import (
+    RULES,
+    WITH_RULE,
+    WITHOUT_RULE,
+    make_rule_file,
+    make_tree,
+)
+
+
+def make_polling_watcher(directories, files) -> Watcher:
+    return PollingWatcher(directories, files, interval=0.01)
+
+
+def make_inotify_watcher(directories, files) -> Watcher:
+    try:
+        return InotifyWatcher(directories, files)
+    except OSError:
+        pytest.skip("inotify is unavailable")
+
+
+@pytest.mark.parametrize(
+    "make_watcher",
+    [make_polling_watcher, make_inotify_watcher],
+)
+def test_watcher_detects_changes(tmp_path: Path, make_watcher):
+    input = make_tree(tmp_path.joinpath("input"), {
+        "a.py": WITHOUT_RULE,
+        "b.py": WITHOUT_RULE,
+    })
+    rule_file = make_rule_file(tmp_path)
+    watcher = make_watcher([input], [rule_file])
+    try:
+        input.joinpath("a.py").write_text(WITH_RULE)
+        input.joinpath("b.py").unlink()
+        input.joinpath("new").mkdir()
+        input.joinpath("new", "c.py").write_text(WITH_RULE)
+        rule_file.write_text(RULES + "\n")
+
+        changes: set[Path] = set()
+        while more := watcher.wait(0.5):
+            changes |= more
+
+        assert {
+            input.joinpath("a.py"),
+            input.joinpath("b.py"),
+            input.joinpath("new", "c.py"),
+            rule_file,
+        } <= changes
+    finally:
+        watcher.close()
+
+
+@pytest.mark.parametrize(
+    "make_watcher",
+    [make_polling_watcher, make_inotify_watcher],
+)
+def test_watcher_skips_excluded_directories(tmp_path: Path, make_watcher):
+    input = make_tree(tmp_path.joinpath("input"), {
+        "a.py": WITHOUT_RULE,
+        ".git/HEAD": "",
+        "node_modules/x/index.js": "",
+    })
+    watcher = make_watcher([input], [])
+    try:
+        input.joinpath(".git", "HEAD").write_text("changed")
+        input.joinpath("node_modules", "x", "index.js").write_text("changed")
+        input.joinpath(".venv").mkdir()
+        input.joinpath(".venv", "site.py").write_text("")
+        input.joinpath("a.py").write_text(WITH_RULE)
+
+        changes: set[Path] = set()
+        while more := watcher.wait(0.5):
+            changes |= more
+
+        # Creating the excluded directory may be reported, but nothing
+        # within it is
+        assert input.joinpath("a.py") in changes
+        assert changes <= {input.joinpath("a.py"), input.joinpath(".venv")}
+    finally:
+        watcher.close()
+
+
+class FakeWatcher:
+    """Watcher which produces a predetermined sequence of changes"""
+
+    def __init__(self, changes: list[set[Path]]) -> None:
+        self.changes = changes
+
+    def wait(self, timeout: Optional[float]) -> set[Path]:
+        return self.changes.pop(0) if self.changes else set()
+
+    def close(self) -> None:
+        pass
+
+
+def test_changes_coalesced():
+    watcher = FakeWatcher([{Path("a")}, {Path("b")}, set(), {Path("c")}])
+
+    assert wait_for_batch(watcher) == {Path("a"), Path("b")}
+    assert wait_for_batch(watcher) == {Path("c")}
+
+
+###############################################################################
+
+
+def make_session(tmp_path: Path) -> tuple[Path, Path, Path, WatchSession]:
+    input = make_tree(tmp_path.joinpath("input"), {
+        "a.py": WITH_RULE,
+        "b.py": WITH_RULE,
+    })
+    rule_file = make_rule_file(tmp_path)
+    output = tmp_path.joinpath("output")
+    session = WatchSession(input, rule_file, output, engine="libcst", jobs=1)
+    return input, rule_file, output, session
+
+
+def test_session_transforms_changed_files(tmp_path: Path):
+    input, _, output, session = make_session(tmp_path)
+
+    assert session.handle_changes({input.joinpath("a.py")}) == 1
+
+    assert output.joinpath("a.py").read_text() \
+        == WITH_RULE.replace("{{hi}}", "hi")
+    assert not output.joinpath("b.py").exists()
+
+
+def test_session_removes_deleted_files(tmp_path: Path):
+    input, _, output, session = make_session(tmp_path)
+    session.handle_changes({input.joinpath("a.py")})
+
+    input.joinpath("a.py").unlink()
+    session.handle_changes({input.joinpath("a.py")})
+
+    assert not output.joinpath("a.py").exists()
+
+
+def test_session_skips_excluded_files(tmp_path: Path):
+    input, _, output, session = make_session(tmp_path)
+    make_tree(input, {".git/hooks/c.py": WITH_RULE, "pkg/d.py": WITH_RULE})
+
+    assert session.handle_changes({
+        input.joinpath(".git", "hooks", "c.py"),
+        input.joinpath(".git"),
+        input.joinpath("pkg"),
+    }) == 1
+
+    assert output.joinpath("pkg", "d.py").exists()
+    assert not output.joinpath(".git").exists()
+
+
+@pytest.mark.parametrize("engine", ["libcst", "tokenize"])
+def test_session_survives_syntax_errors(
+    tmp_path: Path,
+    capsys: pytest.CaptureFixture[str],
+    engine: Engine,
+):
+    input = make_tree(tmp_path.joinpath("input"), {"a.py": WITH_RULE})
+    output = tmp_path.joinpath("output")
+    session = WatchSession(
+        input,
+        make_rule_file(tmp_path),
+        output,
+        engine=engine,
+        jobs=1,
+    )
+
+    # Half-edited files are often saved while watching
+    input.joinpath("a.py").write_text('def f(:\n    """{{hi}}"""\n')
+    assert session.handle_changes({input.joinpath("a.py")}) == 1
+    assert "a.py" in capsys.readouterr().err
+
+    input.joinpath("a.py").write_text(WITH_RULE)
+    assert session.handle_changes({input.joinpath("a.py")}) == 1
+    assert output.joinpath("a.py").read_text() \
+        == WITH_RULE.replace("{{hi}}", "hi")
+
+
+def test_session_reloads_rules(tmp_path: Path):
+    input, rule_file, output, session = make_session(tmp_path)
+
+    rule_file.write_text(RULES.replace('"hi"', '"hello"'))
+    assert session.handle_changes({rule_file}) == 2
+
+    for name in ["a.py", "b.py"]:
+        assert output.joinpath(name).read_text() \
+            == WITH_RULE.replace("{{hi}}", "hello")
+
+
+def test_watch_loads_rules_once(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    input = make_tree(tmp_path.joinpath("input"), {"a.py": WITH_RULE})
+    output = tmp_path.joinpath("output")
+    loaded = []
+
+    def load_rule_file(rule_file: Path):
+        loaded.append(rule_file)
+        return original(rule_file)
+
+    def interrupt(watcher: Watcher) -> set[Path]:
+        raise KeyboardInterrupt
+
+    original = processor.load_rule_file
+    monkeypatch.setattr(processor, "load_rule_file", load_rule_file)
+    monkeypatch.setattr(watch_module, "load_rule_file", load_rule_file)
+    monkeypatch.setattr(watch_module, "wait_for_batch", interrupt)
+
+    assert watch(input, make_rule_file(tmp_path), output) == 0
+
+    assert len(loaded) == 1
+    assert output.joinpath("a.py").read_text() \
+        == WITH_RULE.replace("{{hi}}", "hi")
+
+
+def test_cli_watch_forwards_concurrency(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    input = make_tree(tmp_path.joinpath("input"), {"a.py": WITH_RULE})
+    calls = []
+
+    def fake_watch(*args, **kwargs) -> int:
+        calls.append(kwargs)
+        return 0
+
+    monkeypatch.setattr(cli_module, "watch", fake_watch)
+    result = CliRunner().invoke(cli, [
+        str(input),
+        "-r", str(make_rule_file(tmp_path)),
+        "-o", str(tmp_path.joinpath("output")),
+        "--watch",
+        "--concurrency", "3",
+    ])
+
+    assert result.exit_code == 0, result.output
+    assert calls[0]["concurrency"] == 3
@@ -0,0 +1,207 @@
+"""
+# Transdoc / Batch
+
+Evaluate the rules used throughout many files together, so that each
+unique use of a rule is only evaluated once, and so that batch rules can
+handle all of their uses in a single call.
+"""
+import asyncio
+import inspect
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+from typing import Any, Awaitable, Callable, Optional, Sequence, Union
+
+from .__evaluator import (
+    DEFAULT_CONCURRENCY,
+    Deferred,
+    Invocation,
+    RuleEvaluator,
+    literal_call,
+)
+from .__rule import Rule
+
+
+BATCH_ATTRIBUTE = "__transdoc_batch__"
+"""Attribute used to store the batch form of a rule"""
+
+RuleCall = tuple[tuple[Any, ...], dict[str, Any]]
+"""Arguments and keyword arguments for a single use of a rule"""
+
+BatchRule = Callable[[Sequence[RuleCall]], Sequence[Union[str, Exception]]]
+"""
+Batch form of a rule, which accepts the arguments of many uses of the rule,
+and returns their results in the same order. Results may be exceptions,
+which are reported at each use of the rule with those arguments.
+"""
+
+
+def batch(batch_rule: BatchRule) -> Rule:
+    """
+    Create a rule from a function which evaluates many uses of the rule in a
+    single call.
+
+    When Transdoc deduplicates rules across a whole tree (see `main`), the
+    batch function is called once with the arguments of every unique use of
+    the rule, provided they are all literals. Otherwise, it is called with
+    one set of arguments at a time.
+
+    ```py
+    import transdoc
+
+    @transdoc.batch
+    def version(calls):
+        versions = fetch_versions([args[0] for args, kwargs in calls])
+        return [versions[args[0]] for args, kwargs in calls]
+    ```
+    """
+    @wraps(batch_rule)
+    def rule(*args: Any, **kwargs: Any) -> str:
+        [result] = batch_rule([(args, kwargs)])
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    setattr(rule, BATCH_ATTRIBUTE, batch_rule)
+    return rule
+
+
+def get_batch(rule: Rule) -> Optional[BatchRule]:
+    """
+    Returns the batch form of the given rule, if it has one.
+    """
+    return getattr(rule, BATCH_ATTRIBUTE, None)
+
+
+Result = Union[str, Exception, Awaitable[Any]]
+
+
+def call_batch(
+    batch_rule: BatchRule,
+    calls: Sequence[RuleCall],
+) -> list[Union[str, Exception]]:
+    """
+    Call the given batch rule, returning the result of each call. If the
+    batch rule fails, its error is the result of every call.
+    """
+    try:
+        results = list(batch_rule(calls))
+        if len(results) != len(calls):
+            raise ValueError(
+                f"batch rule returned {len(results)} results for "
+                f"{len(calls)} calls"
+            )
+        return results
+    except Exception as e:
+        return [e] * len(calls)
+
+
+def call_rule(evaluator: RuleEvaluator, rule: str) -> Result:
+    """
+    Call the given rule, returning its result, or the error it raised.
+    """
+    try:
+        return evaluator.call_rule(rule)
+    except Exception as e:
+        return e
+
+
+async def await_results(
+    results: dict[str, Result],
+    concurrency: int,
+) -> None:
+    """
+    Await the results which are awaitable, with at most `concurrency`
+    awaited at once.
+    """
+    limiter = asyncio.Semaphore(concurrency)
+
+    async def evaluate(rule: str, awaitable: Awaitable[Any]) -> None:
+        async with limiter:
+            try:
+                results[rule] = await awaitable
+            except Exception as e:
+                results[rule] = e
+
+    await asyncio.gather(*(
+        evaluate(rule, result)
+        for rule, result in results.items()
+        if inspect.isawaitable(result)
+    ))
+
+
+def evaluate_deferred(
+    invocations: list[Invocation],
+    rules: dict[str, Rule],
+    *,
+    jobs: int = 1,
+    concurrency: int = DEFAULT_CONCURRENCY,
+) -> int:
+    """
+    Evaluate the given deferred invocations (see `RuleEvaluator`), setting
+    their results.
+
+    Invocations using identical rule expressions are only evaluated once.
+    Uses of batch rules (see `batch`) whose arguments are all literals are
+    grouped, so that each batch rule is only called once. Evaluation is
+    performed using a pool of `jobs` threads, and async rules are then
+    awaited, with at most `concurrency` awaited at once. Threads only
+    evaluate rules in parallel while they wait on I/O, since they share the
+    GIL.
+
+    Returns the number of unique rule expressions that were evaluated.
+    """
+    uses: dict[str, list[Invocation]] = {}
+    for invocation in invocations:
+        assert isinstance(invocation.result, Deferred)
+        uses.setdefault(invocation.result.rule, []).append(invocation)
+
+    singles: list[str] = []
+    batches: dict[str, list[tuple[str, RuleCall]]] = {}
+    for rule in uses:
+        call = literal_call(rule)
+        if call is not None and call[0] in rules:
+            name, args, kwargs = call
+            if get_batch(rules[name]) is not None:
+                batches.setdefault(name, []).append((rule, (args, kwargs)))
+                continue
+        singles.append(rule)
+
+    evaluator = RuleEvaluator(rules)
+
+    def evaluate_batch(name: str) -> list[Union[str, Exception]]:
+        batch_rule = get_batch(rules[name])
+        assert batch_rule is not None
+        return call_batch(batch_rule, [call for _, call in batches[name]])
+
+    batch_results: dict[str, list[Union[str, Exception]]]
+    single_results: list[Result]
+    if jobs > 1 and len(singles) + len(batches) > 1:
+        with ThreadPoolExecutor(jobs) as executor:
+            batch_futures = {
+                name: executor.submit(evaluate_batch, name)
+                for name in batches
+            }
+            single_results = list(executor.map(
+                lambda rule: call_rule(evaluator, rule),
+                singles,
+            ))
+            batch_results = {
+                name: future.result()
+                for name, future in batch_futures.items()
+            }
+    else:
+        batch_results = {name: evaluate_batch(name) for name in batches}
+        single_results = [call_rule(evaluator, rule) for rule in singles]
+
+    results: dict[str, Result] = dict(zip(singles, single_results))
+    for name, calls in batches.items():
+        for (rule, _), result in zip(calls, batch_results[name]):
+            results[rule] = result
+
+    if any(inspect.isawaitable(result) for result in results.values()):
+        asyncio.run(await_results(results, concurrency))
+
+    for rule, rule_uses in uses.items():
+        for invocation in rule_uses:
+            invocation.result = results[rule]
+    return len(uses)
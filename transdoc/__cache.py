@@ -0,0 +1,360 @@
+"""
+# Transdoc / Cache
+
+Memoization of the results of rules.
+"""
+import inspect
+import threading
+from collections import OrderedDict
+from functools import partial, wraps
+from typing import (
+    Any,
+    Awaitable,
+    Hashable,
+    Optional,
+    Sequence,
+    TypeVar,
+    Union,
+)
+
+from .__batch import BATCH_ATTRIBUTE, BatchRule, RuleCall, get_batch
+from .__persistent_cache import PersistentCache
+from .__rule import Rule
+
+
+PURE_ATTRIBUTE = "__transdoc_pure__"
+"""Attribute used to mark rules as pure"""
+
+DEFAULT_CACHE_SIZE = 4096
+"""Default maximum number of results stored by a `RuleCache`"""
+
+
+R = TypeVar("R", bound=Rule)
+
+
+def pure(rule: R) -> R:
+    """
+    Mark a rule as pure, meaning that its result depends only on its
+    arguments. The results of pure rules are cached, so that they are only
+    evaluated once for each set of arguments.
+
+    ```py
+    import transdoc
+
+    @transdoc.pure
+    def license_notice() -> str:
+        return Path("LICENSE").read_text()
+    ```
+    """
+    setattr(rule, PURE_ATTRIBUTE, True)
+    return rule
+
+
+def is_pure(rule: Rule) -> bool:
+    """
+    Returns whether the given rule was marked as pure using `pure`.
+    """
+    return getattr(rule, PURE_ATTRIBUTE, False) is True
+
+
+def make_key(
+    name: str,
+    args: tuple[Any, ...],
+    kwargs: dict[str, Any],
+) -> Hashable:
+    """
+    Create a cache key for a call to the rule with the given name.
+
+    Types are included, so that eg `1` and `True` produce different keys.
+    Raises a `TypeError` if any of the arguments are unhashable.
+    """
+    key = (
+        name,
+        tuple((type(arg), arg) for arg in args),
+        tuple(sorted(
+            (param, type(value), value) for param, value in kwargs.items()
+        )),
+    )
+    hash(key)
+    return key
+
+
+class RuleCache:
+    """
+    Least-recently-used cache of the results of rules.
+
+    A single cache can be shared between many calls to `transform`, so that
+    rules used throughout a project are only evaluated once. Caches can be
+    used from many threads at once.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = DEFAULT_CACHE_SIZE,
+        *,
+        cache_all: bool = False,
+        persistent: Optional[PersistentCache] = None,
+    ) -> None:
+        """
+        Create a rule cache.
+
+        ## Args
+
+        * `maxsize` (`int`, optional): maximum number of results to store.
+          Once this is reached, the least recently used results are
+          discarded. Defaults to `DEFAULT_CACHE_SIZE`.
+
+        ## Keyword args
+
+        * `cache_all` (`bool`, optional): whether to cache the results of all
+          rules, rather than just those marked using `pure`. Defaults to
+          `False`.
+
+        * `persistent` (`PersistentCache`, optional): on-disk cache used to
+          store results between runs. Results which aren't found in memory
+          are looked up in this cache before evaluating the rule. Only the
+          results of rules marked using `pure` are stored, even if
+          `cache_all` is given, since other rules may read files or other
+          inputs which change between runs.
+        """
+        self.maxsize = maxsize
+        self.cache_all = cache_all
+        self.persistent = persistent
+        self.hits = 0
+        """Number of rule calls whose results were found in the cache"""
+        self.misses = 0
+        """Number of rule calls which needed to be evaluated"""
+        self.persistent_hits = 0
+        """Number of hits which were loaded from the persistent cache"""
+        self.__results: OrderedDict[Hashable, str] = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def __getstate__(self) -> dict[str, Any]:
+        # Locks can't be sent to other processes
+        state = self.__dict__.copy()
+        del state["_RuleCache__lock"]
+        return state
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self.__lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.__results)
+
+    def clear(self) -> None:
+        """
+        Discard all cached results, and reset the hit and miss counters.
+        """
+        with self.__lock:
+            self.__results.clear()
+            self.hits = 0
+            self.misses = 0
+            self.persistent_hits = 0
+
+    def counters(self) -> tuple[int, int, int]:
+        """
+        Returns a snapshot of the `hits`, `misses` and `persistent_hits`
+        counters.
+        """
+        return (self.hits, self.misses, self.persistent_hits)
+
+    def add_counters(self, counters: tuple[int, int, int]) -> None:
+        """
+        Add the given counters (eg from a cache used by another process) to
+        this cache's counters.
+        """
+        hits, misses, persistent_hits = counters
+        with self.__lock:
+            self.hits += hits
+            self.misses += misses
+            self.persistent_hits += persistent_hits
+
+    def call(
+        self,
+        name: str,
+        rule: Rule,
+        args: tuple[Any, ...],
+        kwargs: dict[str, Any],
+    ) -> Union[str, Awaitable[str]]:
+        """
+        Call the given rule, using its cached result if available.
+
+        If the rule is async, its result is stored once it has been awaited.
+        Calls with unhashable arguments are never cached.
+        """
+        try:
+            key = make_key(name, args, kwargs)
+        except TypeError:
+            with self.__lock:
+                self.misses += 1
+            return rule(*args, **kwargs)
+
+        with self.__lock:
+            found, stored, persistent_key = self.__lookup(
+                key, name, rule, args, kwargs)
+        if found:
+            return stored
+
+        # Evaluate the rule without holding the lock, so that other threads
+        # can use the cache meanwhile
+        value = rule(*args, **kwargs)
+        if inspect.isawaitable(value):
+            return self.__store_when_done(key, name, persistent_key, value)
+        self.__store(key, name, persistent_key, value)
+        return value
+
+    def call_batch(
+        self,
+        name: str,
+        rule: Rule,
+        batch_rule: BatchRule,
+        calls: Sequence[RuleCall],
+    ) -> list[Union[str, Exception]]:
+        """
+        Call the given batch form of a rule (see `transdoc.batch`), using the
+        cached results of any of the calls, so that the batch rule is only
+        called with the remaining calls, whose results are then stored.
+        """
+        results: dict[int, Union[str, Exception]] = {}
+        missing: list[tuple[int, Optional[Hashable], Optional[str]]] = []
+        for i, (args, kwargs) in enumerate(calls):
+            try:
+                key = make_key(name, args, kwargs)
+            except TypeError:
+                with self.__lock:
+                    self.misses += 1
+                missing.append((i, None, None))
+                continue
+            with self.__lock:
+                found, stored, persistent_key = self.__lookup(
+                    key, name, rule, args, kwargs)
+            if found:
+                results[i] = stored
+            else:
+                missing.append((i, key, persistent_key))
+
+        if missing:
+            # Evaluate the batch rule without holding the lock, so that
+            # other threads can use the cache meanwhile
+            computed = list(batch_rule([calls[i] for i, _, _ in missing]))
+            if len(computed) != len(missing):
+                raise ValueError(
+                    f"batch rule returned {len(computed)} results for "
+                    f"{len(missing)} calls"
+                )
+            for (i, key, persistent_key), result in zip(missing, computed):
+                results[i] = result
+                if key is not None and isinstance(result, str):
+                    self.__store(key, name, persistent_key, result)
+        return [results[i] for i in range(len(calls))]
+
+    def __lookup(
+        self,
+        key: Hashable,
+        name: str,
+        rule: Rule,
+        args: tuple[Any, ...],
+        kwargs: dict[str, Any],
+    ) -> tuple[bool, str, Optional[str]]:
+        """
+        Look up the result of a call in memory, then in the persistent cache,
+        updating the counters. Must be called while holding the lock.
+
+        Returns whether the result was found, the result, and the key used
+        to store the result in the persistent cache.
+        """
+        try:
+            result = self.__results[key]
+        except KeyError:
+            pass
+        else:
+            self.hits += 1
+            self.__results.move_to_end(key)
+            return True, result, None
+
+        persistent_key = None
+        # Rules which aren't pure may depend on inputs other than their
+        # arguments, which the persistent cache can't detect changes to
+        if self.persistent is not None and is_pure(rule):
+            persistent_key = self.persistent.make_key(name, rule, args, kwargs)
+        if persistent_key is not None:
+            assert self.persistent is not None
+            stored = self.persistent.get(persistent_key)
+            if stored is not None:
+                self.hits += 1
+                self.persistent_hits += 1
+                self.__store_locked(key, name, None, stored)
+                return True, stored, None
+
+        self.misses += 1
+        return False, "", persistent_key
+
+    async def __store_when_done(
+        self,
+        key: Hashable,
+        name: str,
+        persistent_key: Optional[str],
+        awaitable: Awaitable[str],
+    ) -> str:
+        result = await awaitable
+        self.__store(key, name, persistent_key, result)
+        return result
+
+    def __store(
+        self,
+        key: Hashable,
+        name: str,
+        persistent_key: Optional[str],
+        result: str,
+    ) -> None:
+        with self.__lock:
+            self.__store_locked(key, name, persistent_key, result)
+
+    def __store_locked(
+        self,
+        key: Hashable,
+        name: str,
+        persistent_key: Optional[str],
+        result: str,
+    ) -> None:
+        if persistent_key is not None and isinstance(result, str):
+            assert self.persistent is not None
+            self.persistent.put(persistent_key, name, result)
+        if self.maxsize > 0:
+            self.__results[key] = result
+            if len(self.__results) > self.maxsize:
+                self.__results.popitem(last=False)
+
+    def __wrap_rule(self, name: str, rule: Rule) -> Rule:
+        @wraps(rule)
+        def cached_rule(
+            *args: Any,
+            **kwargs: Any,
+        ) -> Union[str, Awaitable[str]]:
+            return self.call(name, rule, args, kwargs)
+
+        # `wraps` copies the batch form of batch rules, which would bypass
+        # the cache, so replace it with one which uses the cache
+        batch_rule = get_batch(rule)
+        if batch_rule is not None:
+            setattr(
+                cached_rule,
+                BATCH_ATTRIBUTE,
+                partial(self.call_batch, name, rule, batch_rule),
+            )
+        return cached_rule
+
+    def wrap(self, rules: dict[str, Rule]) -> dict[str, Rule]:
+        """
+        Returns a copy of the given rules, where all cacheable rules are
+        replaced with versions that use this cache.
+        """
+        return {
+            name: (
+                self.__wrap_rule(name, rule)
+                if self.cache_all or is_pure(rule)
+                else rule
+            )
+            for name, rule in rules.items()
+        }
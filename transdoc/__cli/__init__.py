@@ -6,13 +6,34 @@ Main entrypoint to the Transdoc CLI.
 import click
 from pathlib import Path
 from typing import Optional
+from .cache import cache, cache_dir_option
+from .default_group import DefaultGroup
 from .mutex import Mutex
-from transdoc import main
+from transdoc import main, RuleCache, Stats
+from transdoc.__evaluator import DEFAULT_CONCURRENCY
+from transdoc.__copy import COPY_STRATEGIES, CopyStrategy
+from transdoc.__discovery import DEFAULT_EXCLUDES
+from transdoc.__persistent_cache import PersistentCache
+from transdoc.__watch import watch
+from transdoc.__transformer import (
+    DOCSTRING_MODES,
+    ENGINES,
+    DocstringMode,
+    Engine,
+)
 
 from transdoc.__consts import VERSION
 
 
-@click.command("transdoc")
+@click.group("transdoc", cls=DefaultGroup, default_command="transform")
+@click.version_option(VERSION)
+def cli() -> None:
+    """
+    Transform Python docstrings using Transdoc.
+    """
+
+
+@cli.command("transform")
 @click.argument(
     'input',
     type=click.Path(exists=True, path_type=Path),
@@ -31,7 +52,16 @@ from transdoc.__consts import VERSION
     type=click.Path(exists=False, path_type=Path),
     help='Path to the output file or directory',
     cls=Mutex,
-    mutex_with=["dryrun"],
+    mutex_with=["dryrun", "in_place"],
+)
+@click.option(
+    '-i',
+    '--in-place',
+    is_flag=True,
+    help='Transform Python files within the input in place, only rewriting '
+    'files whose contents change',
+    cls=Mutex,
+    mutex_with=["dryrun", "incremental", "watch_mode"],
 )
 @click.option(
     '-d',
@@ -47,16 +77,196 @@ from transdoc.__consts import VERSION
     cls=Mutex,
     mutex_with=["dryrun"],
 )
+@click.option(
+    '-v',
+    '--verbose',
+    is_flag=True,
+    help='Print a summary of the processed files',
+)
+@click.option(
+    '--engine',
+    type=click.Choice(ENGINES),
+    default="libcst",
+    show_default=True,
+    help='Engine used to rewrite Python files',
+)
+@click.option(
+    '--docstrings',
+    type=click.Choice(DOCSTRING_MODES),
+    default="precise",
+    show_default=True,
+    help='Which strings to transform: only module, class, function and '
+    'attribute docstrings, or all triple-quoted strings',
+)
+@click.option(
+    '-j',
+    '--jobs',
+    type=click.IntRange(min=0),
+    default=1,
+    show_default=True,
+    help='Number of files to process in parallel (0 to use all CPUs)',
+)
+@click.option(
+    '--concurrency',
+    type=click.IntRange(min=1),
+    default=DEFAULT_CONCURRENCY,
+    show_default=True,
+    help='Maximum number of async rules awaited at once within each file',
+)
+@click.option(
+    '--deduplicate',
+    is_flag=True,
+    help='Extract the rules used by all files, then evaluate each unique use '
+    'of a rule once, using --jobs threads. Since threads share the GIL, '
+    'this only speeds up rules which wait on I/O, such as network requests',
+)
+@click.option(
+    '--incremental',
+    is_flag=True,
+    help='Only process files which changed since the previous incremental '
+    'build into the output directory',
+    cls=Mutex,
+    mutex_with=["dryrun"],
+)
+@click.option(
+    '--cache-rules',
+    is_flag=True,
+    help='Cache the results of all rules, not just those marked as pure',
+)
+@click.option(
+    '--persistent-cache',
+    is_flag=True,
+    help='Store the results of pure rules on disk, so that they can be '
+    'reused by later runs',
+)
+@cache_dir_option
+@click.option(
+    '--include',
+    multiple=True,
+    metavar='GLOB',
+    help='Only process files matching this glob (can be given multiple '
+    'times)',
+)
+@click.option(
+    '--exclude',
+    multiple=True,
+    metavar='GLOB',
+    help='Skip files and directories matching this glob, in addition to '
+    'version control, cache and dependency directories (can be given '
+    'multiple times)',
+)
+@click.option(
+    '--gitignore',
+    is_flag=True,
+    help='Skip files ignored by .gitignore files',
+)
+@click.option(
+    '--copy-strategy',
+    type=click.Choice(COPY_STRATEGIES),
+    default="copy",
+    show_default=True,
+    help='How files which are not transformed are passed through to the '
+    'output',
+)
+@click.option(
+    '--stats',
+    'show_stats',
+    is_flag=True,
+    help='Print the time spent in each phase, along with the slowest files '
+    'and rules',
+    cls=Mutex,
+    mutex_with=["watch_mode"],
+)
+@click.option(
+    '-w',
+    '--watch',
+    'watch_mode',
+    is_flag=True,
+    help='After processing the input directory, watch it and the rule file '
+    'for changes, and re-transform files as they change',
+    cls=Mutex,
+    mutex_with=["dryrun"],
+)
 @click.version_option(VERSION)
-def cli(
+def transform_command(
     input: Path,
     rule_file: Path,
     output: Optional[Path] = None,
     *,
+    in_place: bool = False,
     dryrun: bool = False,
     force: bool = False,
+    verbose: bool = False,
+    engine: Engine = "libcst",
+    docstrings: DocstringMode = "precise",
+    jobs: int = 1,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    deduplicate: bool = False,
+    incremental: bool = False,
+    cache_rules: bool = False,
+    persistent_cache: bool = False,
+    cache_dir: Path = Path(),
+    include: tuple[str, ...] = (),
+    exclude: tuple[str, ...] = (),
+    gitignore: bool = False,
+    copy_strategy: CopyStrategy = "copy",
+    show_stats: bool = False,
+    watch_mode: bool = False,
 ) -> int:
     """
-    Main entrypoint to the program.
+    Transform the given input file or directory.
+
+    Use `transdoc cache --help` to see how to manage the persistent cache.
     """
-    return main(input, rule_file, output, dryrun=dryrun, force=force)
+    exclude = DEFAULT_EXCLUDES + exclude
+    cache = RuleCache(
+        cache_all=cache_rules,
+        persistent=PersistentCache(cache_dir) if persistent_cache else None,
+    )
+    if watch_mode:
+        return watch(
+            input,
+            rule_file,
+            output,
+            force=force,
+            verbose=verbose,
+            engine=engine,
+            docstrings=docstrings,
+            jobs=jobs,
+            incremental=incremental,
+            cache=cache,
+            copy_strategy=copy_strategy,
+            concurrency=concurrency,
+            deduplicate=deduplicate,
+            include=include,
+            exclude=exclude,
+            gitignore=gitignore,
+        )
+    stats = Stats() if show_stats else None
+    status = main(
+        input,
+        rule_file,
+        output,
+        dryrun=dryrun,
+        force=force,
+        verbose=verbose,
+        engine=engine,
+        docstrings=docstrings,
+        jobs=jobs,
+        incremental=incremental,
+        cache=cache,
+        copy_strategy=copy_strategy,
+        concurrency=concurrency,
+        deduplicate=deduplicate,
+        stats=stats,
+        in_place=in_place,
+        include=include,
+        exclude=exclude,
+        gitignore=gitignore,
+    )
+    if stats is not None:
+        click.echo(stats.report(), err=True)
+    return status
+
+
+cli.add_command(cache)
@@ -0,0 +1,66 @@
+"""
+# Transdoc / CLI / Cache
+
+Commands for inspecting and clearing the persistent cache.
+"""
+import click
+from pathlib import Path
+from transdoc.__persistent_cache import (
+    DEFAULT_CACHE_DIR,
+    CACHE_FILE,
+    PersistentCache,
+)
+
+
+cache_dir_option = click.option(
+    '--cache-dir',
+    type=click.Path(file_okay=False, path_type=Path),
+    default=DEFAULT_CACHE_DIR,
+    show_default=True,
+    help='Directory containing the persistent cache',
+)
+
+
+@click.group("cache")
+def cache() -> None:
+    """
+    Inspect or clear the persistent cache of rule results.
+    """
+
+
+@cache.command("stats")
+@cache_dir_option
+def stats(cache_dir: Path) -> None:
+    """
+    Show the contents of the persistent cache.
+    """
+    if not cache_dir.joinpath(CACHE_FILE).exists():
+        click.echo(f"No cache found in '{cache_dir}'")
+        return
+    persistent = PersistentCache(cache_dir)
+    try:
+        cache_stats = persistent.stats()
+    finally:
+        persistent.close()
+    click.echo(f"Cache directory: {cache_dir}")
+    click.echo(f"Entries: {cache_stats.entries}")
+    click.echo(f"Size: {cache_stats.size} bytes")
+    for rule, count in cache_stats.rules.items():
+        click.echo(f"    {rule}: {count}")
+
+
+@cache.command("clear")
+@cache_dir_option
+def clear(cache_dir: Path) -> None:
+    """
+    Remove all results from the persistent cache.
+    """
+    if not cache_dir.joinpath(CACHE_FILE).exists():
+        click.echo(f"No cache found in '{cache_dir}'")
+        return
+    persistent = PersistentCache(cache_dir)
+    try:
+        persistent.clear()
+    finally:
+        persistent.close()
+    click.echo(f"Cleared cache in '{cache_dir}'")
@@ -0,0 +1,45 @@
+"""
+# Transdoc / CLI / Default group
+
+Command group for Click argument parser which falls back to a default
+command.
+"""
+import os
+import click
+
+
+class DefaultGroup(click.Group):
+    """
+    Click group variant which invokes a default command when the first
+    argument isn't the name of one of its subcommands.
+
+    This allows `transdoc src -r rules.py` to keep working alongside
+    subcommands such as `transdoc cache stats`. If the first argument is
+    also an existing path (eg an input directory named `cache`), it is
+    passed to the default command, unless it is followed by the name of one
+    of the subcommand's own subcommands.
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        self.default_command: str = kwargs.pop("default_command")
+        super().__init__(*args, **kwargs)
+
+    def parse_args(self, ctx, args):
+        if not args or not self.__is_subcommand(args):
+            args = [self.default_command, *args]
+        return super().parse_args(ctx, args)
+
+    def __is_subcommand(self, args: list[str]) -> bool:
+        """
+        Returns whether the given arguments invoke one of the subcommands.
+        """
+        command = self.commands.get(args[0])
+        if command is None:
+            return False
+        if not os.path.exists(args[0]):
+            return True
+        return (
+            isinstance(command, click.Group)
+            and len(args) > 1
+            and args[1] in command.commands
+        )
@@ -0,0 +1,171 @@
+"""
+# Transdoc / Copy
+
+Copy files which don't need to be transformed into the output directory,
+without loading their contents into memory.
+"""
+import os
+import shutil
+import sys
+from pathlib import Path
+from typing import BinaryIO, Callable, Literal
+
+
+CopyStrategy = Literal["copy", "hardlink", "symlink"]
+"""
+Strategy used to pass files which aren't transformed through to the output.
+
+* `"copy"`: copy the file. Where the file system supports it, the copy is a
+  reflink (copy-on-write clone), and otherwise the data is copied within the
+  kernel using `copy_file_range` or `sendfile`.
+* `"hardlink"`: create a hard link to the input file, falling back to
+  copying it if the output is on a different file system.
+* `"symlink"`: create a symbolic link to the input file.
+"""
+
+COPY_STRATEGIES: tuple[CopyStrategy, ...] = ("copy", "hardlink", "symlink")
+
+FICLONE = 0x40049409
+"""`ioctl` request used to clone a file on Linux (from <linux/fs.h>)"""
+
+COPY_CHUNK_SIZE = 1 << 30
+"""Maximum number of bytes to copy within the kernel in a single call"""
+
+
+def reflink(copy_in: BinaryIO, copy_out: BinaryIO) -> bool:
+    """
+    Attempt to clone the contents of one file into another, returning
+    whether it was successful.
+    """
+    if not sys.platform.startswith("linux"):
+        return False
+    import fcntl
+    try:
+        fcntl.ioctl(copy_out.fileno(), FICLONE, copy_in.fileno())
+        return True
+    except OSError:
+        return False
+
+
+def copy_file_range(in_fd: int, out_fd: int, offset: int, count: int) -> int:
+    return os.copy_file_range(in_fd, out_fd, count, offset, offset)
+
+
+def sendfile(in_fd: int, out_fd: int, offset: int, count: int) -> int:
+    # `sendfile` writes to the current position of the output
+    os.lseek(out_fd, offset, os.SEEK_SET)
+    return os.sendfile(out_fd, in_fd, offset, count)
+
+
+KERNEL_COPIES: list[Callable[[int, int, int, int], int]] = [
+    *([copy_file_range] if hasattr(os, "copy_file_range") else []),
+    *([sendfile] if hasattr(os, "sendfile") else []),
+]
+"""
+Functions which copy data between files without passing it through user
+space, given the input and output file descriptors, the offset to copy
+from, and the maximum number of bytes to copy
+"""
+
+
+def copy_contents(copy_in: BinaryIO, copy_out: BinaryIO) -> None:
+    """
+    Copy the contents of one file into another, using the most efficient
+    method available.
+    """
+    if reflink(copy_in, copy_out):
+        return
+    in_fd = copy_in.fileno()
+    out_fd = copy_out.fileno()
+    size = os.fstat(in_fd).st_size
+    offset = 0
+    for kernel_copy in KERNEL_COPIES:
+        try:
+            while offset < size:
+                count = min(size - offset, COPY_CHUNK_SIZE)
+                copied = kernel_copy(in_fd, out_fd, offset, count)
+                if copied == 0:
+                    break
+                offset += copied
+        except OSError:
+            # Not supported by this file system, so try the next method
+            continue
+        break
+    # Copy any remaining data (eg if the file grew, or kernel copies aren't
+    # supported) the regular way
+    copy_in.seek(offset)
+    copy_out.seek(offset)
+    shutil.copyfileobj(copy_in, copy_out)
+
+
+def is_up_to_date(
+    input: Path,
+    output: Path,
+    strategy: CopyStrategy,
+) -> bool:
+    """
+    Returns whether the output already matches the input, given the copy
+    strategy, meaning that it doesn't need to be copied again.
+
+    Copies are considered to match if their size and modification time
+    match those of the input.
+    """
+    try:
+        if strategy == "symlink":
+            return (
+                output.is_symlink()
+                and os.readlink(output) == str(input.absolute())
+            )
+        if output.is_symlink():
+            return False
+        # Hard links must link to the input, and copies mustn't
+        if os.path.samefile(input, output):
+            return strategy == "hardlink"
+        if strategy == "hardlink":
+            return False
+        in_stat = input.stat()
+        out_stat = output.stat()
+    except OSError:
+        return False
+    return (
+        in_stat.st_size == out_stat.st_size
+        and in_stat.st_mtime_ns == out_stat.st_mtime_ns
+    )
+
+
+def copy_file(
+    input: Path,
+    output: Path,
+    strategy: CopyStrategy = "copy",
+) -> bool:
+    """
+    Pass the input file through to the output using the given strategy,
+    without loading its contents into memory.
+
+    Returns `False` if the output already matched the input, and so was left
+    unchanged.
+    """
+    if is_up_to_date(input, output, strategy):
+        return False
+    output.parent.mkdir(parents=True, exist_ok=True)
+    # Never write through an existing link, since that could modify the
+    # input
+    output.unlink(missing_ok=True)
+
+    if strategy == "symlink":
+        output.symlink_to(input.absolute())
+        return True
+    if strategy == "hardlink":
+        try:
+            os.link(input, output)
+            return True
+        except OSError:
+            # Eg the output is on a different file system
+            pass
+
+    with open(input, "rb") as copy_in, open(output, "wb") as copy_out:
+        copy_contents(copy_in, copy_out)
+    # Keep the modification time, so that unchanged files can be detected
+    stat = input.stat()
+    os.utime(output, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    return True
@@ -0,0 +1,440 @@
+"""
+# Transdoc / Discovery
+
+Find the files to process within an input directory, skipping excluded
+files and directories without descending into them.
+"""
+import os
+import re
+from typing import Iterable, Iterator, NamedTuple, Optional
+
+
+DEFAULT_EXCLUDES: tuple[str, ...] = (
+    ".git/",
+    ".hg/",
+    ".svn/",
+    ".bzr/",
+    "__pycache__/",
+    ".mypy_cache/",
+    ".pytest_cache/",
+    ".ruff_cache/",
+    ".transdoc_cache/",
+    ".tox/",
+    ".nox/",
+    ".venv/",
+    "node_modules/",
+)
+"""
+Directories which are excluded by default, since they contain version
+control data, caches or installed dependencies rather than source code
+"""
+
+GITIGNORE_FILE = ".gitignore"
+
+
+def translate_glob(pattern: str) -> tuple[str, bool]:
+    """
+    Translate a glob, using the syntax of `.gitignore` files, into a regular
+    expression which matches paths relative to the directory the glob
+    belongs to, using forward slashes.
+
+    * `*` matches anything except `/`, and `?` matches any one character
+      except `/`.
+    * `**` matches any number of directories.
+    * Globs containing a `/` (other than a trailing `/`) only match relative
+      to the directory, and other globs match at any depth.
+    * Globs ending with a `/` only match directories.
+
+    Returns the regular expression, and whether the glob only matches
+    directories.
+    """
+    dir_only = pattern.endswith("/")
+    pattern = pattern.rstrip("/")
+    anchored = "/" in pattern
+    pattern = pattern.lstrip("/")
+
+    parts = [] if anchored else ["(?:.*/)?"]
+    i = 0
+    n = len(pattern)
+    while i < n:
+        c = pattern[i]
+        if (
+            pattern.startswith("**", i)
+            and (i == 0 or pattern[i - 1] == "/")
+            and (i + 2 == n or pattern[i + 2] == "/")
+        ):
+            if i + 2 == n:
+                # Trailing `/**` matches everything inside
+                parts.append(".*")
+            else:
+                # `**/` matches zero or more directories
+                parts.append("(?:.*/)?")
+            i += 3
+            continue
+        if c == "*":
+            parts.append("[^/]*")
+        elif c == "?":
+            parts.append("[^/]")
+        elif c == "[":
+            end = i + 1
+            if end < n and pattern[end] in "!^":
+                end += 1
+            if end < n and pattern[end] == "]":
+                end += 1
+            end = pattern.find("]", end)
+            if end == -1:
+                parts.append(re.escape(c))
+            else:
+                contents = pattern[i + 1:end].replace("\\", "\\\\")
+                if contents[0] in "!^":
+                    contents = "^" + contents[1:]
+                parts.append(f"[{contents}]")
+                i = end
+        elif c == "\\" and i + 1 < n:
+            i += 1
+            parts.append(re.escape(pattern[i]))
+        else:
+            parts.append(re.escape(c))
+        i += 1
+    return "".join(parts), dir_only
+
+
+class GlobSet:
+    """
+    A set of globs (see `translate_glob`), which are combined into a single
+    regular expression, so that paths can be matched against all of them at
+    once.
+    """
+
+    def __init__(self, patterns: Iterable[str]) -> None:
+        any_kind: list[str] = []
+        dirs_only: list[str] = []
+        for pattern in patterns:
+            regex, dir_only = translate_glob(pattern)
+            (dirs_only if dir_only else any_kind).append(f"(?:{regex})")
+        self.__any = re.compile("|".join(any_kind)) if any_kind else None
+        self.__dirs = re.compile("|".join(dirs_only)) if dirs_only else None
+
+    def matches(self, path: str, is_dir: bool) -> bool:
+        """
+        Returns whether the given relative path matches any of the globs.
+        """
+        return (
+            self.__any is not None and self.__any.fullmatch(path) is not None
+            or is_dir
+            and self.__dirs is not None
+            and self.__dirs.fullmatch(path) is not None
+        )
+
+
+class IgnoreRule(NamedTuple):
+    """
+    A rule from a `.gitignore` file.
+    """
+
+    regex: re.Pattern[str]
+    """Regular expression matching the paths the rule applies to"""
+
+    dir_only: bool
+    """Whether the rule only applies to directories"""
+
+    negate: bool
+    """Whether the rule re-includes paths (`!pattern`)"""
+
+    strip: int
+    """
+    Number of characters to remove from the start of paths relative to the
+    root, to make them relative to the directory containing the rule
+    """
+
+    prefix: str
+    """
+    Prefix to add to paths relative to the root, to make them relative to
+    the directory containing the rule, for rules from parent directories
+    """
+
+    def matches(self, path: str, is_dir: bool) -> bool:
+        if self.dir_only and not is_dir:
+            return False
+        relative = self.prefix + path[self.strip:]
+        return self.regex.fullmatch(relative) is not None
+
+
+Rules = tuple[IgnoreRule, ...]
+
+
+def load_gitignore(file: str, strip: int, prefix: str) -> Rules:
+    """
+    Load the rules from the given `.gitignore` file, if it exists.
+    """
+    try:
+        with open(file, encoding="utf-8", errors="replace") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return ()
+    rules = []
+    for line in lines:
+        # Trailing spaces are ignored unless they are escaped
+        while line.endswith(" ") and not line.endswith("\\ "):
+            line = line[:-1]
+        if not line or line.startswith("#"):
+            continue
+        negate = line.startswith("!")
+        if negate:
+            line = line[1:]
+        regex, dir_only = translate_glob(line)
+        rules.append(
+            IgnoreRule(re.compile(regex), dir_only, negate, strip, prefix)
+        )
+    return tuple(rules)
+
+
+class FileFilter:
+    """
+    Determines which files within a root directory are processed, and finds
+    them using `os.scandir`.
+
+    Files and directories matching any of the `exclude` globs are skipped,
+    and if any `include` globs are given, only files matching one of them
+    are found. Globs use the syntax of `.gitignore` files, and are matched
+    against paths relative to the root.
+
+    If `gitignore` is given, files ignored by `.gitignore` files are also
+    skipped. This includes the `.gitignore` files of the root's parent
+    directories, up to the root of the repository containing it.
+
+    The `skip` directory, if given, is never entered. This is used to avoid
+    finding outputs written inside the input directory while it is being
+    processed.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        *,
+        include: Iterable[str] = (),
+        exclude: Iterable[str] = DEFAULT_EXCLUDES,
+        gitignore: bool = False,
+        skip: Optional[str] = None,
+    ) -> None:
+        self.__top = root
+        """Root, as given, which found paths are relative to"""
+        self.__root = os.path.abspath(root)
+        include = tuple(include)
+        self.__include = GlobSet(include) if include else None
+        self.__exclude = GlobSet(exclude)
+        self.__gitignore = gitignore
+        self.__skip = None if skip is None else os.path.abspath(skip)
+        self.__rules_cache: dict[str, Optional[Rules]] = {}
+        """
+        Rules which apply within each directory checked using `matches`, or
+        `None` if the directory is excluded
+        """
+
+    def clear(self) -> None:
+        """
+        Forget the `.gitignore` rules which were loaded, so that changes to
+        them take effect.
+        """
+        self.__rules_cache.clear()
+
+    def __relative(self, path: str) -> Optional[str]:
+        """
+        Returns the given absolute path relative to the root, using forward
+        slashes, or `None` if it isn't within the root.
+        """
+        relative = os.path.relpath(path, self.__root)
+        if relative == os.curdir:
+            return ""
+        if relative == os.pardir or relative.startswith(os.pardir + os.sep):
+            return None
+        return relative.replace(os.sep, "/")
+
+    def __parent_rules(self) -> Rules:
+        """
+        Returns the rules from the `.gitignore` files of the root's parent
+        directories, if the root is within a repository.
+        """
+        if os.path.exists(os.path.join(self.__root, ".git")):
+            return ()
+        parents: list[str] = []
+        directory = self.__root
+        while True:
+            parent = os.path.dirname(directory)
+            if parent == directory:
+                # Not within a repository
+                return ()
+            directory = parent
+            parents.append(directory)
+            if os.path.exists(os.path.join(directory, ".git")):
+                break
+        rules: Rules = ()
+        for directory in reversed(parents):
+            prefix = os.path.relpath(self.__root, directory)
+            rules += load_gitignore(
+                os.path.join(directory, GITIGNORE_FILE),
+                0,
+                prefix.replace(os.sep, "/") + "/",
+            )
+        return rules
+
+    def __directory_rules(
+        self,
+        path: str,
+        relative: str,
+        parent: Rules,
+    ) -> Rules:
+        """
+        Returns the rules which apply within the given directory, given the
+        rules which apply within its parent.
+        """
+        if not self.__gitignore:
+            return parent
+        own = load_gitignore(
+            os.path.join(path, GITIGNORE_FILE),
+            len(relative) + 1 if relative else 0,
+            "",
+        )
+        return parent + own if own else parent
+
+    def __rules(self, relative: str) -> Optional[Rules]:
+        """
+        Returns the rules which apply within the given directory, or `None`
+        if it is excluded.
+        """
+        if relative in self.__rules_cache:
+            return self.__rules_cache[relative]
+        path = os.path.join(self.__root, *relative.split("/"))
+        rules: Optional[Rules]
+        if not relative:
+            parent_rules = self.__parent_rules() if self.__gitignore else ()
+            rules = self.__directory_rules(path, relative, parent_rules)
+        else:
+            parent = self.__rules(relative.rpartition("/")[0])
+            if (
+                parent is None
+                or self.__excluded(path, relative, True, parent)
+            ):
+                rules = None
+            else:
+                rules = self.__directory_rules(path, relative, parent)
+        self.__rules_cache[relative] = rules
+        return rules
+
+    def __excluded(
+        self,
+        path: str,
+        relative: str,
+        is_dir: bool,
+        rules: Rules,
+    ) -> bool:
+        """
+        Returns whether the given file or directory is excluded, given the
+        rules which apply within its parent directory.
+        """
+        if (
+            is_dir
+            and self.__skip is not None
+            and os.path.abspath(path) == self.__skip
+        ):
+            return True
+        if self.__exclude.matches(relative, is_dir):
+            return True
+        ignored = False
+        for rule in rules:
+            if rule.matches(relative, is_dir):
+                ignored = not rule.negate
+        return ignored
+
+    def __included(self, relative: str) -> bool:
+        return (
+            self.__include is None
+            or self.__include.matches(relative, False)
+        )
+
+    def matches(self, path: str) -> bool:
+        """
+        Returns whether the given file is within the root, and isn't
+        excluded.
+        """
+        path = os.path.abspath(path)
+        relative = self.__relative(path)
+        if not relative:
+            return False
+        rules = self.__rules(relative.rpartition("/")[0])
+        return (
+            rules is not None
+            and not self.__excluded(path, relative, False, rules)
+            and self.__included(relative)
+        )
+
+    def walk(
+        self,
+        directory: Optional[str] = None,
+    ) -> Iterator[tuple[str, str]]:
+        """
+        Find the files within the given directory, which must be within the
+        root, and defaults to the root. Files are found lazily, and excluded
+        directories aren't entered.
+
+        Yields the path of each file, which is relative to the root if the
+        root was given as a relative path, along with its path relative to
+        the root, using forward slashes.
+
+        As with `os.walk`, symbolic links to directories aren't followed,
+        and directories which can't be read are skipped.
+        """
+        for path, relative, is_dir in self.scan(directory):
+            if not is_dir:
+                yield path, relative
+
+    def scan(
+        self,
+        directory: Optional[str] = None,
+    ) -> Iterator[tuple[str, str, bool]]:
+        """
+        Like `walk`, but also yields each directory that is entered,
+        including the given directory, so that they can be watched. Yields
+        the path of each file and directory, its path relative to the root,
+        and whether it is a directory.
+        """
+        path = self.__top if directory is None else directory
+        relative = self.__relative(os.path.abspath(path))
+        if relative is None:
+            return
+        rules = self.__rules(relative)
+        if rules is None:
+            return
+        stack = [(path, relative, rules)]
+        while stack:
+            path, relative, rules = stack.pop()
+            yield path, relative, True
+            try:
+                # Read each directory completely before processing any of its
+                # files, so that outputs written into it aren't found
+                with os.scandir(path) as scan:
+                    entries = list(scan)
+            except OSError:
+                continue
+            subdirectories = []
+            for entry in entries:
+                entry_relative = (
+                    f"{relative}/{entry.name}" if relative else entry.name
+                )
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                if self.__excluded(entry.path, entry_relative, is_dir, rules):
+                    continue
+                if not is_dir:
+                    if self.__included(entry_relative):
+                        yield entry.path, entry_relative, False
+                elif not entry.is_symlink():
+                    subdirectories.append((entry.path, entry_relative))
+            for subdirectory, sub_relative in reversed(subdirectories):
+                stack.append((
+                    subdirectory,
+                    sub_relative,
+                    self.__directory_rules(subdirectory, sub_relative, rules),
+                ))
@@ -0,0 +1,410 @@
+"""
+# Transdoc / Evaluator
+
+Evaluate the rules used within docstrings.
+"""
+import ast
+import asyncio
+import inspect
+import re
+from dataclasses import dataclass
+from functools import lru_cache, partial
+from types import CodeType
+from typing import Any, Awaitable, Callable, NamedTuple, Optional, Union
+
+from .__rule import Rule
+from .__scanner import LineIndex, RuleMarker, substitute_rules
+from .errors import TransdocNameError, TransdocSyntaxError
+
+
+def indent_by(amount: int, string: str) -> str:
+    return '\n'.join(
+        [f"{' ' * amount}{line.rstrip()}" for line in string.splitlines()]
+    ).lstrip()
+
+
+DEFAULT_CONCURRENCY = 16
+"""Default maximum number of async rules to evaluate at once"""
+
+PLACEHOLDER = re.compile("\0([0-9]+)\0")
+"""
+Placeholder for the result of a rule which hasn't been evaluated yet. Null
+characters can't appear within valid Python source code, so these never
+clash with the original code.
+"""
+
+PLAN_CACHE_SIZE = 4096
+"""Maximum number of compiled rule expressions to keep"""
+
+LITERAL_TYPES = (str, bytes, int, float, complex, bool, type(None))
+
+
+class CallPlan(NamedTuple):
+    """
+    Plan for evaluating a rule expression using the function call syntax.
+
+    If all arguments are literals, the rule is called directly using `args`
+    and `kwargs`, and `code` is `None`. Otherwise, `code` is the compiled
+    expression, which is evaluated with the rules as its globals.
+    """
+    name: str
+    args: tuple[Any, ...]
+    kwargs: dict[str, Any]
+    code: Optional[CodeType]
+
+
+def is_literal(value: Any) -> bool:
+    """
+    Returns whether the given value is an immutable literal, meaning it can
+    safely be shared between many calls to a rule.
+    """
+    if isinstance(value, tuple):
+        return all(is_literal(item) for item in value)
+    return isinstance(value, LITERAL_TYPES)
+
+
+def literal_value(node: ast.expr) -> Any:
+    """
+    Returns the value of the given node if it is an immutable literal,
+    otherwise raising a `ValueError`.
+    """
+    value = ast.literal_eval(node)
+    if not is_literal(value):
+        raise ValueError("Value is mutable")
+    return value
+
+
+@lru_cache(PLAN_CACHE_SIZE)
+def compile_rule(rule: str) -> CallPlan:
+    """
+    Compile a rule expression using the function call syntax into a plan for
+    evaluating it. Results are cached, so that each unique expression is
+    only parsed once.
+
+    Raises a `SyntaxError` if the expression is invalid.
+    """
+    tree = ast.parse(rule.strip(), "<rule>", mode="eval")
+    call = tree.body
+    if isinstance(call, ast.Call) and isinstance(call.func, ast.Name):
+        try:
+            args = tuple(literal_value(arg) for arg in call.args)
+            kwargs = {}
+            for keyword in call.keywords:
+                if keyword.arg is None:
+                    # `**kwargs` unpacking
+                    raise ValueError("Keyword unpacking")
+                kwargs[keyword.arg] = literal_value(keyword.value)
+        except ValueError:
+            pass
+        else:
+            return CallPlan(call.func.id, args, kwargs, None)
+    return CallPlan(
+        rule.split('(')[0],
+        (),
+        {},
+        compile(tree, "<rule>", "eval"),
+    )
+
+
+def close_awaitable(awaitable: Awaitable[Any]) -> None:
+    """
+    Close an awaitable which will never be awaited, to avoid warnings about
+    it never being awaited.
+    """
+    close = getattr(awaitable, "close", None)
+    if close is not None:
+        close()
+
+
+def literal_call(
+    rule: str,
+) -> Optional[tuple[str, tuple[Any, ...], dict[str, Any]]]:
+    """
+    Returns the name of the rule called by the given rule expression, along
+    with its arguments and keyword arguments, if they are all literals.
+    Returns `None` if the expression must be evaluated to call the rule.
+    """
+    if rule.isidentifier():
+        return rule, (), {}
+    if rule.split('[')[0].isidentifier() and rule.endswith(']'):
+        rule_name, *content = rule.split('[')
+        return rule_name, ('['.join(content).removesuffix(']'),), {}
+    if rule.split('(')[0].isidentifier() and rule.endswith(')'):
+        try:
+            plan = compile_rule(rule)
+        except SyntaxError:
+            return None
+        if plan.code is None:
+            return plan.name, plan.args, plan.kwargs
+    return None
+
+
+@dataclass(frozen=True)
+class Deferred:
+    """
+    Rule expression which hasn't been evaluated yet, since its evaluation
+    was deferred (see `RuleEvaluator`).
+    """
+    rule: str
+
+
+ErrorReporter = Callable[[tuple[int, int], Exception], None]
+"""
+Callback used to report errors within a docstring, given the offset of the
+error from the start of the string as a `(line, column)` pair.
+"""
+
+
+@dataclass
+class Invocation:
+    """
+    Use of a rule within a docstring, whose result isn't known yet, or which
+    produced an error.
+    """
+    indent: int
+    """Indentation level to apply to the result"""
+    report_error: Callable[[Exception], None]
+    """Report an error at the location of the rule"""
+    result: Union[str, Exception, Awaitable[Any], Deferred]
+    """
+    Result of the rule. This is an awaitable if it hasn't been evaluated yet
+    (ie the rule is an async function), or `Deferred` if its evaluation was
+    deferred.
+    """
+
+
+class RuleEvaluator:
+    """
+    Evaluate the rules within docstrings.
+
+    Rules are evaluated as docstrings are processed. If a rule is an async
+    function, a placeholder is left in its place, and its result is
+    substituted once all pending rules are evaluated using `run_pending` or
+    `await_pending`. Errors are reported in the order they appear when
+    calling `substitute`.
+
+    If `defer` is given, no rules are evaluated while processing docstrings.
+    Instead, every rule is left as a placeholder, so that the `deferred`
+    invocations can be evaluated together (eg by `evaluate_deferred`).
+    """
+
+    def __init__(self, rules: dict[str, Rule], *, defer: bool = False) -> None:
+        """
+        Create a rule evaluator, using the given set of rules
+        """
+        self.__rules = rules
+        self.__defer = defer
+        self.__namespace: Optional[dict[str, Any]] = None
+        self.__invocations: list[Invocation] = []
+        self.__num_pending = 0
+
+    def __check_rule_known(self, rule_name: str) -> None:
+        """
+        Ensure a rule is known, and raise an error if it is not.
+        """
+        if rule_name not in self.__rules:
+            raise TransdocNameError(f"unknown rule '{rule_name}'")
+
+    def call_rule(self, rule: str) -> Union[str, Awaitable[str]]:
+        """
+        Execute a command, alongside the given set of rules, returning its
+        result, which may need to be awaited if the rule is async.
+
+        Any errors produced by the rule are raised to the caller.
+        """
+        # if it's just a function name, evaluate it as a call with no arguments
+        if rule.isidentifier():
+            self.__check_rule_known(rule)
+            return self.__rules[rule]()
+        # If it uses square brackets, then extract the contained string, and
+        # pass that
+        if rule.split('[')[0].isidentifier() and rule.endswith(']'):
+            rule_name, *content = rule.split('[')
+            content_str = '['.join(content).removesuffix(']')
+            self.__check_rule_known(rule_name)
+            return self.__rules[rule_name](content_str)
+        # Otherwise, it should be a regular function call
+        # This calls `eval` with the rules dictionary set as the globals, since
+        # otherwise it'd just be too complex to parse things.
+        if rule.split('(')[0].isidentifier() and rule.endswith(')'):
+            self.__check_rule_known(rule.split('(')[0])
+            return self.__eval_call(rule)
+
+        # If we reach this point, it's not valid data, and we should give an
+        # error
+        raise TransdocSyntaxError(
+            "unable to evaluate rule due to invalid syntax"
+        )
+
+    def eval_rule(self, rule: str, indent: int) -> str:
+        """
+        Execute a command, alongside the given set of rules, indenting its
+        result.
+
+        Any errors produced by the rule are raised to the caller. The rule
+        must not be async.
+        """
+        result = self.call_rule(rule)
+        if inspect.isawaitable(result):
+            close_awaitable(result)
+            raise TypeError(f"rule '{rule}' is async, and must be awaited")
+        return indent_by(indent, result)
+
+    def __eval_call(self, rule: str) -> Union[str, Awaitable[str]]:
+        """
+        Evaluate a rule using the function call syntax.
+        """
+        plan = compile_rule(rule)
+        if plan.code is None:
+            # Only literal arguments, so we can call the rule directly
+            return self.__rules[plan.name](*plan.args, **plan.kwargs)
+        # Evaluate the expression using a copy of the rules, so that `eval`
+        # doesn't add `__builtins__` to them
+        if self.__namespace is None:
+            self.__namespace = dict(self.__rules)
+        return eval(plan.code, self.__namespace)
+
+    def process_docstring(
+        self,
+        docstring: str,
+        indent: int,
+        report_error: ErrorReporter,
+    ) -> str:
+        """
+        Process the given docstring (excluding its triple-quotes), replacing
+        each rule with its result, or a placeholder if its result is pending.
+
+        Errors are reported using `report_error` when `substitute` is called,
+        with their offsets relative to the start of the string including its
+        quotes.
+        """
+        # Only needed for error reporting, so only build it if required
+        line_index: Optional[LineIndex] = None
+
+        def report_marker_error(marker: RuleMarker, error: Exception) -> None:
+            nonlocal line_index
+            if line_index is None:
+                line_index = LineIndex(docstring)
+            line, column = line_index.position(marker.rule_start)
+            if not line:
+                # Account for stripped out triple-quotes
+                column += 3
+            report_error((line, column), error)
+
+        def evaluate(marker: RuleMarker) -> str:
+            result: Union[str, Awaitable[str], Deferred]
+            try:
+                if marker.rule is None:
+                    raise TransdocSyntaxError(
+                        "unfinished command: are you missing a closing '}}'?"
+                    )
+                if self.__defer:
+                    result = Deferred(marker.rule)
+                else:
+                    result = self.call_rule(marker.rule)
+                if not (
+                    isinstance(result, Deferred)
+                    or inspect.isawaitable(result)
+                ):
+                    return indent_by(indent, result)
+            except Exception as e:
+                self.__invocations.append(Invocation(
+                    indent,
+                    partial(report_marker_error, marker),
+                    e,
+                ))
+                return ""
+            # Evaluate it later
+            self.__invocations.append(Invocation(
+                indent,
+                partial(report_marker_error, marker),
+                result,
+            ))
+            self.__num_pending += 1
+            return f"\0{len(self.__invocations) - 1}\0"
+
+        return substitute_rules(docstring, evaluate)
+
+    def deferred(self) -> list[Invocation]:
+        """
+        Returns the invocations whose evaluation was deferred. Their results
+        must be set before calling `substitute`.
+        """
+        return [
+            invocation
+            for invocation in self.__invocations
+            if isinstance(invocation.result, Deferred)
+        ]
+
+    def __pending(self) -> list[Invocation]:
+        return [
+            invocation
+            for invocation in self.__invocations
+            if inspect.isawaitable(invocation.result)
+        ]
+
+    async def await_pending(self, limiter: asyncio.Semaphore) -> None:
+        """
+        Concurrently evaluate all pending rules, limiting the number that
+        are evaluated at once using the given `limiter`.
+        """
+        async def evaluate(invocation: Invocation) -> None:
+            assert inspect.isawaitable(invocation.result)
+            async with limiter:
+                try:
+                    invocation.result = await invocation.result
+                except Exception as e:
+                    invocation.result = e
+
+        await asyncio.gather(*map(evaluate, self.__pending()))
+
+    def run_pending(self, concurrency: int = DEFAULT_CONCURRENCY) -> None:
+        """
+        Concurrently evaluate all pending rules using a new event loop, with
+        at most `concurrency` rules evaluated at once.
+
+        Raises a `RuntimeError` if called while an event loop is already
+        running in this thread.
+        """
+        if not self.__num_pending:
+            return
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            pass
+        else:
+            for invocation in self.__invocations:
+                if inspect.isawaitable(invocation.result):
+                    close_awaitable(invocation.result)
+            raise RuntimeError(
+                "Async rules can't be evaluated by `transform` while an event "
+                "loop is running. Use `transform_async` instead."
+            )
+
+        async def run() -> None:
+            await self.await_pending(asyncio.Semaphore(concurrency))
+
+        asyncio.run(run())
+
+    def substitute(self, processed: str) -> str:
+        """
+        Report any errors, then substitute the results of pending rules into
+        the given processed code.
+        """
+        results: list[str] = []
+        for invocation in self.__invocations:
+            result = invocation.result
+            try:
+                if isinstance(result, Exception):
+                    raise result
+                assert not (
+                    isinstance(result, Deferred)
+                    or inspect.isawaitable(result)
+                ), "Rule not evaluated"
+                results.append(indent_by(invocation.indent, result))
+            except Exception as e:
+                invocation.report_error(e)
+                results.append("")
+        if not self.__num_pending:
+            return processed
+        return PLACEHOLDER.sub(lambda m: results[int(m[1])], processed)
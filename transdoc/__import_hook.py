@@ -0,0 +1,277 @@
+"""
+# Transdoc / Import hook
+
+Transform modules as they are imported, rather than using a build step.
+"""
+import hashlib
+import importlib.util
+import marshal
+import struct
+import sys
+from importlib.abc import MetaPathFinder
+from importlib.machinery import ModuleSpec, PathFinder, SourceFileLoader
+from pathlib import Path
+from types import CodeType, ModuleType
+from typing import Iterable, Optional, Sequence, Union
+
+from .__cache import RuleCache
+from .__collect_rules import collect_rules
+from .__persistent_cache import fingerprint_rule
+from .__processor import format_transformation_error, load_rule_file
+from .__rule import Rule
+from .__transformer import (
+    DocstringMode,
+    Engine,
+    make_rules_dict,
+    normalize_rules,
+    transform,
+)
+from .errors import TransdocTransformationError
+
+
+def fingerprint_rules(rules: dict[str, Rule]) -> Optional[str]:
+    """
+    Returns a fingerprint of the given rules, which changes whenever any of
+    their source code changes, or `None` if the source code of any rule is
+    unavailable.
+    """
+    digest = hashlib.sha256()
+    for name, rule in sorted(rules.items()):
+        fingerprint = fingerprint_rule(rule)
+        if fingerprint is None:
+            return None
+        digest.update(f"{name}:{fingerprint}\n".encode())
+    return digest.hexdigest()
+
+
+class TransdocLoader(SourceFileLoader):
+    """
+    Loader which transforms the source code of modules before compiling
+    them.
+
+    Bytecode is cached alongside the regular bytecode in `__pycache__`, using
+    an optimization tag including a fingerprint of the rules (eg
+    `module.cpython-311.opt-transdoc0p0a1b2c3d4e5f6a7b8.pyc`), so that it
+    doesn't conflict with untransformed bytecode, and is invalidated when
+    the rules change.
+    """
+
+    def __init__(
+        self,
+        fullname: str,
+        path: str,
+        finder: 'TransdocFinder',
+    ) -> None:
+        super().__init__(fullname, path)
+        self.finder = finder
+
+    def cache_path(self, source_path: str) -> Optional[str]:
+        """
+        Returns the path where the bytecode for the given source is cached,
+        or `None` if it can't be cached.
+        """
+        tag = self.finder.cache_tag
+        if tag is None:
+            return None
+        try:
+            return importlib.util.cache_from_source(
+                source_path,
+                optimization=tag,
+            )
+        except NotImplementedError:
+            return None
+
+    def get_code(self, fullname: str) -> CodeType:
+        source_path = self.get_filename(fullname)
+        bytecode_path = self.cache_path(source_path)
+        stats = self.path_stats(source_path)
+        header = (
+            importlib.util.MAGIC_NUMBER
+            + struct.pack(
+                "<III",
+                0,  # Flags: validated using the timestamp
+                int(stats["mtime"]) & 0xFFFFFFFF,
+                stats["size"] & 0xFFFFFFFF,
+            )
+        )
+
+        if bytecode_path is not None:
+            try:
+                data = self.get_data(bytecode_path)
+            except OSError:
+                pass
+            else:
+                if data[:16] == header:
+                    return marshal.loads(data[16:])
+
+        source = importlib.util.decode_source(self.get_data(source_path))
+        try:
+            transformed = self.finder.transform(source)
+        except TransdocTransformationError as e:
+            raise ImportError(
+                format_transformation_error(Path(source_path), e),
+                name=fullname,
+                path=source_path,
+            ) from e
+        code = compile(transformed, source_path, "exec", dont_inherit=True)
+
+        if bytecode_path is not None and not sys.dont_write_bytecode:
+            try:
+                self.set_data(bytecode_path, header + marshal.dumps(code))
+            except NotImplementedError:
+                pass
+        return code
+
+
+class TransdocFinder(MetaPathFinder):
+    """
+    Finder which transforms the modules within the given packages as they
+    are imported. Use `install_import_hook` to create one.
+    """
+
+    def __init__(
+        self,
+        rules: dict[str, Rule],
+        packages: Iterable[str],
+        *,
+        engine: Engine = "libcst",
+        docstrings: DocstringMode = "precise",
+        cache: Optional[RuleCache] = None,
+    ) -> None:
+        self.packages = tuple(packages)
+        """Packages whose modules are transformed"""
+        self.engine: Engine = engine
+        self.docstrings: DocstringMode = docstrings
+        fingerprint = fingerprint_rules(rules)
+        self.cache_tag = (
+            None
+            if fingerprint is None
+            # Bytecode depends on the optimization level and the docstring
+            # mode too
+            else (
+                f"transdoc{sys.flags.optimize}{docstrings[0]}"
+                f"{fingerprint[:16]}"
+            )
+        )
+        """
+        Optimization tag used when caching bytecode, or `None` if bytecode
+        can't be cached because the rules' source code is unavailable
+        """
+        self.rules = normalize_rules(
+            rules,
+            RuleCache() if cache is None else cache,
+        )
+
+    def matches(self, fullname: str) -> bool:
+        """
+        Returns whether the module with the given name should be
+        transformed.
+        """
+        return any(
+            fullname == package or fullname.startswith(package + ".")
+            for package in self.packages
+        )
+
+    def transform(self, source: str) -> str:
+        """
+        Transform the source code of a module.
+        """
+        return transform(
+            source,
+            self.rules,
+            engine=self.engine,
+            docstrings=self.docstrings,
+        )
+
+    def find_spec(
+        self,
+        fullname: str,
+        path: Optional[Sequence[str]],
+        target: Optional[ModuleType] = None,
+    ) -> Optional[ModuleSpec]:
+        if not self.matches(fullname):
+            return None
+        spec = PathFinder.find_spec(fullname, path, target)
+        if (
+            spec is None
+            or not isinstance(spec.loader, SourceFileLoader)
+            or spec.origin is None
+        ):
+            return spec
+        loader = TransdocLoader(fullname, spec.origin, self)
+        spec.loader = loader
+        spec.cached = loader.cache_path(spec.origin)
+        return spec
+
+    def uninstall(self) -> None:
+        """
+        Remove this finder from `sys.meta_path`. Modules which were already
+        imported remain transformed.
+        """
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+
+def install_import_hook(
+    rules: Union[Path, list[Rule], dict[str, Rule], ModuleType],
+    packages: Iterable[str],
+    *,
+    engine: Engine = "libcst",
+    docstrings: DocstringMode = "precise",
+    cache: Optional[RuleCache] = None,
+) -> TransdocFinder:
+    """
+    Transform the modules within the given packages as they are imported,
+    so that no build step is needed during development.
+
+    ```py
+    import transdoc
+    transdoc.install_import_hook(Path("rules.py"), ["my_package"])
+
+    import my_package
+    ```
+
+    The transformed bytecode is cached in `__pycache__`, under a tag that
+    includes a fingerprint of the rules, so only the first import of each
+    module after it or the rules change is transformed. If the source code
+    of any rule is unavailable, bytecode isn't cached.
+
+    ## Args
+
+    * `rules` (`Path | list[Rule] | dict[str, Rule] | ModuleType`): path to a
+      rule file, or the rules to use (as accepted by `transform`).
+
+    * `packages` (`Iterable[str]`): names of the packages (or modules) to
+      transform, including all of their submodules.
+
+    ## Keyword args
+
+    * `engine` (`"libcst" | "tokenize"`, optional): engine used to transform
+      modules (see `transform`).
+
+    * `docstrings` (`"precise" | "all"`, optional): which strings are
+      processed (see `transform`).
+
+    * `cache` (`RuleCache`, optional): cache used to store the results of
+      pure rules. If not given, a new cache is used.
+
+    ## Returns
+
+    * `TransdocFinder`: the finder which was installed. Use its `uninstall`
+      method to stop transforming modules.
+    """
+    if isinstance(rules, Path):
+        rules = load_rule_file(rules)
+    if isinstance(rules, ModuleType):
+        rules = collect_rules(rules)
+    elif isinstance(rules, list):
+        rules = make_rules_dict(rules)
+    finder = TransdocFinder(
+        rules,
+        packages,
+        engine=engine,
+        docstrings=docstrings,
+        cache=cache,
+    )
+    sys.meta_path.insert(0, finder)
+    return finder
@@ -7,11 +7,74 @@ Python function calls.
 __all__ = [
     '__version__',
     'main',
+    'main_async',
+    'process_iter',
+    'ProcessResult',
+    'install_import_hook',
     'transform',
+    'transform_async',
+    'transform_many',
+    'TransformResult',
     'Rule',
+    'RuleCache',
+    'pure',
+    'batch',
+    'Stats',
 ]
 
+from importlib import import_module
+from typing import TYPE_CHECKING, Any
+
 from .__consts import VERSION as __version__
-from .__transformer import transform
-from .__rule import Rule
-from .__processor import main
+
+if TYPE_CHECKING:
+    from .__transformer import (
+        TransformResult,
+        transform,
+        transform_async,
+        transform_many,
+    )
+    from .__rule import Rule
+    from .__cache import RuleCache, pure
+    from .__batch import batch
+    from .__stats import Stats
+    from .__processor import ProcessResult, main, main_async, process_iter
+    from .__import_hook import install_import_hook
+
+
+# Importing the transformer and processor is slow (they import asyncio,
+# sqlite3, concurrent.futures, etc), but rule modules commonly import
+# `transdoc.rules`, so the public API is imported on first use (PEP 562)
+_LAZY_ATTRIBUTES = {
+    'main': '__processor',
+    'main_async': '__processor',
+    'process_iter': '__processor',
+    'ProcessResult': '__processor',
+    'install_import_hook': '__import_hook',
+    'transform': '__transformer',
+    'transform_async': '__transformer',
+    'transform_many': '__transformer',
+    'TransformResult': '__transformer',
+    'Rule': '__rule',
+    'RuleCache': '__cache',
+    'pure': '__cache',
+    'batch': '__batch',
+    'Stats': '__stats',
+}
+
+
+def __getattr__(name: str) -> Any:
+    try:
+        module = _LAZY_ATTRIBUTES[name]
+    except KeyError:
+        raise AttributeError(
+            f"module {__name__!r} has no attribute {name!r}"
+        ) from None
+    value = getattr(import_module(f"{__name__}.{module}"), name)
+    # Store the value so that `__getattr__` isn't needed next time
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list[str]:
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,262 @@
+"""
+# Transdoc / libcst engine
+
+Use libcst to rewrite docstrings.
+"""
+from functools import partial
+from typing import TYPE_CHECKING, Callable, Optional, Mapping, Sequence
+import libcst as cst
+from libcst.metadata import (
+    CodePosition,
+    CodeRange,
+    PositionProvider,
+    MetadataWrapper,
+)
+
+from .__evaluator import RuleEvaluator
+from .__stats import Stats, time_phase
+from .errors import TransformErrorInfo
+
+if TYPE_CHECKING:
+    from .__transformer import DocstringMode
+
+
+class DocTransformer(cst.CSTTransformer):
+    """
+    Rewrite documentation.
+
+    Node positions are only calculated when they are actually required,
+    since resolving them requires an additional pass over the entire tree.
+    For docstrings, the indentation level is determined from the enclosing
+    blocks, and for errors, positions are resolved once the transformation is
+    complete. This means that successful transformations of docstrings never
+    need to build the position map.
+    """
+
+    def __init__(
+        self,
+        evaluator: RuleEvaluator,
+        module: cst.Module,
+        docstrings: 'DocstringMode' = "precise",
+    ) -> None:
+        """
+        Create an instance of the doc transformer module, which processes
+        docstrings using the given evaluator.
+
+        The given `module` must be the module that this transformer is used
+        to visit, so that positions can be resolved when they are required.
+
+        `docstrings` determines which strings are processed (see
+        `DocstringMode`).
+        """
+        self.__evaluator = evaluator
+        self.__module = module
+        self.__precise = docstrings == "precise"
+        self.__docstrings: set[cst.SimpleString] = set()
+        """Strings which are docstrings, when using precise mode"""
+        self.__positions: Optional[Mapping[cst.CSTNode, CodeRange]] = None
+        self.__errors: list[tuple[cst.CSTNode, tuple[int, int], Exception]] \
+            = []
+        self.__indents: list[int] = [0]
+        """Indentation level of each block we are currently within"""
+        self.__line_start_expr: Optional[cst.BaseExpression] = None
+        """
+        Expression at the start of the current simple statement line, whose
+        position matches the indentation level of the line
+        """
+
+    def get_errors(self) -> list[TransformErrorInfo]:
+        return [
+            TransformErrorInfo(self.__get_position(node, offset), error)
+            for node, offset, error in self.__errors
+        ]
+
+    def __get_positions(self) -> Mapping[cst.CSTNode, CodeRange]:
+        """
+        Returns the mapping of nodes to positions, calculating it if required.
+        """
+        if self.__positions is None:
+            # The module isn't modified while we visit it, so we can skip
+            # copying it, which also means the node identities match
+            self.__positions = MetadataWrapper(
+                self.__module,
+                unsafe_skip_copy=True,
+            ).resolve(PositionProvider)
+        return self.__positions
+
+    def __get_position(
+        self,
+        node: cst.CSTNode,
+        offset: Optional[tuple[int, int]] = None,
+    ) -> CodePosition:
+        """
+        Returns the position of the given node, for use with error reporting.
+        """
+        position = self.__get_positions()[node].start
+
+        if offset is not None:
+            line, column = offset
+
+            if line:
+                new_line = position.line + line
+                new_col = column
+            else:
+                new_line = position.line
+                new_col = position.column + column
+
+            position = CodePosition(new_line, new_col)
+
+        return position
+
+    def __get_indent(self, node: cst.CSTNode) -> int:
+        """
+        Returns the indentation level to use for rules expanded within the
+        given string node.
+
+        This is the column at which the string starts. For strings at the
+        start of a line, such as docstrings, this is determined from the
+        indentation of the enclosing blocks, and otherwise the node's position
+        is used.
+        """
+        if node is self.__line_start_expr:
+            return self.__indents[-1]
+        return self.__get_position(node).column
+
+    def __report_error(
+        self,
+        node: cst.CSTNode,
+        offset: tuple[int, int],
+        error_info: Exception,
+    ):
+        """
+        Report an error at the given offset from the start of the given node.
+        """
+        self.__errors.append((node, offset, error_info))
+
+    def __find_docstrings(
+        self,
+        statements: Sequence[cst.CSTNode],
+        first_is_docstring: bool,
+    ) -> None:
+        """
+        Find the docstrings within the given sequence of statements. These
+        are string expression statements which either come first (if
+        `first_is_docstring` is given), or immediately follow an assignment.
+        """
+        if not self.__precise:
+            return
+        is_docstring = first_is_docstring
+        for statement in statements:
+            if isinstance(statement, cst.SimpleStatementLine):
+                small_statements: Sequence[cst.CSTNode] = statement.body
+            else:
+                small_statements = [statement]
+            for small in small_statements:
+                if (
+                    is_docstring
+                    and isinstance(small, cst.Expr)
+                    and isinstance(small.value, cst.SimpleString)
+                    and not small.value.lpar
+                ):
+                    self.__docstrings.add(small.value)
+                is_docstring = isinstance(small, (cst.Assign, cst.AnnAssign))
+
+    def visit_Module(self, node: cst.Module) -> None:
+        self.__find_docstrings(node.body, True)
+
+    def visit_ClassDef(self, node: cst.ClassDef) -> None:
+        self.__find_docstrings(node.body.body, True)
+
+    def visit_FunctionDef(self, node: cst.FunctionDef) -> None:
+        self.__find_docstrings(node.body.body, True)
+
+    def visit_SimpleStatementSuite(
+        self,
+        node: cst.SimpleStatementSuite,
+    ) -> None:
+        self.__find_docstrings(node.body, False)
+
+    def visit_IndentedBlock(self, node: cst.IndentedBlock) -> None:
+        self.__find_docstrings(node.body, False)
+        indent = node.indent
+        if indent is None:
+            indent = self.__module.default_indent
+        self.__indents.append(self.__indents[-1] + len(indent))
+
+    def leave_IndentedBlock(
+        self,
+        original_node: cst.IndentedBlock,
+        updated_node: cst.IndentedBlock,
+    ) -> cst.BaseSuite:
+        self.__indents.pop()
+        return updated_node
+
+    def visit_SimpleStatementLine(
+        self,
+        node: cst.SimpleStatementLine,
+    ) -> None:
+        first_statement = node.body[0]
+        # Parenthesized strings don't start at the start of the line
+        if (
+            isinstance(first_statement, cst.Expr)
+            and not first_statement.value.lpar
+        ):
+            self.__line_start_expr = first_statement.value
+        else:
+            self.__line_start_expr = None
+
+    def leave_SimpleString(
+        self,
+        original_node: cst.SimpleString,
+        updated_node: cst.SimpleString,
+    ) -> cst.BaseExpression:
+        """
+        After visiting a string, check if it is a docstring. If so, apply
+        formatting to it.
+
+        In precise mode, only module, class and function docstrings, and
+        attribute docstrings are processed. Otherwise, all triple-quoted
+        strings are treated as docstrings.
+        """
+        if self.__precise and original_node not in self.__docstrings:
+            return updated_node
+        string = original_node.value
+        if string.startswith('"""') or string.startswith("'''"):
+            quote_type = string[0:3]
+
+            processed = self.__evaluator.process_docstring(
+                updated_node.value[3:-3],
+                self.__get_indent(original_node),
+                partial(self.__report_error, original_node),
+            )
+
+            return updated_node.with_changes(
+                value=f"{quote_type}{processed}{quote_type}"
+            )
+
+        return updated_node
+
+
+def libcst_rewrite(
+    source: str,
+    evaluator: RuleEvaluator,
+    stats: Optional[Stats] = None,
+    docstrings: 'DocstringMode' = "precise",
+) -> tuple[str, Callable[[], list[TransformErrorInfo]]]:
+    """
+    Rewrite the docstrings within the given Python source code using libcst,
+    processing them using the given evaluator, and recording the time spent
+    in each phase using the given stats, if any. `docstrings` determines
+    which strings are processed (see `DocstringMode`).
+
+    Returns the rewritten code, along with a function which returns any
+    errors, which must be called after the evaluator reports its errors.
+    """
+    with time_phase(stats, "parse"):
+        module = cst.parse_module(source)
+    transformer = DocTransformer(evaluator, module, docstrings)
+    with time_phase(stats, "scan"):
+        updated_cst = module.visit(transformer)
+    with time_phase(stats, "codegen"):
+        code = updated_cst.code
+    return code, transformer.get_errors
@@ -0,0 +1,206 @@
+"""
+# Transdoc / Manifest
+
+Manifest of the files within an output directory, used to perform
+incremental builds.
+"""
+import hashlib
+import json
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Optional
+
+from transdoc.__consts import VERSION
+
+
+MANIFEST_FILE = ".transdoc-manifest.json"
+"""Name of the manifest file, stored within the output directory"""
+
+HASH_CHUNK_SIZE = 1 << 16
+"""Number of bytes to read at a time when hashing files"""
+
+
+def hash_file(path: Path) -> str:
+    """
+    Returns the SHA-256 hash of the contents of the given file.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@dataclass(frozen=True)
+class FileRecord:
+    """
+    Record of an input file, as of when its output was produced.
+    """
+    hash: str
+    size: int
+    mtime_ns: int
+
+    @staticmethod
+    def from_file(
+        path: Path,
+        previous: Optional['FileRecord'] = None,
+    ) -> 'FileRecord':
+        """
+        Create a record for the given file.
+
+        If the file's size and modification time match the `previous` record,
+        its contents are assumed to be unchanged, and it is not hashed again.
+        """
+        stat = path.stat()
+        if (
+            previous is not None
+            and previous.size == stat.st_size
+            and previous.mtime_ns == stat.st_mtime_ns
+        ):
+            return previous
+        return FileRecord(hash_file(path), stat.st_size, stat.st_mtime_ns)
+
+
+@dataclass
+class Manifest:
+    """
+    Manifest of the files within an output directory.
+    """
+    rules_hash: str
+    """Hash of the rule file used to produce the outputs"""
+    files: dict[str, FileRecord]
+    """
+    Mapping of input paths (relative to the input directory) to records of
+    the inputs used to produce their outputs
+    """
+    options: dict[str, str] = field(default_factory=dict)
+    """
+    Options which affect the outputs, such as the transformation engine and
+    docstring mode
+    """
+    version: str = VERSION
+    """Version of Transdoc used to produce the outputs"""
+
+    @staticmethod
+    def load(output: Path) -> Optional['Manifest']:
+        """
+        Load the manifest from the given output directory, returning `None`
+        if there is no valid manifest.
+        """
+        try:
+            with open(output.joinpath(MANIFEST_FILE), encoding="utf-8") as f:
+                data = json.load(f)
+            return Manifest(
+                data["rules_hash"],
+                {
+                    name: FileRecord(**record)
+                    for name, record in data["files"].items()
+                },
+                # Manifests from older versions don't record options
+                data.get("options", {}),
+                data["version"],
+            )
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def save(self, output: Path) -> None:
+        """
+        Save the manifest into the given output directory.
+        """
+        output.mkdir(parents=True, exist_ok=True)
+        with open(output.joinpath(MANIFEST_FILE), "w", encoding="utf-8") as f:
+            json.dump(asdict(self), f, indent=2, sort_keys=True)
+
+    def is_compatible(self, rules_hash: str, options: dict[str, str]) -> bool:
+        """
+        Returns whether outputs described by this manifest can be reused
+        given the hash of the current rule file, and the current options.
+        """
+        return (
+            self.version == VERSION
+            and self.rules_hash == rules_hash
+            and self.options == options
+        )
+
+
+class IncrementalBuild:
+    """
+    Determine which files need to be processed during an incremental build,
+    and record the results in a new manifest.
+    """
+
+    def __init__(
+        self,
+        input: Path,
+        output: Path,
+        rule_file: Path,
+        options: dict[str, str],
+    ) -> None:
+        """
+        Prepare an incremental build from the `input` directory into the
+        `output` directory, using the given `options`, which are any options
+        that affect the outputs.
+
+        If there is no valid manifest in the output directory, or if it was
+        produced using a different rule file, different options or a
+        different version of Transdoc, `full_rebuild` is set, and all files
+        are considered to be out of date.
+        """
+        self.__input = input
+        self.__output = output
+        self.__rules_hash = hash_file(rule_file)
+        self.__options = options
+        previous = Manifest.load(output)
+        self.full_rebuild = (
+            previous is None
+            or not previous.is_compatible(self.__rules_hash, options)
+        )
+        self.__previous: dict[str, FileRecord] = (
+            {} if previous is None or self.full_rebuild else previous.files
+        )
+        self.__records: dict[str, FileRecord] = {}
+
+    def __name(self, input_file: Path) -> str:
+        return input_file.relative_to(self.__input).as_posix()
+
+    def is_up_to_date(self, input_file: Path, output_file: Path) -> bool:
+        """
+        Record the given input file, returning whether its output is already
+        up to date.
+        """
+        name = self.__name(input_file)
+        previous = self.__previous.get(name)
+        record = FileRecord.from_file(input_file, previous)
+        self.__records[name] = record
+        return (
+            previous is not None
+            and previous.hash == record.hash
+            and output_file.exists()
+        )
+
+    def failed(self, input_file: Path) -> None:
+        """
+        Record that the given input file failed to be processed, so that it
+        is processed again during the next build.
+        """
+        self.__records.pop(self.__name(input_file), None)
+
+    def removed_outputs(self) -> list[Path]:
+        """
+        Returns the outputs of all previous inputs that were not recorded
+        during this build.
+        """
+        return [
+            self.__output.joinpath(name)
+            for name in self.__previous.keys() - self.__records.keys()
+        ]
+
+    def save(self) -> None:
+        """
+        Save the manifest describing this build.
+        """
+        Manifest(
+            self.__rules_hash,
+            self.__records,
+            self.__options,
+        ).save(self.__output)
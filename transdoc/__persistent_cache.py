@@ -0,0 +1,266 @@
+"""
+# Transdoc / Persistent cache
+
+On-disk cache of the results of rules, so that expensive rules don't need to
+be evaluated again in later runs.
+"""
+import hashlib
+import inspect
+import os
+import sqlite3
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Optional
+
+from .__consts import VERSION
+from .__evaluator import is_literal
+from .__rule import Rule
+
+
+DEFAULT_CACHE_DIR = Path(".transdoc_cache")
+"""Default directory in which the persistent cache is stored"""
+
+CACHE_FILE = "cache.sqlite3"
+"""Name of the database file, within the cache directory"""
+
+DEFAULT_MAX_SIZE = 100 * 1024 * 1024
+"""Default maximum total size of cached results, in bytes"""
+
+DEFAULT_MAX_AGE = 30 * 24 * 60 * 60
+"""Default number of seconds results are kept after they were last used"""
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    rule TEXT NOT NULL,
+    result TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL
+)
+"""
+
+
+def fingerprint_rule(rule: Rule) -> Optional[str]:
+    """
+    Returns a fingerprint of the given rule, which changes whenever its
+    source code, or the contents of the module it is defined in, changes.
+
+    Returns `None` if the rule's source code is unavailable, in which case
+    its results can't be safely cached.
+    """
+    try:
+        source = inspect.getsource(rule)
+        source_file = inspect.getsourcefile(rule)
+    except (OSError, TypeError):
+        return None
+    digest = hashlib.sha256()
+    digest.update(VERSION.encode())
+    digest.update(f"{rule.__module__}.{rule.__qualname__}".encode())
+    digest.update(source.encode())
+    if source_file is not None:
+        try:
+            digest.update(Path(source_file).read_bytes())
+        except OSError:
+            return None
+    return digest.hexdigest()
+
+
+@dataclass(frozen=True)
+class PersistentCacheStats:
+    """
+    Statistics about the contents of a persistent cache.
+    """
+    entries: int
+    """Number of cached results"""
+    size: int
+    """Total size of all cached results, in bytes"""
+    rules: dict[str, int]
+    """Number of cached results for each rule"""
+
+
+class PersistentCache:
+    """
+    Cache of the results of rules, stored in an SQLite database so that they
+    can be reused by later runs.
+
+    Results are keyed by the rule's name, its arguments, and a fingerprint of
+    its source code, so that changes to a rule invalidate its results. Only
+    calls where all arguments are immutable literals are cached.
+    """
+
+    def __init__(
+        self,
+        directory: Path = DEFAULT_CACHE_DIR,
+        *,
+        max_size: int = DEFAULT_MAX_SIZE,
+        max_age: float = DEFAULT_MAX_AGE,
+    ) -> None:
+        """
+        Open a persistent cache. The database is created when it is first
+        used.
+
+        ## Args
+
+        * `directory` (`Path`, optional): directory in which the cache is
+          stored. Defaults to `.transdoc_cache`.
+
+        ## Keyword args
+
+        * `max_size` (`int`, optional): maximum total size of cached results
+          in bytes. When evicting, the least recently used results are
+          removed until the cache is below this size.
+
+        * `max_age` (`float`, optional): number of seconds after which unused
+          results are removed when evicting.
+        """
+        self.directory = directory
+        self.max_size = max_size
+        self.max_age = max_age
+        self.__connection: Optional[sqlite3.Connection] = None
+        self.__pid = os.getpid()
+        self.__fingerprints: dict[Rule, Optional[str]] = {}
+
+    def __getstate__(self) -> dict[str, Any]:
+        # Connections can't be shared between processes, and rules may not be
+        # picklable
+        state = self.__dict__.copy()
+        state["_PersistentCache__connection"] = None
+        state["_PersistentCache__fingerprints"] = {}
+        return state
+
+    def __connect(self) -> sqlite3.Connection:
+        if self.__connection is None or self.__pid != os.getpid():
+            # After forking, the parent's connection mustn't be used
+            self.__pid = os.getpid()
+            self.directory.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(
+                self.directory.joinpath(CACHE_FILE),
+                timeout=30,
+                isolation_level=None,
+                # Rule caches may be used by many threads, but serialize their
+                # use of the persistent cache
+                check_same_thread=False,
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(SCHEMA)
+            self.__connection = connection
+        return self.__connection
+
+    def close(self) -> None:
+        """
+        Close the connection to the database.
+        """
+        if self.__connection is not None and self.__pid == os.getpid():
+            self.__connection.close()
+        self.__connection = None
+
+    def __fingerprint(self, rule: Rule) -> Optional[str]:
+        try:
+            return self.__fingerprints[rule]
+        except KeyError:
+            fingerprint = self.__fingerprints[rule] = fingerprint_rule(rule)
+            return fingerprint
+        except TypeError:
+            # Unhashable rule
+            return fingerprint_rule(rule)
+
+    def make_key(
+        self,
+        name: str,
+        rule: Rule,
+        args: tuple[Any, ...],
+        kwargs: dict[str, Any],
+    ) -> Optional[str]:
+        """
+        Returns the key used to store the result of the given rule call, or
+        `None` if it can't be cached.
+        """
+        if not is_literal(args) or not is_literal(tuple(kwargs.values())):
+            return None
+        fingerprint = self.__fingerprint(rule)
+        if fingerprint is None:
+            return None
+        call = repr((name, args, sorted(kwargs.items())))
+        return hashlib.sha256(f"{fingerprint}:{call}".encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Returns the cached result with the given key, if there is one.
+        """
+        connection = self.__connect()
+        row = connection.execute(
+            "SELECT result FROM results WHERE key = ?",
+            (key,),
+        ).fetchone()
+        if row is None:
+            return None
+        connection.execute(
+            "UPDATE results SET accessed = ? WHERE key = ?",
+            (time.time(), key),
+        )
+        return row[0]
+
+    def put(self, key: str, name: str, result: str) -> None:
+        """
+        Store the result of a call to the rule with the given name.
+        """
+        now = time.time()
+        self.__connect().execute(
+            "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)",
+            (key, name, result, len(result.encode()), now, now),
+        )
+
+    def evict(self) -> int:
+        """
+        Remove results which haven't been used within `max_age` seconds,
+        then remove the least recently used results until the total size is
+        below `max_size`.
+
+        Returns the number of results removed.
+        """
+        connection = self.__connect()
+        removed = connection.execute(
+            "DELETE FROM results WHERE accessed < ?",
+            (time.time() - self.max_age,),
+        ).rowcount
+        removed += connection.execute(
+            """
+            DELETE FROM results WHERE key IN (
+                SELECT key FROM (
+                    SELECT
+                        key,
+                        SUM(size) OVER (
+                            ORDER BY accessed DESC, key
+                        ) AS total
+                    FROM results
+                )
+                WHERE total > ?
+            )
+            """,
+            (self.max_size,),
+        ).rowcount
+        return removed
+
+    def stats(self) -> PersistentCacheStats:
+        """
+        Returns statistics about the contents of the cache.
+        """
+        connection = self.__connect()
+        entries, size = connection.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results"
+        ).fetchone()
+        rules = dict(connection.execute(
+            "SELECT rule, COUNT(*) FROM results GROUP BY rule ORDER BY rule"
+        ).fetchall())
+        return PersistentCacheStats(entries, size, rules)
+
+    def clear(self) -> None:
+        """
+        Remove all results from the cache.
+        """
+        connection = self.__connect()
+        connection.execute("DELETE FROM results")
+        connection.execute("VACUUM")
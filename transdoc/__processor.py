@@ -3,21 +3,60 @@
 
 Process an entire file or directory using transdoc.
 """
+import asyncio
 import importlib.util
+import multiprocessing
 import os
 import sys
+import tempfile
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from functools import partial
+from itertools import chain, islice
+from multiprocessing.context import BaseContext
 from shutil import rmtree
 from pathlib import Path
-from dataclasses import dataclass
-from typing import Optional
+from dataclasses import dataclass, replace
+from time import perf_counter
+from typing import (
+    AsyncIterator,
+    Callable,
+    Iterable,
+    Iterator,
+    Literal,
+    Optional,
+    Sequence,
+    TypeVar,
+    Union,
+)
 from types import ModuleType
-from traceback import print_exception
+from traceback import format_exception
 import importlib
 
-from transdoc import transform
+from transdoc.__cache import RuleCache
 from transdoc.__consts import VERSION
-from transdoc.errors import TransdocTransformationError
+from transdoc.__copy import CopyStrategy, copy_file
+from transdoc.errors import TransdocTransformationError, TransformErrorInfo
 from transdoc.__collect_rules import collect_rules
+from transdoc.__discovery import DEFAULT_EXCLUDES, FileFilter
+from transdoc.__manifest import IncrementalBuild, Manifest
+from transdoc.__batch import evaluate_deferred
+from transdoc.__evaluator import DEFAULT_CONCURRENCY, RuleEvaluator
+from transdoc.__rule import Rule
+from transdoc.__stats import Stats, time_phase
+from transdoc.__transformer import (
+    DocstringMode,
+    Engine,
+    finish,
+    may_contain_rules,
+    normalize_rules,
+    rewrite,
+    transform_normalized,
+    transform_with_limiter,
+)
+
+
+T = TypeVar("T")
 
 
 def display_error_list(errors: list[str]) -> int:
@@ -55,61 +94,1040 @@ def load_rule_file(rule_file: Path) -> ModuleType:
     return module
 
 
-def report_transformation_error(
+def format_transformation_error(
     file: Path,
     errors: TransdocTransformationError
-):
-    print(f"!!! {file}", file=sys.stderr)
+) -> str:
+    """
+    Format the given transformation errors into a report.
+    """
+    lines = [f"!!! {file}"]
     for e in errors.args:
         pos = e.position
-        print_exception(e.error_info)
+        lines.append("".join(format_exception(e.error_info)).rstrip())
         err_str = f"{type(e.error_info).__name__}: {e.error_info}"
-        print(
-            f"    {str(pos.line):>4}:{str(pos.column):<3} {err_str}",
-            file=sys.stderr,
-        )
+        lines.append(f"    {str(pos.line):>4}:{str(pos.column):<3} {err_str}")
+    return "\n".join(lines)
 
 
-@dataclass
+def report_transformation_error(
+    file: Path,
+    errors: TransdocTransformationError
+):
+    print(format_transformation_error(file, errors), file=sys.stderr)
+
+
+def remove_output(file: Path, output: Path) -> None:
+    """
+    Remove the given output file, along with any of its parent directories
+    within the `output` directory that are left empty.
+    """
+    file.unlink(missing_ok=True)
+    parent = file.parent
+    while parent != output and parent.is_dir() and not any(parent.iterdir()):
+        parent.rmdir()
+        parent = parent.parent
+
+
+def prune_output(output: Path, keep: set[Path]) -> None:
+    """
+    Remove all files within the `output` directory, other than those in
+    `keep`, along with any directories that are left empty.
+    """
+    for dirpath, dirnames, filenames in os.walk(output, topdown=False):
+        directory = Path(dirpath)
+        for filename in filenames:
+            file = directory.joinpath(filename)
+            if file not in keep:
+                file.unlink()
+        for dirname in dirnames:
+            subdirectory = directory.joinpath(dirname)
+            if subdirectory.is_symlink():
+                subdirectory.unlink()
+            elif subdirectory in keep:
+                # A file needs to be written here
+                rmtree(subdirectory)
+            elif not any(subdirectory.iterdir()):
+                subdirectory.rmdir()
+
+
+@dataclass(slots=True)
 class FileMapping:
+    """
+    Mapping from an input file to the location of its output. Mappings are
+    created for every file within the input, so they use `__slots__` to keep
+    them small.
+    """
     input: Path
     output: Optional[Path]
+    """Location of the output, or `None` if no output is written"""
     transform: bool
+    """Whether the file is a Python file, which is transformed"""
 
 
-def main(
-    input: Path,
+@dataclass
+class FileResult:
+    """
+    Result of processing a single file.
+    """
+    mapping: FileMapping
+    kind: Literal["copied", "unchanged", "transformed"]
+    """
+    How the file was processed:
+
+    * `"copied"`: the file isn't a Python file, so it was copied.
+    * `"unchanged"`: the file contained no rules, so was passed through
+      without being parsed.
+    * `"transformed"`: the file was transformed.
+    """
+    error_report: Optional[str] = None
+    """Report of any errors that occurred when processing the file"""
+
+
+@dataclass
+class ProcessOptions:
+    """
+    Options used when processing files.
+    """
+    dryrun: bool = False
+    """Whether to skip writing output files"""
+    engine: Engine = "libcst"
+    """Engine used to transform Python files (see `transform`)"""
+    docstrings: DocstringMode = "precise"
+    """Which strings are processed as docstrings (see `transform`)"""
+    cache: Optional[RuleCache] = None
+    """Cache used to store the results of rules"""
+    copy_strategy: CopyStrategy = "copy"
+    """How files which aren't transformed are passed through to the output"""
+    concurrency: int = DEFAULT_CONCURRENCY
+    """Maximum number of async rules to evaluate at once"""
+    deduplicate: bool = False
+    """
+    Whether to extract the rules used by all files before evaluating them, so
+    that each unique use of a rule is only evaluated once (see
+    `process_files_deduplicated`)
+    """
+    stats: Optional[Stats] = None
+    """Statistics used to record the time spent processing files"""
+    in_place: bool = False
+    """
+    Whether files are being transformed in place, in which case outputs are
+    written atomically, and only if they differ from the input
+    """
+
+
+def copy_input(mapping: FileMapping, options: ProcessOptions) -> FileResult:
+    """
+    Copy a file which isn't transformed to the output.
+    """
+    if not options.dryrun:
+        assert mapping.output is not None
+        with time_phase(options.stats, "copy"):
+            copy_file(mapping.input, mapping.output, options.copy_strategy)
+    return FileResult(mapping, "copied")
+
+
+def read_input(mapping: FileMapping, options: ProcessOptions) -> str:
+    """
+    Read the contents of a file which is being transformed. Newlines are
+    left untranslated, so that they are kept in the output.
+    """
+    with time_phase(options.stats, "read"):
+        with open(mapping.input, encoding='utf-8', newline="") as read_in:
+            return read_in.read()
+
+
+def file_error(mapping: FileMapping, e: Exception) -> FileResult:
+    """
+    Returns the result for a file which couldn't be read or parsed (eg
+    because it contains a syntax error).
+    """
+    return FileResult(
+        mapping,
+        "transformed",
+        f"!!! {mapping.input}\n    {type(e).__name__}: {e}",
+    )
+
+
+def write_atomic(file: Path, contents: str) -> None:
+    """
+    Replace the contents of the given file atomically, by writing them to a
+    temporary file in the same directory, then renaming it over the file.
+    The file's permissions are preserved. If the file is a symbolic link,
+    the file it links to is replaced, so that the link is kept.
+    """
+    file = Path(os.path.realpath(file))
+    fd, temp = tempfile.mkstemp(
+        prefix=f".{file.name}.",
+        suffix=".tmp",
+        dir=file.parent,
+    )
+    try:
+        with open(fd, "w", encoding='utf-8', newline="") as write_out:
+            write_out.write(contents)
+        os.chmod(temp, os.stat(file).st_mode)
+        os.replace(temp, file)
+    except BaseException:
+        os.unlink(temp)
+        raise
+
+
+def write_output(
+    mapping: FileMapping,
+    result: str,
+    options: ProcessOptions,
+    original: Optional[str] = None,
+) -> None:
+    """
+    Write the result of transforming a file to the output.
+
+    When transforming files in place, the file is only written if `result`
+    differs from its `original` contents (which are read again if not
+    given), so that unchanged files keep their modification times.
+    """
+    if options.dryrun:
+        return
+    assert mapping.output is not None
+    with time_phase(options.stats, "write"):
+        if options.in_place:
+            if original is None:
+                original = read_input(mapping, replace(options, stats=None))
+            if result != original:
+                write_atomic(mapping.output, result)
+            return
+        mapping.output.parent.mkdir(parents=True, exist_ok=True)
+        with open(
+            mapping.output,
+            "w",
+            encoding='utf-8',
+            newline="",
+        ) as write_out:
+            write_out.write(result)
+
+
+def process_file(
+    mapping: FileMapping,
+    rules: dict[str, Rule],
+    options: ProcessOptions,
+) -> FileResult:
+    """
+    Process a single file using the given normalized rules (see
+    `normalize_rules`), writing its output unless `options.dryrun` is given.
+    """
+    if options.stats is None:
+        return _process_file(mapping, rules, options)
+    start = perf_counter()
+    try:
+        return _process_file(mapping, rules, options)
+    finally:
+        options.stats.record_file(mapping.input, perf_counter() - start)
+
+
+def _process_file(
+    mapping: FileMapping,
+    rules: dict[str, Rule],
+    options: ProcessOptions,
+) -> FileResult:
+    if not mapping.transform:
+        return copy_input(mapping, options)
+
+    try:
+        in_text = read_input(mapping, options)
+    except Exception as e:
+        return file_error(mapping, e)
+
+    # Files without any rules can be passed through unchanged, without
+    # needing to be parsed
+    if not may_contain_rules(in_text):
+        kind: Literal["unchanged", "transformed"] = "unchanged"
+        result = in_text
+    else:
+        # Transform the data
+        kind = "transformed"
+        try:
+            result = transform_normalized(
+                in_text,
+                rules,
+                engine=options.engine,
+                docstrings=options.docstrings,
+                concurrency=options.concurrency,
+                stats=options.stats,
+            )
+        except TransdocTransformationError as e:
+            return FileResult(
+                mapping,
+                kind,
+                format_transformation_error(mapping.input, e),
+            )
+        except Exception as e:
+            # The file couldn't be parsed, which is common in watch mode,
+            # where files are saved while they are being edited
+            return file_error(mapping, e)
+
+    write_output(mapping, result, options, in_text)
+    return FileResult(mapping, kind)
+
+
+async def process_file_async(
+    mapping: FileMapping,
+    rules: dict[str, Rule],
+    options: ProcessOptions,
+    limiter: asyncio.Semaphore,
+) -> FileResult:
+    """
+    Process a single file using the running event loop and the given
+    normalized rules (see `normalize_rules`), evaluating async rules using
+    the given `limiter`. File operations are performed in a separate thread.
+    """
+    if options.stats is None:
+        return await _process_file_async(mapping, rules, options, limiter)
+    start = perf_counter()
+    try:
+        return await _process_file_async(mapping, rules, options, limiter)
+    finally:
+        options.stats.record_file(mapping.input, perf_counter() - start)
+
+
+async def _process_file_async(
+    mapping: FileMapping,
+    rules: dict[str, Rule],
+    options: ProcessOptions,
+    limiter: asyncio.Semaphore,
+) -> FileResult:
+    if not mapping.transform:
+        return await asyncio.to_thread(copy_input, mapping, options)
+
+    try:
+        in_text = await asyncio.to_thread(read_input, mapping, options)
+    except Exception as e:
+        return file_error(mapping, e)
+
+    if not may_contain_rules(in_text):
+        kind: Literal["unchanged", "transformed"] = "unchanged"
+        result = in_text
+    else:
+        kind = "transformed"
+        try:
+            result = await transform_with_limiter(
+                in_text,
+                rules,
+                engine=options.engine,
+                docstrings=options.docstrings,
+                limiter=limiter,
+                stats=options.stats,
+            )
+        except TransdocTransformationError as e:
+            return FileResult(
+                mapping,
+                kind,
+                format_transformation_error(mapping.input, e),
+            )
+        except Exception as e:
+            return file_error(mapping, e)
+
+    await asyncio.to_thread(write_output, mapping, result, options, in_text)
+    return FileResult(mapping, kind)
+
+
+ASYNC_BATCH_SIZE = 64
+"""Number of files processed concurrently by `process_files_async`"""
+
+
+def take(iterator: Iterator[T], n: int) -> list[T]:
+    """
+    Take up to `n` items from the given iterator.
+    """
+    return list(islice(iterator, n))
+
+
+async def process_files_async(
+    file_mappings: Iterable[FileMapping],
+    rules: dict[str, Rule],
+    options: ProcessOptions,
+) -> AsyncIterator[FileResult]:
+    """
+    Process the given files using the running event loop, in batches of
+    `ASYNC_BATCH_SIZE` files. Async rules used by all files in a batch are
+    evaluated concurrently, with at most `options.concurrency` evaluated at
+    once.
+
+    Results are produced in the same order as the given files. Files are
+    consumed one batch at a time, in a separate thread, so that they can be
+    found lazily without blocking the event loop.
+    """
+    rules = normalize_rules(rules, options.cache, options.stats)
+    limiter = asyncio.Semaphore(options.concurrency)
+    mappings = iter(file_mappings)
+    while batch := await asyncio.to_thread(take, mappings, ASYNC_BATCH_SIZE):
+        for result in await asyncio.gather(*(
+            process_file_async(mapping, rules, options, limiter)
+            for mapping in batch
+        )):
+            yield result
+
+
+_worker_rules: Optional[dict[str, Rule]] = None
+"""
+Rules used by worker processes. When processes are forked, these are
+inherited from the main process, and otherwise, they are loaded when the
+worker starts.
+"""
+
+_worker_cache: Optional[RuleCache] = None
+"""Rule cache used by worker processes"""
+
+
+def _init_worker(rule_file: Path, cache: Optional[RuleCache] = None) -> None:
+    """
+    Initialise a worker process, loading the rule file if required.
+    """
+    global _worker_rules, _worker_cache
+    if _worker_rules is None:
+        _worker_rules = collect_rules(load_rule_file(rule_file))
+    _worker_cache = cache
+
+
+WorkerResult = tuple[list[FileResult], tuple[int, int, int], Optional[Stats]]
+
+
+def _process_chunk_in_worker(
+    mappings: list[FileMapping],
+    options: ProcessOptions,
+) -> WorkerResult:
+    """
+    Process a chunk of files within a worker process, normalizing the rules
+    once for the whole chunk.
+
+    Returns the results, along with the changes to the cache's counters
+    while processing the chunk, so that they can be counted by the main
+    process. If `options.stats` is given, the statistics for the chunk are
+    also returned, so that they can be merged by the main process.
+    """
+    assert _worker_rules is not None
+    stats = None if options.stats is None else Stats()
+    options = replace(options, cache=_worker_cache, stats=stats)
+    rules = normalize_rules(_worker_rules, _worker_cache, stats)
+    if _worker_cache is None:
+        return [
+            process_file(mapping, rules, options) for mapping in mappings
+        ], (0, 0, 0), stats
+    before = _worker_cache.counters()
+    results = [process_file(mapping, rules, options) for mapping in mappings]
+    after = _worker_cache.counters()
+    return results, (
+        after[0] - before[0],
+        after[1] - before[1],
+        after[2] - before[2],
+    ), stats
+
+
+MAX_CHUNK_SIZE = 32
+"""
+Maximum number of files sent to a worker process at once by
+`process_files_parallel`
+"""
+
+
+def chunk_files(
+    file_mappings: Iterable[FileMapping],
+) -> Iterator[list[FileMapping]]:
+    """
+    Split the given files into chunks to send to worker processes. Chunks
+    start small, so that small trees are still spread between workers, and
+    grow up to `MAX_CHUNK_SIZE`, to reduce the overhead of sending files to
+    workers for large trees.
+    """
+    mappings = iter(file_mappings)
+    size = 1
+    while chunk := take(mappings, size):
+        yield chunk
+        size = min(size * 2, MAX_CHUNK_SIZE)
+
+
+def process_files_parallel(
+    file_mappings: Iterable[FileMapping],
+    rules: dict[str, Rule],
     rule_file: Path,
+    options: ProcessOptions,
+    *,
+    jobs: int,
+) -> Iterator[FileResult]:
+    """
+    Process the given files using a pool of `jobs` worker processes.
+
+    Results are produced in the same order as the given files. Files are
+    consumed lazily, with only a few chunks of files sent to workers ahead
+    of the results that have been produced. Each worker uses its own copy of
+    the `options.cache`, and the changes to their counters are added to the
+    counters of the `options.cache`. Likewise, statistics gathered by
+    workers are merged into `options.stats`.
+    """
+    global _worker_rules
+    # Forking allows workers to inherit the rules we already loaded, rather
+    # than needing to import the rule file again
+    mp_context: BaseContext
+    if "fork" in multiprocessing.get_all_start_methods():
+        mp_context = multiprocessing.get_context("fork")
+        _worker_rules = rules
+    else:
+        mp_context = multiprocessing.get_context()
+    cache = options.cache
+    stats = options.stats
+    try:
+        with ProcessPoolExecutor(
+            jobs,
+            mp_context=mp_context,
+            initializer=_init_worker,
+            initargs=(rule_file, cache),
+        ) as executor:
+            # Workers use their own copy of the cache and stats, so avoid
+            # sending them with every file
+            worker = partial(_process_chunk_in_worker, options=replace(
+                options,
+                cache=None,
+                stats=None if stats is None else Stats(),
+            ))
+
+            def collect(chunk: Future[WorkerResult]) -> list[FileResult]:
+                results, counters, chunk_stats = chunk.result()
+                if cache is not None:
+                    cache.add_counters(counters)
+                if stats is not None and chunk_stats is not None:
+                    stats.merge(chunk_stats)
+                return results
+
+            pending: deque[Future[WorkerResult]] = deque()
+            for chunk in chunk_files(file_mappings):
+                pending.append(executor.submit(worker, chunk))
+                if len(pending) >= 2 * jobs:
+                    yield from collect(pending.popleft())
+            while pending:
+                yield from collect(pending.popleft())
+    finally:
+        _worker_rules = None
+
+
+@dataclass
+class ExtractedFile:
+    """
+    File whose rules were extracted by `process_files_deduplicated`, but
+    haven't been substituted yet.
+    """
+    mapping: FileMapping
+    evaluator: RuleEvaluator
+    processed: str
+    get_errors: Callable[[], list[TransformErrorInfo]]
+
+
+def extract_file(
+    mapping: FileMapping,
+    rules: dict[str, Rule],
+    options: ProcessOptions,
+) -> Union[FileResult, ExtractedFile]:
+    """
+    Process a single file, deferring the evaluation of any rules it uses.
+    Files which don't need their rules evaluated are processed completely.
+    """
+    if not mapping.transform:
+        return copy_input(mapping, options)
+
+    try:
+        in_text = read_input(mapping, options)
+    except Exception as e:
+        return file_error(mapping, e)
+
+    if not may_contain_rules(in_text):
+        write_output(mapping, in_text, options, in_text)
+        return FileResult(mapping, "unchanged")
+
+    evaluator = RuleEvaluator(rules, defer=True)
+    try:
+        processed, get_errors = rewrite(
+            in_text,
+            evaluator,
+            options.engine,
+            options.stats,
+            options.docstrings,
+        )
+    except Exception as e:
+        return file_error(mapping, e)
+    return ExtractedFile(mapping, evaluator, processed, get_errors)
+
+
+def substitute_file(
+    extracted: ExtractedFile,
+    options: ProcessOptions,
+) -> FileResult:
+    """
+    Substitute the results of the rules into a file extracted by
+    `extract_file`, and write its output.
+    """
+    mapping = extracted.mapping
+    try:
+        with time_phase(options.stats, "codegen"):
+            result = finish(
+                extracted.evaluator,
+                extracted.processed,
+                extracted.get_errors,
+            )
+    except TransdocTransformationError as e:
+        return FileResult(
+            mapping,
+            "transformed",
+            format_transformation_error(mapping.input, e),
+        )
+    write_output(mapping, result, options)
+    return FileResult(mapping, "transformed")
+
+
+def process_files_deduplicated(
+    file_mappings: Iterable[FileMapping],
+    rules: dict[str, Rule],
+    options: ProcessOptions,
+    *,
+    jobs: int = 1,
+) -> Iterator[FileResult]:
+    """
+    Process the given files in two passes. The first pass parses every file
+    and extracts the rules it uses. Then, each unique use of a rule is
+    evaluated once, using a pool of `jobs` threads (see `evaluate_deferred`),
+    and the second pass substitutes the results into each file and writes
+    its output. Files are parsed in this process, and since the threads
+    share the GIL, only rules which wait on I/O benefit from `jobs`.
+
+    Results are produced in the same order as the given files.
+    """
+    stats = options.stats
+    rules = normalize_rules(rules, options.cache, stats)
+    extracted: list[Union[FileResult, ExtractedFile]] = []
+    durations: list[float] = []
+    for mapping in file_mappings:
+        start = perf_counter()
+        extracted.append(extract_file(mapping, rules, options))
+        durations.append(perf_counter() - start)
+
+    with time_phase(stats, "evaluate"):
+        evaluate_deferred(
+            [
+                invocation
+                for file in extracted
+                if isinstance(file, ExtractedFile)
+                for invocation in file.evaluator.deferred()
+            ],
+            rules,
+            jobs=jobs,
+            concurrency=options.concurrency,
+        )
+
+    for file, duration in zip(extracted, durations):
+        start = perf_counter()
+        if isinstance(file, ExtractedFile):
+            result = substitute_file(file, options)
+        else:
+            result = file
+        if stats is not None:
+            # Time spent evaluating rules can't be attributed to individual
+            # files, so isn't included
+            stats.record_file(
+                result.mapping.input,
+                duration + perf_counter() - start,
+            )
+        yield result
+
+
+def process_files(
+    file_mappings: Iterable[FileMapping],
+    rules: dict[str, Rule],
+    rule_file: Path,
+    options: ProcessOptions,
+    *,
+    jobs: int = 1,
+) -> Iterable[FileResult]:
+    """
+    Process the given files, in parallel if `jobs` is greater than 1.
+
+    Results are produced in the same order as the given files, which are
+    consumed lazily, except when rules are deduplicated. The rules are
+    normalized once, rather than for each file.
+    """
+    if options.deduplicate:
+        return process_files_deduplicated(
+            file_mappings,
+            rules,
+            options,
+            jobs=jobs,
+        )
+    if jobs > 1:
+        # Don't bother starting workers for a single file
+        mappings = iter(file_mappings)
+        first = take(mappings, 2)
+        if len(first) < 2:
+            file_mappings = first
+        else:
+            return process_files_parallel(
+                chain(first, mappings),
+                rules,
+                rule_file,
+                options,
+                jobs=jobs,
+            )
+    rules = normalize_rules(rules, options.cache, options.stats)
+    return (
+        process_file(mapping, rules, options)
+        for mapping in file_mappings
+    )
+
+
+def find_files(
+    input: Path,
+    output: Optional[Path],
+    file_filter: Optional[FileFilter] = None,
+) -> Iterator[FileMapping]:
+    """
+    Find the files to process within the given input file or directory,
+    mapping them to the equivalent location within the output. Files are
+    found lazily, so that large trees aren't held in memory.
+
+    Files within an input directory are found using the given
+    `file_filter`, which by default skips version control and cache
+    directories (see `DEFAULT_EXCLUDES`), as well as the output directory.
+    """
+    if not input.is_dir():
+        yield FileMapping(input, output, True)
+        return
+    if file_filter is None:
+        file_filter = FileFilter(
+            str(input),
+            skip=None if output is None else str(output),
+        )
+    for path, relative in file_filter.walk():
+        in_file = Path(path)
+        out_file = None if output is None else output.joinpath(relative)
+        yield FileMapping(in_file, out_file, in_file.suffix == ".py")
+
+
+@dataclass(frozen=True)
+class ProcessResult:
+    """
+    Result of processing a single file using `process_iter`.
+    """
+    input: Path
+    """Path to the input file"""
+    status: Literal["copied", "unchanged", "transformed", "failed"]
+    """
+    How the file was processed:
+
+    * `"copied"`: the file isn't a Python file, so it was copied.
+    * `"unchanged"`: the file contained no rules, so was passed through
+      without being parsed.
+    * `"transformed"`: the file was transformed.
+    * `"failed"`: the file couldn't be read, transformed or written. See
+      `error`.
+    """
+    output: Optional[Path]
+    """Path to the output file, if an output location was given"""
+    text: Optional[str]
+    """
+    The resulting code, if no output location was given, and the file was
+    processed successfully
+    """
+    error: Optional[Exception]
+    """
+    The error that occurred while processing the file, if any. This is
+    usually a `TransdocTransformationError`, but may also be an error
+    produced when parsing the file, or reading or writing it.
+    """
+    duration: float
+    """Time taken to process the file, in seconds"""
+
+
+def stream_file(
+    mapping: FileMapping,
+    rules: dict[str, Rule],
+    options: ProcessOptions,
+) -> ProcessResult:
+    """
+    Process a single file for `process_iter`, using the given normalized
+    rules.
+    """
+    start = perf_counter()
+
+    def result(
+        status: Literal["copied", "unchanged", "transformed", "failed"],
+        text: Optional[str] = None,
+        error: Optional[Exception] = None,
+    ) -> ProcessResult:
+        duration = perf_counter() - start
+        if options.stats is not None:
+            options.stats.record_file(mapping.input, duration)
+        return ProcessResult(
+            mapping.input,
+            status,
+            mapping.output,
+            text,
+            error,
+            duration,
+        )
+
+    if not mapping.transform:
+        try:
+            copy_input(mapping, options)
+        except Exception as e:
+            return result("failed", error=e)
+        return result("copied")
+
+    try:
+        in_text = read_input(mapping, options)
+    except Exception as e:
+        return result("failed", error=e)
+
+    if not may_contain_rules(in_text):
+        status: Literal["unchanged", "transformed"] = "unchanged"
+        out_text = in_text
+    else:
+        status = "transformed"
+        try:
+            out_text = transform_normalized(
+                in_text,
+                rules,
+                engine=options.engine,
+                docstrings=options.docstrings,
+                concurrency=options.concurrency,
+                stats=options.stats,
+            )
+        except Exception as e:
+            # Includes syntax errors, which shouldn't end the stream
+            return result("failed", error=e)
+
+    try:
+        write_output(mapping, out_text, options, in_text)
+    except Exception as e:
+        return result("failed", error=e)
+    return result(status, out_text if mapping.output is None else None)
+
+
+def process_iter(
+    input: Path,
+    rules: Union[Path, list[Rule], dict[str, Rule], ModuleType],
     output: Optional[Path] = None,
     *,
-    dryrun: bool = False,
-    force: bool = False,
-) -> int:
+    engine: Engine = "libcst",
+    docstrings: DocstringMode = "precise",
+    cache: Optional[RuleCache] = None,
+    copy_strategy: CopyStrategy = "copy",
+    concurrency: int = DEFAULT_CONCURRENCY,
+    stats: Optional[Stats] = None,
+    include: Sequence[str] = (),
+    exclude: Sequence[str] = DEFAULT_EXCLUDES,
+    gitignore: bool = False,
+) -> Iterator[ProcessResult]:
     """
-    Main entrypoint to the program.
+    Process the given file or directory, producing the result of processing
+    each file as soon as it has been processed, so that other work can begin
+    before the whole tree is processed.
+
+    Files are found and processed lazily, one at a time, so memory usage
+    doesn't grow with the size of the tree. Errors are included in the
+    results, rather than being reported.
+
+    ## Args
+
+    * `input` (`Path`): file or directory to process.
+
+    * `rules` (`Path | list[Rule] | dict[str, Rule] | ModuleType`): path to a
+      rule file, or the rules to use (as accepted by `transform`).
+
+    * `output` (`Path`, optional): location to write the output to. Unlike
+      `main`, existing outputs are overwritten, and other files within the
+      output directory are left untouched. If not given, no files are
+      written, the resulting code is included in each result, and files
+      which aren't Python files are skipped.
+
+    ## Keyword args
+
+    Keyword arguments are the same as for `main`.
+
+    ## Returns
+
+    * `Iterator[ProcessResult]`: the result of processing each file.
+    """
+    if isinstance(rules, Path):
+        rules = collect_rules(load_rule_file(rules))
+    normalized = normalize_rules(rules, cache, stats)
+    options = ProcessOptions(
+        dryrun=output is None,
+        engine=engine,
+        docstrings=docstrings,
+        copy_strategy=copy_strategy,
+        concurrency=concurrency,
+        stats=stats,
+    )
+    file_filter = FileFilter(
+        str(input),
+        include=include,
+        exclude=exclude,
+        gitignore=gitignore,
+        skip=None if output is None else str(output),
+    )
+    for mapping in find_files(input, output, file_filter):
+        if output is None and not mapping.transform:
+            continue
+        yield stream_file(mapping, normalized, options)
+
+
+class Run:
+    """
+    A single run of `main` or `main_async`, which records the results of
+    processing each file.
+    """
+
+    def __init__(
+        self,
+        file_mappings: Iterable[FileMapping],
+        rules: dict[str, Rule],
+        output: Optional[Path],
+        build: Optional[IncrementalBuild],
+        num_up_to_date: int,
+        jobs: int,
+    ) -> None:
+        self.file_mappings = file_mappings
+        """Files which need to be processed, which may be found lazily"""
+        self.rules = rules
+        """Rules loaded from the rule file"""
+        self.jobs = jobs
+        """Number of worker processes to use"""
+        self.__output = output
+        self.__build = build
+        self.__num_up_to_date = num_up_to_date
+        self.__encountered_errors = False
+        self.__counts = {"copied": 0, "unchanged": 0, "transformed": 0}
+
+    def record(self, result: FileResult) -> None:
+        """
+        Record the result of processing a file, displaying any errors.
+        """
+        self.__counts[result.kind] += 1
+        if result.error_report is not None:
+            print(result.error_report, file=sys.stderr)
+            self.__encountered_errors = True
+            if self.__build is not None:
+                # Make sure the file is processed again next time, and that
+                # its outdated output doesn't linger
+                assert self.__output is not None
+                assert result.mapping.output is not None
+                self.__build.failed(result.mapping.input)
+                remove_output(result.mapping.output, self.__output)
+
+    def finish(self, cache: RuleCache, *, verbose: bool) -> int:
+        """
+        Finish the run once all files have been processed, returning the
+        exit code.
+        """
+        if self.__build is not None:
+            self.__build.save()
+
+        if cache.persistent is not None:
+            cache.persistent.evict()
+
+        if verbose:
+            counts = self.__counts
+            print(
+                f"Transdoc: transformed {counts['transformed']} files, "
+                f"passed through {counts['unchanged']} files without rules, "
+                f"copied {counts['copied']} other files",
+            )
+            if self.__build is not None:
+                print(
+                    f"Transdoc: {self.__num_up_to_date} files were already up "
+                    f"to date"
+                )
+            if cache.hits or cache.misses:
+                print(
+                    f"Transdoc: rule cache: {cache.hits} hits ("
+                    f"{cache.persistent_hits} from disk), {cache.misses} "
+                    f"misses",
+                )
+
+        if self.__encountered_errors:
+            return 1
+
+        return 0
+
+
+def prepare_run(
+    input: Path,
+    rule_file: Path,
+    output: Optional[Path],
+    *,
+    dryrun: bool,
+    force: bool,
+    jobs: int,
+    incremental: bool,
+    in_place: bool = False,
+    include: Sequence[str] = (),
+    exclude: Sequence[str] = DEFAULT_EXCLUDES,
+    gitignore: bool = False,
+    engine: Engine = "libcst",
+    docstrings: DocstringMode = "precise",
+    rules: Optional[dict[str, Rule]] = None,
+) -> Union[Run, int]:
+    """
+    Validate the arguments, load the rules (unless they were already loaded
+    from the rule file and given as `rules`), find the files to process and
+    prepare the output location.
+
+    Files are found lazily as they are processed, unless the output needs to
+    be compared against the input, for incremental builds, or when
+    overwriting an existing output directory.
+
+    Returns the exit code if the arguments are invalid.
     """
     errors: list[str] = []
-    file_mappings: list[FileMapping] = []
-    if input.is_dir():
-        for dirpath, _, filenames in os.walk(input):
-            for filename in filenames:
-                in_file = Path(dirpath).joinpath(filename)
-                if output is None:
-                    out_file = None
-                else:
-                    out_file = output.joinpath(in_file.relative_to(input))
-                perform_transformation = in_file.suffix == ".py"
-                file_mappings.append(FileMapping(
-                    in_file,
-                    out_file,
-                    perform_transformation,
-                ))
+    if not input.is_dir() and not input.suffix == ".py":
+        errors.append(f"Input file '{input}' must be a Python file")
+
+    file_filter = FileFilter(
+        str(input),
+        include=include,
+        exclude=exclude,
+        gitignore=gitignore,
+        skip=None if output is None else str(output),
+    )
+    file_mappings: Iterable[FileMapping]
+
+    if in_place:
+        if output is not None:
+            errors.append("An output location can't be given in place mode")
+        if dryrun or incremental:
+            errors.append(
+                "In place mode can't be used for dryruns or incremental builds"
+            )
+        # Only Python files are written, and each is its own output
+        file_mappings = (
+            FileMapping(mapping.input, mapping.input, True)
+            for mapping in find_files(input, None, file_filter)
+            if mapping.transform
+        )
     else:
-        if not input.suffix == ".py":
-            errors.append(f"Input file '{input}' must be a Python file")
-        file_mappings.append(FileMapping(input, output, True))
+        file_mappings = find_files(input, output, file_filter)
 
-    if not force and not dryrun:
+    if incremental and not in_place:
+        assert output is not None
+        if dryrun:
+            errors.append("Incremental builds can't be performed as a dryrun")
+        if not input.is_dir():
+            errors.append("Incremental builds require an input directory")
+        elif (
+            not force
+            and output.exists()
+            and Manifest.load(output) is None
+            and (not output.is_dir() or len(os.listdir(output)))
+        ):
+            errors.append(
+                f"Output location '{output}' exists and was not produced by "
+                f"an incremental build"
+            )
+    elif not force and not dryrun and not in_place:
         assert output is not None
         if output.exists():
             if output.is_dir() and len(os.listdir(output)):
@@ -121,59 +1139,251 @@ def main(
     if rule_file.suffix != ".py":
         errors.append(f"Rule file '{rule_file}' must be a Python file")
 
-    try:
-        rules = collect_rules(load_rule_file(rule_file))
-    except Exception as e:
-        errors.append(
-            f"Error when importing rule file '{rule_file}':\n    {e}")
+    if jobs < 0:
+        errors.append("Number of jobs must not be negative")
+    elif jobs == 0:
+        jobs = os.cpu_count() or 1
+
+    if rules is None:
+        try:
+            rules = collect_rules(load_rule_file(rule_file))
+        except Exception as e:
+            errors.append(
+                f"Error when importing rule file '{rule_file}':\n    {e}")
 
     if len(errors):
         return display_error_list(errors)
+    assert rules is not None
 
+    build: Optional[IncrementalBuild] = None
+    num_up_to_date = 0
+    if incremental:
+        assert output is not None
+        # Outputs produced using different options need to be rebuilt
+        build = IncrementalBuild(input, output, rule_file, {
+            "engine": engine,
+            "docstrings": docstrings,
+        })
+        if build.full_rebuild and output.exists():
+            rmtree(output)
+        out_of_date = []
+        for mapping in file_mappings:
+            assert mapping.output is not None
+            if build.is_up_to_date(mapping.input, mapping.output):
+                num_up_to_date += 1
+            else:
+                out_of_date.append(mapping)
+        file_mappings = out_of_date
+        for removed in build.removed_outputs():
+            remove_output(removed, output)
     # Remove the output file/directory
-    if not dryrun:
+    elif not dryrun and not in_place:
         assert output is not None
         if output.is_dir() and force:
-            rmtree(output)
+            if input.is_dir():
+                # Keep outputs which will be produced again, so that files
+                # which are passed through don't need to be copied again if
+                # they are unchanged
+                file_mappings = list(file_mappings)
+                prune_output(output, {
+                    mapping.output
+                    for mapping in file_mappings
+                    if mapping.output is not None
+                })
+            else:
+                rmtree(output)
 
-    encountered_errors = False
+    return Run(file_mappings, rules, output, build, num_up_to_date, jobs)
 
-    for mapping in file_mappings:
-        if not mapping.transform:
-            if not dryrun:
-                # Just copy from the input to the output
-                with open(mapping.input, 'rb') as copy_in:
-                    assert mapping.output is not None
-                    mapping.output.parent.mkdir(parents=True, exist_ok=True)
-                    with open(mapping.output, 'wb') as copy_out:
-                        copy_out.write(copy_in.read())
-            continue
 
-        # Open file
-        with open(mapping.input, encoding='utf-8') as read_in:
-            try:
-                in_text = read_in.read()
-            except Exception as e:
-                # FIXME
-                encountered_errors = True
-                print(e)
+def main(
+    input: Path,
+    rule_file: Path,
+    output: Optional[Path] = None,
+    *,
+    dryrun: bool = False,
+    force: bool = False,
+    verbose: bool = False,
+    engine: Engine = "libcst",
+    docstrings: DocstringMode = "precise",
+    jobs: int = 1,
+    incremental: bool = False,
+    cache: Optional[RuleCache] = None,
+    copy_strategy: CopyStrategy = "copy",
+    concurrency: int = DEFAULT_CONCURRENCY,
+    deduplicate: bool = False,
+    stats: Optional[Stats] = None,
+    in_place: bool = False,
+    include: Sequence[str] = (),
+    exclude: Sequence[str] = DEFAULT_EXCLUDES,
+    gitignore: bool = False,
+    rules: Optional[dict[str, Rule]] = None,
+) -> int:
+    """
+    Main entrypoint to the program.
 
-        # Transform the data
-        try:
-            result = transform(in_text, rules)
-        except TransdocTransformationError as e:
-            report_transformation_error(mapping.input, e)
-            encountered_errors = True
-            continue
+    If `incremental` is given, a manifest is stored in the output directory,
+    and subsequent runs only process input files which have changed since
+    the previous run, and delete the outputs of inputs which were removed.
+    Changes to the rule file cause everything to be rebuilt.
 
-        if not dryrun:
-            assert mapping.output is not None
-            # Write the result
-            mapping.output.parent.mkdir(parents=True, exist_ok=True)
-            with open(mapping.output, "w", encoding='utf-8') as write_out:
-                write_out.write(result)
+    Python files are transformed using the given `engine`, processing the
+    strings selected by `docstrings` (see `transform`).
+    Other files are passed through to the output using the given
+    `copy_strategy`, and are skipped if the output already matches.
+
+    Files within the input directory are found lazily as they are
+    processed. Files and directories matching any of the `exclude` globs are
+    skipped, which by default skips version control, cache and dependency
+    directories (see `DEFAULT_EXCLUDES`). If `include` globs are given, only
+    files matching one of them are processed. If `gitignore` is given, files
+    ignored by `.gitignore` files are skipped too. Globs use the syntax of
+    `.gitignore` files, and are matched against paths relative to the input
+    directory.
+
+    If `jobs` is greater than 1, files are processed in parallel using that
+    many worker processes. If it is 0, one worker is used per CPU.
+
+    Uses of async rules within each file are evaluated concurrently, with at
+    most `concurrency` evaluated at once.
+
+    If `deduplicate` is given, the rules used by every file are extracted
+    before any are evaluated, and each unique use of a rule is evaluated only
+    once, with batch rules (see `transdoc.batch`) evaluating all of their
+    uses in a single call. In this mode, `jobs` is the number of threads used
+    to evaluate rules, and async rules from all files are evaluated
+    concurrently. Since threads share the GIL, only rules which wait on I/O
+    are evaluated in parallel, and CPU-bound rules aren't sped up.
+
+    The results of pure rules (see `transdoc.pure`) are cached for the
+    duration of the run using the given `cache`, whose hit and miss counters
+    can be inspected afterwards. If no cache is given, a new one is used. If
+    the cache has a persistent cache, old results are evicted from it once
+    all files have been processed.
+
+    If `stats` is given, the time spent in each phase, by each file, and by
+    each rule is recorded in it.
+
+    If `in_place` is given, Python files within the input are transformed in
+    place, rather than being written to an `output`. Each file is replaced
+    atomically, and only if its contents changed, so that unchanged files
+    keep their modification times. Other files are left untouched.
+
+    If `verbose` is given, a summary of the processed files is printed once
+    all files have been processed.
+
+    If the rules were already loaded from the `rule_file` (eg by `watch`),
+    they can be given as `rules`, so that the rule file isn't imported
+    again.
+    """
+    run = prepare_run(
+        input,
+        rule_file,
+        output,
+        dryrun=dryrun,
+        force=force,
+        jobs=jobs,
+        incremental=incremental,
+        in_place=in_place,
+        include=include,
+        exclude=exclude,
+        gitignore=gitignore,
+        engine=engine,
+        docstrings=docstrings,
+        rules=rules,
+    )
+    if isinstance(run, int):
+        return run
+
+    if cache is None:
+        cache = RuleCache()
+    options = ProcessOptions(
+        dryrun=dryrun,
+        engine=engine,
+        docstrings=docstrings,
+        cache=cache,
+        copy_strategy=copy_strategy,
+        concurrency=concurrency,
+        deduplicate=deduplicate,
+        stats=stats,
+        in_place=in_place,
+    )
+    for result in process_files(
+        run.file_mappings,
+        run.rules,
+        rule_file,
+        options,
+        jobs=run.jobs,
+    ):
+        run.record(result)
+
+    return run.finish(cache, verbose=verbose)
+
+
+async def main_async(
+    input: Path,
+    rule_file: Path,
+    output: Optional[Path] = None,
+    *,
+    dryrun: bool = False,
+    force: bool = False,
+    verbose: bool = False,
+    engine: Engine = "libcst",
+    docstrings: DocstringMode = "precise",
+    incremental: bool = False,
+    cache: Optional[RuleCache] = None,
+    copy_strategy: CopyStrategy = "copy",
+    concurrency: int = DEFAULT_CONCURRENCY,
+    stats: Optional[Stats] = None,
+    in_place: bool = False,
+    include: Sequence[str] = (),
+    exclude: Sequence[str] = DEFAULT_EXCLUDES,
+    gitignore: bool = False,
+) -> int:
+    """
+    Asynchronous entrypoint to the program, which processes files using the
+    running event loop.
+
+    Files are processed in batches, and uses of async rules within each
+    batch of files are evaluated concurrently, with at most `concurrency`
+    evaluated at once. Other arguments are the same as for `main`.
+    """
+    run = await asyncio.to_thread(
+        prepare_run,
+        input,
+        rule_file,
+        output,
+        dryrun=dryrun,
+        force=force,
+        jobs=1,
+        incremental=incremental,
+        in_place=in_place,
+        include=include,
+        exclude=exclude,
+        gitignore=gitignore,
+        engine=engine,
+        docstrings=docstrings,
+    )
+    if isinstance(run, int):
+        return run
 
-    if encountered_errors:
-        return 1
+    if cache is None:
+        cache = RuleCache()
+    options = ProcessOptions(
+        dryrun=dryrun,
+        engine=engine,
+        docstrings=docstrings,
+        cache=cache,
+        copy_strategy=copy_strategy,
+        concurrency=concurrency,
+        stats=stats,
+        in_place=in_place,
+    )
+    async for result in process_files_async(
+        run.file_mappings,
+        run.rules,
+        options,
+    ):
+        run.record(result)
 
-    return 0
+    return await asyncio.to_thread(run.finish, cache, verbose=verbose)
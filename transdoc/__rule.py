@@ -3,11 +3,14 @@
 
 Type definition for Transdoc rules
 """
-from typing import Callable
+from typing import Awaitable, Callable, Union
 
 
-Rule = Callable[..., str]
+Rule = Callable[..., Union[str, Awaitable[str]]]
 """
 Rules are Python functions (potentially accepting arguments) which can be
 called during compile time.
+
+Rules may also be async functions, in which case all uses of them within a
+file are evaluated concurrently.
 """
@@ -0,0 +1,149 @@
+"""
+# Transdoc / Scanner
+
+Locate rules within docstrings.
+"""
+import re
+from bisect import bisect_right
+from typing import Callable, Iterator, NamedTuple, Optional
+
+
+_CALL_START = re.compile(r"[^\W\d]\w*\(")
+"""Start of a rule using the function call syntax, eg `rule(`"""
+
+_STRING_LITERAL = re.compile("|".join([
+    r"'''(?:[^'\\]|\\.|'(?!''))*'''",
+    r'"""(?:[^"\\]|\\.|"(?!""))*"""',
+    r"'(?:[^'\\]|\\.)*'",
+    r'"(?:[^"\\]|\\.)*"',
+]), re.DOTALL)
+"""Complete string literal"""
+
+
+class RuleMarker(NamedTuple):
+    """
+    A rule found within a docstring.
+    """
+
+    start: int
+    """Index of the opening `{{`"""
+
+    end: int
+    """
+    Index just past the closing `}}`, or the end of the docstring if the rule
+    was never closed
+    """
+
+    rule: Optional[str]
+    """Contents of the rule, or `None` if it is missing its closing `}}`"""
+
+    @property
+    def rule_start(self) -> int:
+        """Index of the start of the rule's contents"""
+        return self.start + 2
+
+
+_CLOSING_BRACKETS = {"(": ")", "[": "]", "{": "}"}
+"""Closing bracket matching each opening bracket"""
+
+
+def _find_call_end(text: str, args_start: int, end: int) -> int:
+    """
+    Returns the index of the `}}` which closes the function call rule whose
+    arguments start at `args_start`, given the index of the first `}}` after
+    it, skipping over any `}}` nested within the arguments.
+
+    The arguments are scanned once, tracking the brackets which are open,
+    and skipping over string literals, and the first `}}` found outside of
+    the call's brackets closes the rule. If the arguments can't be balanced,
+    as they contain mismatched brackets or unterminated string literals, the
+    first `}}` is returned.
+    """
+    # Closing brackets which are expected, innermost last
+    expected = [")"]
+    i = args_start
+    n = len(text)
+    while i < n:
+        c = text[i]
+        if not expected and text.startswith("}}", i):
+            return i
+        if c in _CLOSING_BRACKETS:
+            expected.append(_CLOSING_BRACKETS[c])
+        elif c in ")]}":
+            if not expected or expected.pop() != c:
+                return end
+        elif c in "'\"":
+            string = _STRING_LITERAL.match(text, i)
+            if string is None:
+                return end
+            i = string.end()
+            continue
+        i += 1
+    return end
+
+
+def find_rules(docstring: str) -> Iterator[RuleMarker]:
+    """
+    Find all rules within the given docstring, in order.
+
+    Rules are enclosed within `{{` double braces `}}`. Rules using the
+    function call syntax are closed by the first `}}` outside of their
+    arguments, so that they can contain nested braces (eg dictionaries).
+    Otherwise, they are closed by the first `}}`.
+    """
+    pos = 0
+    while True:
+        start = docstring.find("{{", pos)
+        if start == -1:
+            return
+        rule_start = start + 2
+
+        end = docstring.find("}}", rule_start)
+        if end == -1:
+            yield RuleMarker(start, len(docstring), None)
+            return
+
+        call = _CALL_START.match(docstring, rule_start, end)
+        if call is not None:
+            end = _find_call_end(docstring, call.end(), end)
+
+        yield RuleMarker(start, end + 2, docstring[rule_start:end])
+        pos = end + 2
+
+
+def substitute_rules(
+    docstring: str,
+    evaluate: Callable[[RuleMarker], str],
+) -> str:
+    """
+    Replace each rule within the given docstring with the result of calling
+    `evaluate` on its `RuleMarker`.
+    """
+    parts = []
+    pos = 0
+    for marker in find_rules(docstring):
+        parts.append(docstring[pos:marker.start])
+        parts.append(evaluate(marker))
+        pos = marker.end
+    parts.append(docstring[pos:])
+    return "".join(parts)
+
+
+class LineIndex:
+    """
+    Index of the starting offsets of each line of a string, used to convert
+    offsets into line and column numbers.
+    """
+
+    def __init__(self, text: str) -> None:
+        self.__line_starts = [0]
+        self.__line_starts.extend(
+            match.end() for match in re.finditer("\n", text)
+        )
+
+    def position(self, offset: int) -> tuple[int, int]:
+        """
+        Returns the zero-indexed line and column of the given offset.
+        """
+        line = bisect_right(self.__line_starts, offset) - 1
+        return line, offset - self.__line_starts[line]
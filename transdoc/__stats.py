@@ -0,0 +1,266 @@
+"""
+# Transdoc / Stats
+
+Gather statistics about where time is spent while transforming code.
+"""
+import inspect
+import threading
+from contextlib import AbstractContextManager, contextmanager, nullcontext
+from dataclasses import dataclass
+from functools import wraps
+from pathlib import Path
+from time import perf_counter
+from typing import Any, Awaitable, Iterator, Optional, Sequence, Union
+
+from .__batch import BATCH_ATTRIBUTE, RuleCall, get_batch
+from .__rule import Rule
+
+
+PHASES = ("read", "parse", "scan", "evaluate", "codegen", "write", "copy")
+"""
+Phases of processing files:
+
+* `read`: reading input files.
+* `parse`: parsing source code (libcst engine only).
+* `scan`: finding docstrings and the rules within them. When using the
+  tokenize engine, this includes tokenizing the source code.
+* `evaluate`: evaluating rules.
+* `codegen`: producing the transformed source code.
+* `write`: writing output files.
+* `copy`: passing files which aren't transformed through to the output.
+"""
+
+DEFAULT_TOP = 10
+"""Default number of files and rules listed by `Stats.report`"""
+
+
+@dataclass(frozen=True)
+class RuleStats:
+    """
+    Statistics about the calls to a single rule.
+    """
+    name: str
+    calls: int
+    """Number of times the rule was evaluated"""
+    total: float
+    """Total time spent evaluating the rule, in seconds"""
+    mean: float
+    """Mean time taken to evaluate the rule, in seconds"""
+    p95: float
+    """95th percentile of the time taken to evaluate the rule, in seconds"""
+
+
+class Stats:
+    """
+    Statistics gathered while transforming code, recording the time spent in
+    each phase (see `PHASES`), the time taken to process each file, and the
+    time taken by each call to each rule.
+
+    Pass a `Stats` to `transform` or `main` to gather statistics. When
+    files are processed concurrently, the times of each phase are summed
+    across all files, so may exceed the total time taken.
+    """
+
+    def __init__(self) -> None:
+        self.phases: dict[str, float] = dict.fromkeys(PHASES, 0.0)
+        """Total time spent in each phase, in seconds"""
+        self.files: dict[Path, float] = {}
+        """Time taken to process each file, in seconds"""
+        self.rule_times: dict[str, list[float]] = {}
+        """Time taken by each call to each rule, in seconds"""
+        self.__lock = threading.Lock()
+        self.__local = threading.local()
+
+    def __getstate__(self) -> dict[str, Any]:
+        # Locks can't be sent to other processes
+        state = self.__dict__.copy()
+        del state["_Stats__lock"]
+        del state["_Stats__local"]
+        return state
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self.__lock = threading.Lock()
+        self.__local = threading.local()
+
+    def __rule_time(self) -> float:
+        """
+        Returns the total time spent in sync rules by this thread.
+        """
+        return getattr(self.__local, "rule_time", 0.0)
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """
+        Record the time spent within this context as part of the given
+        phase. Time spent evaluating sync rules within the context is
+        recorded as part of the `evaluate` phase instead.
+        """
+        rules_before = self.__rule_time()
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = perf_counter() - start
+            in_rules = self.__rule_time() - rules_before
+            with self.__lock:
+                self.phases[name] += elapsed - in_rules
+                self.phases["evaluate"] += in_rules
+
+    def record_file(self, file: Path, seconds: float) -> None:
+        """
+        Record the time taken to process the given file.
+        """
+        with self.__lock:
+            self.files[file] = seconds
+
+    def record_rule(self, name: str, seconds: float) -> None:
+        """
+        Record the time taken by a call to the rule with the given name.
+        """
+        with self.__lock:
+            self.rule_times.setdefault(name, []).append(seconds)
+
+    def merge(self, other: 'Stats') -> None:
+        """
+        Add the statistics gathered by `other` (eg in another process) to
+        these statistics.
+        """
+        with self.__lock:
+            for phase, seconds in other.phases.items():
+                self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+            self.files.update(other.files)
+            for name, times in other.rule_times.items():
+                self.rule_times.setdefault(name, []).extend(times)
+
+    def __wrap_rule(self, name: str, rule: Rule) -> Rule:
+        local = self.__local
+
+        async def time_async(awaitable: Awaitable[str]) -> str:
+            # Async rules are timed from when they are first awaited
+            start = perf_counter()
+            try:
+                return await awaitable
+            finally:
+                self.record_rule(name, perf_counter() - start)
+
+        @wraps(rule)
+        def timed_rule(
+            *args: Any,
+            **kwargs: Any,
+        ) -> Union[str, Awaitable[str]]:
+            start = perf_counter()
+            try:
+                result = rule(*args, **kwargs)
+            finally:
+                elapsed = perf_counter() - start
+                local.rule_time = getattr(local, "rule_time", 0.0) + elapsed
+            if inspect.isawaitable(result):
+                return time_async(result)
+            self.record_rule(name, elapsed)
+            return result
+
+        # `wraps` copies the batch form of batch rules, which would bypass
+        # the timing, so replace it with one which is timed. Each call to
+        # the batch form is recorded as a single call to the rule.
+        batch_rule = get_batch(rule)
+        if batch_rule is not None:
+            def timed_batch(
+                calls: Sequence[RuleCall],
+            ) -> Sequence[Union[str, Exception]]:
+                assert batch_rule is not None
+                start = perf_counter()
+                try:
+                    return batch_rule(calls)
+                finally:
+                    self.record_rule(name, perf_counter() - start)
+
+            setattr(timed_rule, BATCH_ATTRIBUTE, timed_batch)
+
+        return timed_rule
+
+    def wrap(self, rules: dict[str, Rule]) -> dict[str, Rule]:
+        """
+        Returns a copy of the given rules, where each rule is replaced with a
+        version that records the time taken by each call.
+        """
+        return {
+            name: self.__wrap_rule(name, rule)
+            for name, rule in rules.items()
+        }
+
+    def rules(self) -> list[RuleStats]:
+        """
+        Returns statistics about each rule, with the rules which took the
+        most time in total first.
+        """
+        with self.__lock:
+            rule_times = {
+                name: sorted(times)
+                for name, times in self.rule_times.items()
+            }
+        results = [
+            RuleStats(
+                name,
+                len(times),
+                sum(times),
+                sum(times) / len(times),
+                times[min(len(times) - 1, int(len(times) * 0.95))],
+            )
+            for name, times in rule_times.items()
+            if times
+        ]
+        results.sort(key=lambda rule: rule.total, reverse=True)
+        return results
+
+    def slowest_files(self, n: int = DEFAULT_TOP) -> list[tuple[Path, float]]:
+        """
+        Returns the `n` files which took the longest to process, along with
+        the time taken by each.
+        """
+        with self.__lock:
+            files = list(self.files.items())
+        files.sort(key=lambda file: file[1], reverse=True)
+        return files[:n]
+
+    def report(self, top: int = DEFAULT_TOP) -> str:
+        """
+        Returns a report of the statistics, listing the `top` slowest files
+        and rules.
+        """
+        lines = ["Transdoc: time spent in each phase:"]
+        for phase, seconds in self.phases.items():
+            lines.append(f"  {phase:<9} {seconds * 1e3:10.2f} ms")
+
+        if self.files:
+            lines.append(f"Transdoc: slowest files (of {len(self.files)}):")
+            for file, seconds in self.slowest_files(top):
+                lines.append(f"  {seconds * 1e3:10.2f} ms  {file}")
+
+        rules = self.rules()
+        if rules:
+            lines.append(f"Transdoc: slowest rules (of {len(rules)}):")
+            lines.append(
+                f"  {'rule':<24} {'calls':>8} {'total ms':>10} "
+                f"{'mean ms':>10} {'p95 ms':>10}"
+            )
+            for rule in rules[:top]:
+                lines.append(
+                    f"  {rule.name:<24} {rule.calls:>8} "
+                    f"{rule.total * 1e3:>10.2f} {rule.mean * 1e3:>10.3f} "
+                    f"{rule.p95 * 1e3:>10.3f}"
+                )
+        return "\n".join(lines)
+
+
+def time_phase(
+    stats: Optional[Stats],
+    name: str,
+) -> AbstractContextManager[None]:
+    """
+    Record the time spent within this context as part of the given phase, if
+    `stats` is given.
+    """
+    if stats is None:
+        return nullcontext()
+    return stats.phase(name)
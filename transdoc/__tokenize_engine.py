@@ -0,0 +1,238 @@
+"""
+# Transdoc / tokenize engine
+
+Use the standard library's `tokenize` module to rewrite docstrings.
+
+This avoids building a complete syntax tree, instead splicing the rewritten
+strings directly into the original source code, which is much faster than
+the libcst engine and requires far less memory.
+"""
+import re
+import tokenize
+from io import StringIO
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator
+
+from .__evaluator import RuleEvaluator
+from .errors import TransformErrorInfo
+
+if TYPE_CHECKING:
+    from libcst.metadata import CodePosition
+    from .__transformer import DocstringMode
+
+
+def make_position(line: int, column: int) -> 'CodePosition':
+    """
+    Create a position for use with error reporting.
+
+    libcst is only imported when an error is reported, so that successful
+    transformations never need to load it.
+    """
+    from libcst.metadata import CodePosition
+    return CodePosition(line, column)
+
+
+COMPOUND_KEYWORDS = frozenset({
+    "if", "elif", "else", "for", "while", "with", "try", "except", "finally",
+    "def", "class", "async",
+})
+"""Keywords which begin the header of a compound statement"""
+
+SOFT_COMPOUND_KEYWORDS = frozenset({"match", "case"})
+"""Soft keywords which may begin the header of a compound statement"""
+
+OPENING_BRACKETS = frozenset({"(", "[", "{"})
+CLOSING_BRACKETS = frozenset({")", "]", "}"})
+
+
+def is_compound_header(statement: list[tokenize.TokenInfo]) -> bool:
+    """
+    Returns whether the given tokens (up to a `:` which isn't within
+    brackets) are the header of a compound statement.
+    """
+    if not statement or statement[0].type != tokenize.NAME:
+        return False
+    first = statement[0].string
+    if first in COMPOUND_KEYWORDS:
+        return True
+    # Distinguish eg `match x:` from `match: int`, or `match.x: int`
+    return (
+        first in SOFT_COMPOUND_KEYWORDS
+        and len(statement) > 1
+        and statement[1].string not in {"=", ".", ":"}
+    )
+
+
+def is_definition(statement: list[tokenize.TokenInfo]) -> bool:
+    """
+    Returns whether the given compound statement header is the header of a
+    function or class definition.
+    """
+    names = [token.string for token in statement[:2]]
+    return names[0] in {"def", "class"} or names == ["async", "def"]
+
+
+def is_assignment(statement: list[tokenize.TokenInfo]) -> bool:
+    """
+    Returns whether the given simple statement is an assignment, or an
+    annotated assignment.
+    """
+    if statement and statement[0].string == "lambda":
+        return False
+    depth = 0
+    for token in statement:
+        if token.type != tokenize.OP:
+            continue
+        if token.string in OPENING_BRACKETS:
+            depth += 1
+        elif token.string in CLOSING_BRACKETS:
+            depth -= 1
+        elif depth == 0 and token.string in {"=", ":"}:
+            return True
+    return False
+
+
+def find_docstrings(
+    tokens: Iterable[tokenize.TokenInfo],
+) -> Iterator[tokenize.TokenInfo]:
+    """
+    Find the string tokens which are docstrings, meaning module, class and
+    function docstrings, and attribute docstrings (string expression
+    statements which immediately follow an assignment).
+
+    This matches the strings processed by the libcst engine in precise mode.
+    """
+    # Whether a string expression statement in the current position is a
+    # docstring
+    is_docstring = True
+    statement: list[tokenize.TokenInfo] = []
+    depth = 0
+    # Whether the current line contains a compound statement header, and
+    # whether it ends with its header (rather than its body)
+    header_line = False
+    ends_with_header = False
+
+    for token in tokens:
+        kind = token.type
+        if kind in (tokenize.COMMENT, tokenize.NL, tokenize.INDENT):
+            continue
+        if kind == tokenize.DEDENT:
+            # The next statement follows a compound statement
+            is_docstring = False
+            continue
+
+        is_op = kind == tokenize.OP
+        if is_op and token.string in OPENING_BRACKETS:
+            depth += 1
+        elif is_op and token.string in CLOSING_BRACKETS:
+            depth -= 1
+        at_top = is_op and depth == 0
+        header_end = (
+            at_top
+            and token.string == ":"
+            and is_compound_header(statement)
+        )
+        line_end = kind in (tokenize.NEWLINE, tokenize.ENDMARKER)
+
+        if not (line_end or header_end or at_top and token.string == ";"):
+            statement.append(token)
+            ends_with_header = False
+            continue
+
+        if statement:
+            if (
+                is_docstring
+                and len(statement) == 1
+                and statement[0].type == tokenize.STRING
+            ):
+                yield statement[0]
+            if header_end:
+                is_docstring = is_definition(statement)
+            else:
+                is_docstring = is_assignment(statement)
+        statement = []
+
+        if header_end:
+            header_line = True
+            ends_with_header = True
+        elif line_end:
+            if header_line and not ends_with_header:
+                # The statement after a compound statement written on a
+                # single line isn't a docstring
+                is_docstring = False
+            header_line = False
+            ends_with_header = False
+
+
+def tokenize_rewrite(
+    source: str,
+    evaluator: RuleEvaluator,
+    docstrings: 'DocstringMode' = "precise",
+) -> tuple[str, Callable[[], list[TransformErrorInfo]]]:
+    """
+    Rewrite the docstrings within the given Python source code using
+    `tokenize`, processing them using the given evaluator. `docstrings`
+    determines which strings are processed (see `DocstringMode`).
+
+    The output is identical to the output of the libcst engine.
+
+    Returns the rewritten code, along with a function which returns any
+    errors, which must be called after the evaluator reports its errors.
+    """
+    errors: list[tuple[tuple[int, int], tuple[int, int], Exception]] = []
+
+    # Tokens refer to lines as split by `readline`, so we need to know where
+    # they start in order to find the offset of each token
+    line_starts = [0]
+    line_starts.extend(match.end() for match in re.finditer("\n", source))
+
+    parts: list[str] = []
+    pos = 0
+
+    tokens = tokenize.generate_tokens(StringIO(source).readline)
+    if docstrings == "precise":
+        strings = find_docstrings(tokens)
+    else:
+        strings = (token for token in tokens if token.type == tokenize.STRING)
+
+    for token in strings:
+        string = token.string
+        # Strings with prefixes (eg f-strings, raw strings) aren't treated as
+        # docstrings
+        if not (string.startswith('"""') or string.startswith("'''")):
+            continue
+
+        row, column = token.start
+        start = line_starts[row - 1] + column
+        quote_type = string[0:3]
+
+        def report_error(
+            offset: tuple[int, int],
+            error: Exception,
+            token_start: tuple[int, int] = token.start,
+        ) -> None:
+            errors.append((token_start, offset, error))
+
+        processed = evaluator.process_docstring(
+            string[3:-3],
+            column,
+            report_error,
+        )
+
+        parts.append(source[pos:start])
+        parts.append(f"{quote_type}{processed}{quote_type}")
+        pos = start + len(string)
+
+    def get_errors() -> list[TransformErrorInfo]:
+        return [
+            TransformErrorInfo(
+                make_position(
+                    row + line,
+                    offset_column if line else column + offset_column,
+                ),
+                error,
+            )
+            for (row, column), (line, offset_column), error in errors
+        ]
+
+    parts.append(source[pos:])
+    return "".join(parts), get_errors
@@ -1,10 +1,13 @@
 """
 # Transdoc / transformer
 
-Use libcst to rewrite docstrings.
+Rewrite the docstrings within Python source code.
 """
+import asyncio
 import inspect
-from io import StringIO
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
 from types import (
     FunctionType,
     ModuleType,
@@ -13,18 +16,14 @@ from types import (
     TracebackType,
     FrameType,
 )
-from typing import Union, Optional
-import libcst as cst
-from libcst.metadata import CodePosition, PositionProvider, MetadataWrapper
+from typing import Callable, Iterable, Iterator, Literal, Optional, Union
 
+from .__cache import RuleCache
+from .__evaluator import DEFAULT_CONCURRENCY, RuleEvaluator
 from .__rule import Rule
 from .__collect_rules import collect_rules
-from .errors import (
-    TransdocTransformationError,
-    TransformErrorInfo,
-    TransdocSyntaxError,
-    TransdocNameError,
-)
+from .__stats import Stats, time_phase
+from .errors import TransdocTransformationError, TransformErrorInfo
 
 
 # FIXME: This isn't especially safe - find a nicer type annotation to use
@@ -39,245 +38,45 @@ SourceObjectType = Union[
 ]
 
 
-def indent_by(amount: int, string: str) -> str:
-    return '\n'.join(
-        [f"{' ' * amount}{line.rstrip()}" for line in string.splitlines()]
-    ).lstrip()
-
-
-class DocTransformer(cst.CSTTransformer):
-    """
-    Rewrite documentation.
-    """
-    METADATA_DEPENDENCIES = (PositionProvider,)
-
-    def __init__(self, rules: dict[str, Rule]) -> None:
-        """
-        Create an instance of the doc transformer module
-        """
-        self.__rules = rules
-        self.__errors: list[TransformErrorInfo] = []
-        self.__current_node: Optional[cst.CSTNode] = None
-
-    def get_errors(self) -> list[TransformErrorInfo]:
-        return self.__errors
-
-    def __get_position(
-        self,
-        offset: Optional[tuple[int, int]] = None,
-    ) -> CodePosition:
-        """
-        Returns the position of the given node, for use with error reporting.
-        """
-        assert self.__current_node is not None
-        position = self.get_metadata(
-            PositionProvider,
-            self.__current_node,
-        ).start
-
-        if offset is not None:
-            line, column = offset
-
-            if line:
-                new_line = position.line + line
-                new_col = column
-            else:
-                new_line = position.line
-                new_col = position.column + column
-
-            position = CodePosition(new_line, new_col)
-
-        return position
-
-    def __report_error(
-        self,
-        position: CodePosition,
-        error_info: Exception,
-    ):
-        """
-        Report an error
-        """
-        self.__errors.append(TransformErrorInfo(
-            position,
-            error_info,
-        ))
+Engine = Literal["libcst", "tokenize"]
+"""
+Engine used to locate and rewrite docstrings.
 
-    def __report_rule_if_unknown(self, rule_name: str, position: CodePosition):
-        """
-        Ensure a rule is known, and report an error if it is not.
+* `"libcst"`: parse the code into a concrete syntax tree using libcst.
+* `"tokenize"`: locate strings using the standard library's `tokenize`
+  module, and splice the results into the original source code. This is
+  faster and uses less memory, and does not require libcst to be imported.
+"""
 
-        Return `True` if an error was reported.
-        """
-        if rule_name not in self.__rules:
-            self.__report_error(
-                position,
-                TransdocNameError(f"unknown rule '{rule_name}'"),
-            )
-            return True
-        return False
+ENGINES: tuple[Engine, ...] = ("libcst", "tokenize")
 
-    def __eval_rule(
-        self,
-        rule: str,
-        position: CodePosition,
-        indent: int,
-    ) -> str:
-        """
-        Execute a command, alongside the given set of rules.
-        """
-        # if it's just a function name, evaluate it as a call with no arguments
-        if rule.isidentifier():
-            if self.__report_rule_if_unknown(rule, position):
-                return ""
-            try:
-                return indent_by(indent, self.__rules[rule]())
-            except Exception as e:
-                self.__report_error(position, e)
-                return ""
-        # If it uses square brackets, then extract the contained string, and
-        # pass that
-        if rule.split('[')[0].isidentifier() and rule.endswith(']'):
-            rule_name, *content = rule.split('[')
-            content_str = '['.join(content).removesuffix(']')
-            if self.__report_rule_if_unknown(rule_name, position):
-                return ""
-            try:
-                return indent_by(indent, self.__rules[rule_name](content_str))
-            except Exception as e:
-                self.__report_error(position, e)
-                return ""
-        # Otherwise, it should be a regular function call
-        # This calls `eval` with the rules dictionary set as the globals, since
-        # otherwise it'd just be too complex to parse things.
-        if rule.split('(')[0].isidentifier() and rule.endswith(')'):
-            if self.__report_rule_if_unknown(rule.split('(')[0], position):
-                return ""
-            try:
-                return indent_by(indent, eval(rule, self.__rules))
-            except Exception as e:
-                self.__report_error(position, e)
-                return ""
-
-        # If we reach this point, it's not valid data, and we should give an
-        # error
-        self.__report_error(
-            position,
-            TransdocSyntaxError(
-                "unable to evaluate rule due to invalid syntax"
-            ),
-        )
-        return ""
 
-    def __process_docstring(self, docstring: str) -> str:
-        """
-        Process the given docstring according to the rules of the
-        DocTransformer.
-        """
-        # This code is extremely yucky but I cannot be bothered to write a
-        # nicer version of it
-        # Perhaps I could use a state machine or something?
-        new_doc = StringIO()
-        cmd_buffer = StringIO()
-        in_cmd_buffer = False
-        brace_count = 0
-        cmd_start_position: Optional[CodePosition] = None
-
-        indent_level = self.__get_position().column
-
-        # Column offset starts at 3 to account for stripped out triple-quotes
-        col_offset = 3
-        line_offset = 0
-        for c in docstring:
-            if in_cmd_buffer:
-                # FIXME: This assumes that all instances of `}}` close the
-                # buffer, which isn't necessarily the case. This will break
-                # function calls where nested dicts are used as arguments.
-                if c == "}":
-                    brace_count += 1
-                    if brace_count == 2:
-                        # End of command, let's execute it
-                        cmd_buffer.seek(0)
-                        assert cmd_start_position is not None
-                        new_doc.write(self.__eval_rule(
-                            cmd_buffer.read(),
-                            cmd_start_position,
-                            indent_level,
-                        ))
-                        cmd_buffer = StringIO()
-                        in_cmd_buffer = False
-                        cmd_start_position = None
-                        brace_count = 0
-                else:
-                    # If we previously found a closing brace
-                    if brace_count == 1:
-                        cmd_buffer.write("}")
-                    brace_count = 0
-                    cmd_buffer.write(c)
-            else:
-                if c == "{":
-                    brace_count += 1
-                    if brace_count == 2:
-                        cmd_start_position = self.__get_position((
-                            line_offset,
-                            col_offset + 1,
-                        ))
-                        in_cmd_buffer = True
-                        brace_count = 0
-                else:
-                    # If we previously found a closing brace
-                    if brace_count == 1:
-                        new_doc.write("{")
-                    brace_count = 0
-                    new_doc.write(c)
-
-            # Finally update the source position
-            if c == '\n':
-                line_offset += 1
-                col_offset = 0
-            else:
-                col_offset += 1
-
-        # TODO: if we're in a command, report an error, and also clean up extra
-        # brace
-        if in_cmd_buffer:
-            assert cmd_start_position is not None
-            self.__report_error(
-                cmd_start_position,
-                TransdocSyntaxError(
-                    "unfinished command: are you missing a closing '}}'?"
-                ),
-            )
+DocstringMode = Literal["precise", "all"]
+"""
+Which strings are processed as docstrings.
 
-        # Return the output
-        new_doc.seek(0)
-        return new_doc.read()
+* `"precise"`: module, class and function docstrings, and attribute
+  docstrings (string expression statements which immediately follow an
+  assignment). Other strings, such as SQL queries or templates assigned to
+  variables, are skipped without being scanned for rules.
+* `"all"`: every triple-quoted string.
+"""
 
-    def leave_SimpleString(
-        self,
-        original_node: cst.SimpleString,
-        updated_node: cst.SimpleString,
-    ) -> cst.BaseExpression:
-        """
-        After visiting a string, check if it is a triple-quoted string. If so,
-        apply formatting to it.
+DOCSTRING_MODES: tuple[DocstringMode, ...] = ("precise", "all")
 
-        Currently, I'm assuming that all triple-quoted strings are docstrings
-        so that we can handle attribute docstrings (which otherwise don't work
-        very nicely).
-        """
-        self.__current_node = original_node
-        string = original_node.value
-        if string.startswith('"""') or string.startswith("'''"):
-            quote_type = string[0:3]
 
-            processed = self.__process_docstring(updated_node.value[3:-3])
-
-            return updated_node.with_changes(
-                value=f"{quote_type}{processed}{quote_type}"
-            )
+def may_contain_rules(source: str) -> bool:
+    """
+    Cheaply determine whether the given source code could contain any rules.
 
-        self.__current_node = None
-        return updated_node
+    This only returns `False` when transforming the source is guaranteed to
+    leave it unchanged, either because it contains no `{{` rule markers, or
+    because it contains no triple-quoted strings for them to appear in. This
+    allows files without rules to skip parsing entirely.
+    """
+    if "{{" not in source:
+        return False
+    return '"""' in source or "'''" in source
 
 
 def make_rules_dict(rules: list[Rule]) -> dict[str, Rule]:
@@ -287,9 +86,77 @@ def make_rules_dict(rules: list[Rule]) -> dict[str, Rule]:
     return {r.__name__: r for r in rules}
 
 
+def normalize_rules(
+    rules: Union[list[Rule], dict[str, Rule], ModuleType],
+    cache: Optional[RuleCache] = None,
+    stats: Optional[Stats] = None,
+) -> dict[str, Rule]:
+    """
+    Convert the given rules into a dictionary of rules, using the given
+    cache, and timing rules using the given stats, if any.
+    """
+    if isinstance(rules, ModuleType):
+        rules = collect_rules(rules)
+    elif isinstance(rules, list):
+        rules = make_rules_dict(rules)
+    if stats is not None:
+        # Only time rules when they are actually evaluated, not when their
+        # results are found in the cache
+        rules = stats.wrap(rules)
+    if cache is not None:
+        rules = cache.wrap(rules)
+    return rules
+
+
+def rewrite(
+    source: str,
+    evaluator: RuleEvaluator,
+    engine: Engine,
+    stats: Optional[Stats] = None,
+    docstrings: DocstringMode = "precise",
+) -> tuple[str, Callable[[], list[TransformErrorInfo]]]:
+    """
+    Rewrite the docstrings within the given source code using the given
+    engine, returning the rewritten code, and a function to get the errors.
+    """
+    # Engines are imported lazily, so that libcst is only loaded if it is
+    # used
+    if engine == "libcst":
+        from .__libcst_engine import libcst_rewrite
+        return libcst_rewrite(source, evaluator, stats, docstrings)
+    elif engine == "tokenize":
+        from .__tokenize_engine import tokenize_rewrite
+        with time_phase(stats, "scan"):
+            return tokenize_rewrite(source, evaluator, docstrings)
+    else:
+        raise ValueError(f"Unknown transformation engine '{engine}'")
+
+
+def finish(
+    evaluator: RuleEvaluator,
+    processed: str,
+    get_errors: Callable[[], list[TransformErrorInfo]],
+) -> str:
+    """
+    Substitute the results of pending rules into the processed code, raising
+    any errors that occurred.
+    """
+    result = evaluator.substitute(processed)
+    errors = get_errors()
+    if errors:
+        raise TransdocTransformationError(*errors)
+    return result
+
+
 def transform(
     source: Union[str, SourceObjectType],
     rules: Union[list[Rule], dict[str, Rule], ModuleType],
+    *,
+    engine: Engine = "libcst",
+    docstrings: DocstringMode = "precise",
+    cache: Optional[RuleCache] = None,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    stats: Optional[Stats] = None,
 ) -> str:
     """
     Transform the Python code by rewriting its documentation according to the
@@ -304,6 +171,32 @@ def transform(
     * `rules` (`list[Rule] | dict[str, Rule] | ModuleRule`): a list of rules to
       apply, or a module containing these rules.
 
+    ## Keyword args
+
+    * `engine` (`"libcst" | "tokenize"`, optional): engine used to rewrite
+      the source code. Both engines produce identical results, but the
+      `"tokenize"` engine is faster, and doesn't need to import libcst.
+      Defaults to `"libcst"`.
+
+    * `docstrings` (`"precise" | "all"`, optional): which strings are
+      processed. By default, only module, class, function and attribute
+      docstrings are processed. Use `"all"` to process every triple-quoted
+      string.
+
+    * `cache` (`RuleCache`, optional): cache used to store the results of
+      pure rules (see `transdoc.pure`). Sharing a cache between calls allows
+      results to be reused across many files. If not given, results are not
+      cached.
+
+    * `concurrency` (`int`, optional): maximum number of async rules to
+      evaluate at once. Async rules are evaluated using a new event loop, so
+      this function can't be used while an event loop is running. Use
+      `transform_async` instead.
+
+    * `stats` (`Stats`, optional): statistics used to record the time spent
+      in each phase of the transformation, and by each rule. If not given,
+      no statistics are gathered.
+
     ## Raises
 
     * `TransdocTransformationError`: collection of errors produced when
@@ -313,18 +206,222 @@ def transform(
 
     * `str`: the transformed source code, with all rules applied.
     """
+    return transform_normalized(
+        source,
+        normalize_rules(rules, cache, stats),
+        engine=engine,
+        docstrings=docstrings,
+        concurrency=concurrency,
+        stats=stats,
+    )
+
+
+def transform_normalized(
+    source: Union[str, SourceObjectType],
+    rules: dict[str, Rule],
+    *,
+    engine: Engine,
+    docstrings: DocstringMode,
+    concurrency: int,
+    stats: Optional[Stats],
+) -> str:
+    """
+    Transform the given source code using the given normalized rules.
+    """
     if not isinstance(source, str):
         source = inspect.getsource(source)
-    if isinstance(rules, ModuleType):
-        rules = collect_rules(rules)
-    elif isinstance(rules, list):
-        rules = make_rules_dict(rules)
-    parsed = MetadataWrapper(cst.parse_module(source))
-    transformer = DocTransformer(rules)
-    updated_cst = parsed.visit(transformer)
+    if not may_contain_rules(source):
+        # Fast path: nothing to transform, so don't bother parsing the code
+        return source
+    evaluator = RuleEvaluator(rules)
+    processed, get_errors = rewrite(
+        source,
+        evaluator,
+        engine,
+        stats,
+        docstrings,
+    )
+    with time_phase(stats, "evaluate"):
+        evaluator.run_pending(concurrency)
+    with time_phase(stats, "codegen"):
+        return finish(evaluator, processed, get_errors)
+
+
+@dataclass(frozen=True)
+class TransformResult:
+    """
+    Result of transforming one of the sources given to `transform_many`.
+    """
+    source: Union[str, SourceObjectType]
+    """The source, as given to `transform_many`"""
+    output: Optional[str]
+    """The transformed source code, or `None` if an error occurred"""
+    error: Optional[Exception]
+    """
+    The error that occurred while transforming the source, if any. This is
+    usually a `TransdocTransformationError`, but may also be an error
+    produced when getting the source code of an object, or parsing it.
+    """
 
-    errors = transformer.get_errors()
-    if errors:
-        raise TransdocTransformationError(*errors)
+    def unwrap(self) -> str:
+        """
+        Returns the transformed source code, raising the error if one
+        occurred.
+        """
+        if self.error is not None:
+            raise self.error
+        assert self.output is not None
+        return self.output
+
+
+def transform_many(
+    sources: Iterable[Union[str, SourceObjectType]],
+    rules: Union[list[Rule], dict[str, Rule], ModuleType],
+    *,
+    engine: Engine = "libcst",
+    docstrings: DocstringMode = "precise",
+    cache: Optional[RuleCache] = None,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    stats: Optional[Stats] = None,
+    jobs: int = 1,
+) -> Iterator[TransformResult]:
+    """
+    Transform many pieces of Python code using the same rules.
+
+    The rules are only collected once, rather than once per source, and
+    errors are included in the results rather than being raised, so that
+    one invalid source doesn't prevent the others from being transformed.
+
+    ## Args
+
+    * `sources` (`Iterable[str | SourceObjectType]`): source code to
+      transform, in the same forms accepted by `transform`. Sources are
+      consumed lazily.
+
+    * `rules` (`list[Rule] | dict[str, Rule] | ModuleRule`): a list of rules to
+      apply, or a module containing these rules.
+
+    ## Keyword args
+
+    * `jobs` (`int`, optional): number of threads used to transform sources
+      concurrently. Defaults to `1`, which transforms each source as its
+      result is requested.
 
-    return updated_cst.code
+    Other keyword arguments are the same as for `transform`.
+
+    ## Returns
+
+    * `Iterator[TransformResult]`: the result of transforming each source,
+      in the same order as the sources.
+    """
+    normalized = normalize_rules(rules, cache, stats)
+
+    def transform_one(source: Union[str, SourceObjectType]) -> TransformResult:
+        try:
+            output = transform_normalized(
+                source,
+                normalized,
+                engine=engine,
+                docstrings=docstrings,
+                concurrency=concurrency,
+                stats=stats,
+            )
+        except Exception as e:
+            return TransformResult(source, None, e)
+        return TransformResult(source, output, None)
+
+    if jobs <= 1:
+        for source in sources:
+            yield transform_one(source)
+        return
+
+    with ThreadPoolExecutor(jobs) as executor:
+        # Only submit a few sources ahead of the results that have been
+        # requested, so that sources are still consumed lazily
+        pending: deque[Future[TransformResult]] = deque()
+        for source in sources:
+            pending.append(executor.submit(transform_one, source))
+            if len(pending) >= 2 * jobs:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+async def transform_with_limiter(
+    source: str,
+    rules: dict[str, Rule],
+    *,
+    engine: Engine,
+    docstrings: DocstringMode,
+    limiter: asyncio.Semaphore,
+    stats: Optional[Stats] = None,
+) -> str:
+    """
+    Transform the given source code using the given normalized rules,
+    evaluating async rules using the given `limiter`, which may be shared
+    with other transformations.
+
+    Parsing, code generation and sync rules are run in a separate thread, so
+    that they don't block the event loop while async rules used by other
+    transformations are evaluated. Only async rules are awaited using the
+    event loop.
+    """
+    if not may_contain_rules(source):
+        return source
+    evaluator = RuleEvaluator(rules)
+    processed, get_errors = await asyncio.to_thread(
+        rewrite,
+        source,
+        evaluator,
+        engine,
+        stats,
+        docstrings,
+    )
+    with time_phase(stats, "evaluate"):
+        await evaluator.await_pending(limiter)
+    with time_phase(stats, "codegen"):
+        return await asyncio.to_thread(
+            finish,
+            evaluator,
+            processed,
+            get_errors,
+        )
+
+
+async def transform_async(
+    source: Union[str, SourceObjectType],
+    rules: Union[list[Rule], dict[str, Rule], ModuleType],
+    *,
+    engine: Engine = "libcst",
+    docstrings: DocstringMode = "precise",
+    cache: Optional[RuleCache] = None,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    stats: Optional[Stats] = None,
+) -> str:
+    """
+    Transform the Python code by rewriting its documentation according to the
+    given rules, evaluating async rules using the running event loop.
+
+    All uses of async rules are evaluated concurrently, with at most
+    `concurrency` evaluated at once. Other arguments are the same as for
+    `transform`.
+
+    ## Raises
+
+    * `TransdocTransformationError`: collection of errors produced when
+      performing the transformation.
+
+    ## Returns
+
+    * `str`: the transformed source code, with all rules applied.
+    """
+    if not isinstance(source, str):
+        source = inspect.getsource(source)
+    return await transform_with_limiter(
+        source,
+        normalize_rules(rules, cache, stats),
+        engine=engine,
+        docstrings=docstrings,
+        limiter=asyncio.Semaphore(concurrency),
+        stats=stats,
+    )
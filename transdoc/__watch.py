@@ -0,0 +1,556 @@
+"""
+# Transdoc / Watch
+
+Watch an input directory, and re-transform files as they change.
+"""
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+from pathlib import Path
+from shutil import rmtree
+from typing import Optional, Protocol, Sequence
+
+from transdoc.__cache import RuleCache
+from transdoc.__collect_rules import collect_rules
+from transdoc.__copy import CopyStrategy
+from transdoc.__discovery import DEFAULT_EXCLUDES, GITIGNORE_FILE, FileFilter
+from transdoc.__evaluator import DEFAULT_CONCURRENCY
+from transdoc.__processor import (
+    FileMapping,
+    ProcessOptions,
+    display_error_list,
+    load_rule_file,
+    main,
+    process_files,
+    remove_output,
+)
+from transdoc.__rule import Rule
+from transdoc.__transformer import DocstringMode, Engine
+
+
+DEBOUNCE_TIME = 0.2
+"""
+Number of seconds without any further changes before a batch of changes is
+processed
+"""
+
+POLL_INTERVAL = 0.5
+"""Number of seconds between each scan when polling for changes"""
+
+
+class Watcher(Protocol):
+    """
+    Source of file system changes.
+    """
+
+    def wait(self, timeout: Optional[float]) -> set[Path]:
+        """
+        Wait up to `timeout` seconds (or indefinitely if `None`) for changes,
+        returning the paths that changed. If nothing changes, the set is
+        empty.
+        """
+        ...
+
+    def close(self) -> None:
+        """
+        Stop watching for changes.
+        """
+        ...
+
+
+# Constants from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+
+INOTIFY_MASK = (
+    IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+    | IN_CREATE | IN_DELETE
+)
+
+INOTIFY_EVENT = struct.Struct("iIII")
+"""Header of an inotify event: watch descriptor, mask, cookie, name length"""
+
+
+class InotifyWatcher:
+    """
+    Watch directories for changes using Linux's inotify API.
+    """
+
+    def __init__(
+        self,
+        directories: list[Path],
+        files: list[Path],
+        file_filter: Optional[FileFilter] = None,
+    ) -> None:
+        """
+        Watch the given directories, including all of their subdirectories
+        which aren't excluded by the given `file_filter` (see
+        `make_watcher`), as well as the given files.
+
+        Raises `OSError` if inotify is unavailable.
+        """
+        library = ctypes.util.find_library("c")
+        if not sys.platform.startswith("linux") or library is None:
+            raise OSError("inotify is only available on Linux")
+        self.__libc = ctypes.CDLL(library, use_errno=True)
+        self.__libc.inotify_add_watch.argtypes = [
+            ctypes.c_int,
+            ctypes.c_char_p,
+            ctypes.c_uint32,
+        ]
+        fd = self.__libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self.__fd: int = fd
+        self.__watches: dict[int, Path] = {}
+        self.__filters: dict[int, FileFilter] = {}
+        """Filters used for the subdirectories of each watched directory"""
+        for directory in directories:
+            self.__watch_tree(
+                directory,
+                file_filter or FileFilter(str(directory)),
+            )
+        # Editors often replace files rather than modifying them, so watch
+        # the directories containing the files rather than the files
+        # themselves
+        for file in files:
+            self.__watch_directory(file.parent)
+
+    def __watch_directory(
+        self,
+        directory: Path,
+        file_filter: Optional[FileFilter] = None,
+    ) -> None:
+        """
+        Watch the given directory, excluding its subdirectories. If a
+        `file_filter` is given, subdirectories created within it are watched
+        too, unless they are excluded.
+        """
+        wd = self.__libc.inotify_add_watch(
+            self.__fd,
+            os.fsencode(directory),
+            INOTIFY_MASK,
+        )
+        if wd >= 0:
+            self.__watches[wd] = directory
+            if file_filter is not None:
+                self.__filters[wd] = file_filter
+
+    def __watch_tree(self, root: Path, file_filter: FileFilter) -> list[Path]:
+        """
+        Watch the given directory and all of its subdirectories which aren't
+        excluded by the given filter, returning the files already within
+        them.
+        """
+        files: list[Path] = []
+        for path, _, is_dir in file_filter.scan(str(root)):
+            if is_dir:
+                self.__watch_directory(Path(path), file_filter)
+            else:
+                files.append(Path(path))
+        return files
+
+    def wait(self, timeout: Optional[float]) -> set[Path]:
+        ready, _, _ = select.select([self.__fd], [], [], timeout)
+        if not ready:
+            return set()
+        try:
+            data = os.read(self.__fd, 1 << 16)
+        except BlockingIOError:
+            return set()
+
+        changes: set[Path] = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+
+            if mask & IN_IGNORED:
+                self.__watches.pop(wd, None)
+                self.__filters.pop(wd, None)
+                continue
+            directory = self.__watches.get(wd)
+            if directory is None:
+                continue
+            path = directory.joinpath(name) if name else directory
+            if mask & IN_ISDIR:
+                file_filter = self.__filters.get(wd)
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    # Watch new directories, including any files and
+                    # subdirectories created before we started watching them
+                    if file_filter is not None:
+                        changes.update(self.__watch_tree(path, file_filter))
+                elif not mask & (IN_DELETE | IN_MOVED_FROM):
+                    # Changes to a directory's attributes don't affect its
+                    # contents
+                    continue
+            changes.add(path)
+        return changes
+
+    def close(self) -> None:
+        os.close(self.__fd)
+
+
+class PollingWatcher:
+    """
+    Watch directories for changes by periodically checking the modification
+    times of all files.
+    """
+
+    def __init__(
+        self,
+        directories: list[Path],
+        files: list[Path],
+        file_filter: Optional[FileFilter] = None,
+        interval: float = POLL_INTERVAL,
+    ) -> None:
+        """
+        Watch the given directories, including all of their subdirectories
+        which aren't excluded by the given `file_filter` (see
+        `make_watcher`), as well as the given files, checking for changes
+        every `interval` seconds.
+        """
+        self.__trees = [
+            (directory, file_filter or FileFilter(str(directory)))
+            for directory in directories
+        ]
+        self.__files = files
+        self.__interval = interval
+        self.__snapshot = self.__scan()
+
+    def __scan(self) -> dict[Path, tuple[int, int]]:
+        """
+        Returns the modification time and size of all files being watched.
+        """
+        paths = list(self.__files)
+        for directory, file_filter in self.__trees:
+            paths.extend(
+                Path(path) for path, _ in file_filter.walk(str(directory))
+            )
+        snapshot = {}
+        for path in paths:
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def wait(self, timeout: Optional[float]) -> set[Path]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            delay = self.__interval
+            if deadline is not None:
+                delay = max(0.0, min(delay, deadline - time.monotonic()))
+            time.sleep(delay)
+
+            snapshot = self.__scan()
+            changes = {
+                path
+                for path in snapshot.keys() | self.__snapshot.keys()
+                if snapshot.get(path) != self.__snapshot.get(path)
+            }
+            self.__snapshot = snapshot
+            if changes:
+                return changes
+            if deadline is not None and time.monotonic() >= deadline:
+                return set()
+
+    def close(self) -> None:
+        pass
+
+
+def make_watcher(
+    directories: list[Path],
+    files: list[Path],
+    file_filter: Optional[FileFilter] = None,
+) -> Watcher:
+    """
+    Create a watcher for the given directories and files, using inotify if it
+    is available, and polling otherwise.
+
+    Files and subdirectories within the directories which are excluded by
+    the given `file_filter`, whose root must contain the directories, are
+    never watched or scanned. If no filter is given, the directories in
+    `DEFAULT_EXCLUDES` are skipped.
+    """
+    try:
+        return InotifyWatcher(directories, files, file_filter)
+    except OSError:
+        return PollingWatcher(directories, files, file_filter)
+
+
+def wait_for_batch(
+    watcher: Watcher,
+    debounce: float = DEBOUNCE_TIME,
+) -> set[Path]:
+    """
+    Wait for changes, then continue collecting changes until none occur for
+    `debounce` seconds, so that bursts of changes (eg from a `git checkout`)
+    are processed as a single batch.
+    """
+    changes = watcher.wait(None)
+    while more := watcher.wait(debounce):
+        changes |= more
+    return changes
+
+
+class WatchSession:
+    """
+    Transform changed files from the input directory into the output
+    directory, keeping rules loaded between batches of changes.
+    """
+
+    def __init__(
+        self,
+        input: Path,
+        rule_file: Path,
+        output: Path,
+        *,
+        engine: Engine,
+        jobs: int,
+        docstrings: DocstringMode = "precise",
+        cache: Optional[RuleCache] = None,
+        copy_strategy: CopyStrategy = "copy",
+        concurrency: int = DEFAULT_CONCURRENCY,
+        deduplicate: bool = False,
+        include: Sequence[str] = (),
+        exclude: Sequence[str] = DEFAULT_EXCLUDES,
+        gitignore: bool = False,
+        rules: Optional[dict[str, Rule]] = None,
+    ) -> None:
+        """
+        Create a session, using the given `rules` if they were already
+        loaded from the `rule_file`.
+        """
+        self.__input = input.absolute()
+        self.__rule_file = rule_file.absolute()
+        self.__output = output.absolute()
+        self.__filter = FileFilter(
+            str(self.__input),
+            include=include,
+            exclude=exclude,
+            gitignore=gitignore,
+            skip=str(self.__output),
+        )
+        self.__engine = engine
+        self.__docstrings: DocstringMode = docstrings
+        self.__jobs = jobs
+        self.__rules: dict[str, Rule] = (
+            collect_rules(load_rule_file(rule_file))
+            if rules is None
+            else rules
+        )
+        self.__cache = RuleCache() if cache is None else cache
+        self.__copy_strategy: CopyStrategy = copy_strategy
+        self.__concurrency = concurrency
+        self.__deduplicate = deduplicate
+
+    def make_watcher(self) -> Watcher:
+        """
+        Create a watcher for the input directory and the rule file.
+        """
+        return make_watcher(
+            [self.__input],
+            [self.__rule_file],
+            self.__filter,
+        )
+
+    def __mapping(self, file: Path) -> FileMapping:
+        return FileMapping(
+            file,
+            self.__output.joinpath(file.relative_to(self.__input)),
+            file.suffix == ".py",
+        )
+
+    def __reload_rules(self) -> bool:
+        """
+        Reload the rule file, returning whether it was successful.
+        """
+        try:
+            self.__rules = collect_rules(load_rule_file(self.__rule_file))
+            # Cached results may be outdated by changes to the rules
+            self.__cache.clear()
+            return True
+        except Exception as e:
+            print(
+                f"Error when importing rule file '{self.__rule_file}':\n"
+                f"    {e}",
+                file=sys.stderr,
+            )
+            return False
+
+    def handle_changes(self, changes: set[Path]) -> int:
+        """
+        Process the given set of changed paths, returning the number of files
+        that were processed.
+        """
+        changes = {path.absolute() for path in changes}
+        mappings: dict[Path, FileMapping] = {}
+
+        if any(path.name == GITIGNORE_FILE for path in changes):
+            self.__filter.clear()
+
+        if self.__rule_file in changes:
+            if not self.__reload_rules():
+                return 0
+            # All Python files need to be transformed using the new rules
+            for filename, _ in self.__filter.walk():
+                file = Path(filename)
+                if file.suffix == ".py":
+                    mappings[file] = self.__mapping(file)
+
+        for path in changes:
+            if not path.is_relative_to(self.__input):
+                continue
+            if path.is_file():
+                if self.__filter.matches(str(path)):
+                    mappings[path] = self.__mapping(path)
+            elif path.is_dir():
+                for filename, _ in self.__filter.walk(str(path)):
+                    file = Path(filename)
+                    mappings[file] = self.__mapping(file)
+            else:
+                # Removed, so remove its output too
+                out_path = self.__output.joinpath(
+                    path.relative_to(self.__input))
+                if out_path.is_dir():
+                    rmtree(out_path)
+                elif out_path != self.__output:
+                    remove_output(out_path, self.__output)
+
+        results = process_files(
+            list(mappings.values()),
+            self.__rules,
+            self.__rule_file,
+            ProcessOptions(
+                engine=self.__engine,
+                docstrings=self.__docstrings,
+                cache=self.__cache,
+                copy_strategy=self.__copy_strategy,
+                concurrency=self.__concurrency,
+                deduplicate=self.__deduplicate,
+            ),
+            jobs=self.__jobs,
+        )
+        for result in results:
+            if result.error_report is not None:
+                print(result.error_report, file=sys.stderr)
+        return len(mappings)
+
+
+def watch(
+    input: Path,
+    rule_file: Path,
+    output: Optional[Path],
+    *,
+    force: bool = False,
+    verbose: bool = False,
+    engine: Engine = "libcst",
+    docstrings: DocstringMode = "precise",
+    jobs: int = 1,
+    incremental: bool = False,
+    cache: Optional[RuleCache] = None,
+    copy_strategy: CopyStrategy = "copy",
+    concurrency: int = DEFAULT_CONCURRENCY,
+    deduplicate: bool = False,
+    include: Sequence[str] = (),
+    exclude: Sequence[str] = DEFAULT_EXCLUDES,
+    gitignore: bool = False,
+) -> int:
+    """
+    Transform the input directory into the output directory, then watch for
+    changes to the input directory and the rule file, re-transforming files
+    as they change.
+
+    The rule file is only imported once, and the rules are shared between
+    the initial transformation and the watch session, until the rule file
+    changes.
+
+    This runs until interrupted (eg using Ctrl+C).
+    """
+    errors = []
+    if not input.is_dir():
+        errors.append("Watch mode requires an input directory")
+    if output is None:
+        errors.append("Watch mode requires an output directory")
+    rules: Optional[dict[str, Rule]] = None
+    if rule_file.suffix == ".py":
+        # Otherwise, the invalid rule file is reported by `main`
+        try:
+            rules = collect_rules(load_rule_file(rule_file))
+        except Exception as e:
+            errors.append(
+                f"Error when importing rule file '{rule_file}':\n    {e}")
+    if len(errors):
+        return display_error_list(errors)
+    assert output is not None
+
+    status = main(
+        input,
+        rule_file,
+        output,
+        force=force,
+        verbose=verbose,
+        engine=engine,
+        docstrings=docstrings,
+        jobs=jobs,
+        incremental=incremental,
+        cache=cache,
+        copy_strategy=copy_strategy,
+        concurrency=concurrency,
+        deduplicate=deduplicate,
+        include=include,
+        exclude=exclude,
+        gitignore=gitignore,
+        rules=rules,
+    )
+    if status == 2:
+        # Invalid arguments
+        return status
+
+    session = WatchSession(
+        input,
+        rule_file,
+        output,
+        engine=engine,
+        docstrings=docstrings,
+        jobs=jobs,
+        cache=cache,
+        copy_strategy=copy_strategy,
+        concurrency=concurrency,
+        deduplicate=deduplicate,
+        include=include,
+        exclude=exclude,
+        gitignore=gitignore,
+        rules=rules,
+    )
+    watcher = session.make_watcher()
+    print(f"Transdoc: watching '{input}' for changes", file=sys.stderr)
+    try:
+        while True:
+            changes = wait_for_batch(watcher)
+            num_processed = session.handle_changes(changes)
+            if num_processed:
+                print(
+                    f"Transdoc: processed {num_processed} changed files",
+                    file=sys.stderr,
+                )
+    except KeyboardInterrupt:
+        return 0
+    finally:
+        watcher.close()
@@ -0,0 +1,310 @@
+"""
+# Transdoc / Build backend
+
+A PEP 517 build backend which wraps another build backend, transforming the
+Python files within the wheels and sdists that it builds.
+
+In `pyproject.toml`:
+
+```toml
+[build-system]
+requires = ["transdoc", "poetry-core"]
+build-backend = "transdoc.build_backend"
+
+[tool.transdoc]
+backend = "poetry.core.masonry.api"
+rule-file = "rules.py"
+```
+
+Before each archive is built, the project is staged into a temporary
+directory within it, where its Python files are transformed. Other files are
+hard linked into the staging directory, so their contents are never copied.
+The wrapped backend then builds the archive from the staging directory
+directly into its final location, so each archive is only written once.
+
+Files ignored by Git, as well as version control, cache and dependency
+directories (see `DEFAULT_EXCLUDES`), aren't staged, so backends which read
+version control metadata (eg to determine the project's version) aren't
+supported.
+"""
+import importlib
+import os
+import shutil
+import sys
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+from .__cache import RuleCache
+from .__collect_rules import collect_rules
+from .__copy import copy_file
+from .__discovery import DEFAULT_EXCLUDES, FileFilter
+from .__evaluator import DEFAULT_CONCURRENCY
+from .__processor import format_transformation_error, load_rule_file
+from .__rule import Rule
+from .__transformer import (
+    DOCSTRING_MODES,
+    ENGINES,
+    DocstringMode,
+    Engine,
+    normalize_rules,
+    transform_normalized,
+)
+from .errors import TransdocTransformationError, TransformErrorInfo
+
+if sys.version_info >= (3, 11):
+    import tomllib
+else:
+    import tomli as tomllib
+
+
+__all__ = [
+    "build_wheel",
+    "build_sdist",
+]
+
+
+ConfigSettings = Optional[dict[str, Any]]
+
+STAGING_PREFIX = ".transdoc_build_"
+"""Prefix of the temporary directories which projects are staged into"""
+
+
+@dataclass(frozen=True)
+class BackendConfig:
+    """
+    Configuration of the build backend, from the `[tool.transdoc]` table of
+    `pyproject.toml`.
+    """
+    backend: str
+    """Import path of the wrapped build backend"""
+    rule_file: Path
+    """Path to the rule file used to transform Python files"""
+    engine: Engine = "libcst"
+    """Engine used to transform Python files (see `transform`)"""
+    docstrings: DocstringMode = "precise"
+    """Which strings are processed as docstrings (see `transform`)"""
+
+    @staticmethod
+    def load(pyproject: Path = Path("pyproject.toml")) -> 'BackendConfig':
+        """
+        Load the configuration from the given `pyproject.toml`.
+
+        ## Raises
+
+        * `ValueError`: the configuration is missing or invalid.
+        """
+        with open(pyproject, "rb") as f:
+            config = tomllib.load(f).get("tool", {}).get("transdoc", {})
+        for key in ("backend", "rule-file"):
+            if not isinstance(config.get(key), str):
+                raise ValueError(
+                    f"Transdoc build backend requires [tool.transdoc] {key} "
+                    f"to be given in '{pyproject}'"
+                )
+        engine = config.get("engine", "libcst")
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown transformation engine '{engine}'")
+        docstrings = config.get("docstrings", "precise")
+        if docstrings not in DOCSTRING_MODES:
+            raise ValueError(f"Unknown docstring mode '{docstrings}'")
+        return BackendConfig(
+            config["backend"],
+            Path(config["rule-file"]),
+            engine,
+            docstrings,
+        )
+
+    def wrapped(self) -> Any:
+        """
+        Import the wrapped build backend.
+        """
+        module, _, obj = self.backend.partition(":")
+        backend: Any = importlib.import_module(module)
+        # Backends may be objects within modules, eg `module:object`
+        for attribute in filter(None, obj.split(".")):
+            backend = getattr(backend, attribute)
+        return backend
+
+
+class SourceTransformer:
+    """
+    Transforms the Python files within a project, collecting any errors.
+    """
+
+    def __init__(self, config: BackendConfig) -> None:
+        self.config = config
+        rule_file = config.rule_file
+        if not rule_file.exists():
+            raise FileNotFoundError(
+                f"Transdoc rule file '{rule_file}' does not exist"
+            )
+        self.cache = RuleCache()
+        self.rules: dict[str, Rule] = normalize_rules(
+            collect_rules(load_rule_file(rule_file)),
+            self.cache,
+        )
+        self.errors: list[TransformErrorInfo] = []
+
+    @staticmethod
+    def should_transform(name: str) -> bool:
+        """
+        Returns whether the given file from the project is transformed.
+        Other files are staged without being read.
+        """
+        return name.endswith(".py")
+
+    def transform(self, name: str, data: bytes) -> bytes:
+        """
+        Transform the given Python file from the project. If it is
+        unchanged, the given `data` is returned.
+        """
+        try:
+            source = data.decode("utf-8")
+        except UnicodeDecodeError:
+            return data
+        try:
+            result = transform_normalized(
+                source,
+                self.rules,
+                engine=self.config.engine,
+                docstrings=self.config.docstrings,
+                concurrency=DEFAULT_CONCURRENCY,
+                stats=None,
+            )
+        except TransdocTransformationError as e:
+            print(format_transformation_error(Path(name), e), file=sys.stderr)
+            self.errors.extend(e.args)
+            return data
+        if result == source:
+            return data
+        return result.encode("utf-8")
+
+    def check(self) -> None:
+        """
+        Raise the errors that occurred, if any. Reports of the errors are
+        printed as they occur.
+
+        ## Raises
+
+        * `TransdocTransformationError`: files couldn't be transformed.
+        """
+        if self.errors:
+            raise TransdocTransformationError(*self.errors)
+
+
+def stage_project(
+    root: Path,
+    staging: Path,
+    transformer: SourceTransformer,
+) -> None:
+    """
+    Mirror the project's files into the staging directory, transforming its
+    Python files. Other files, and Python files which are unchanged, are
+    hard linked where possible, so that their contents aren't copied.
+    """
+    file_filter = FileFilter(
+        str(root),
+        exclude=(*DEFAULT_EXCLUDES, f"/{STAGING_PREFIX}*/"),
+        gitignore=True,
+    )
+    for path, relative in file_filter.walk():
+        output = staging.joinpath(relative)
+        if transformer.should_transform(relative):
+            data = Path(path).read_bytes()
+            result = transformer.transform(relative, data)
+            if result is not data:
+                output.parent.mkdir(parents=True, exist_ok=True)
+                output.write_bytes(result)
+                shutil.copymode(path, output)
+                continue
+        copy_file(Path(path), output, "hardlink")
+
+
+def build_archive(
+    directory: str,
+    build: Callable[[Any, str], str],
+) -> str:
+    """
+    Stage the project with its Python files transformed, then build an
+    archive from the staging directory into the given directory using
+    `build(backend, directory)`.
+
+    ## Raises
+
+    * `TransdocTransformationError`: files couldn't be transformed, in which
+      case no archive is built.
+    """
+    config = BackendConfig.load()
+    backend = config.wrapped()
+    transformer = SourceTransformer(config)
+    directory = os.path.abspath(directory)
+    root = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix=STAGING_PREFIX, dir=root) as temp:
+        stage_project(Path(root), Path(temp), transformer)
+        transformer.check()
+        # Backends build the project in the working directory
+        os.chdir(temp)
+        try:
+            return build(backend, directory)
+        finally:
+            os.chdir(root)
+
+
+def build_wheel(
+    wheel_directory: str,
+    config_settings: ConfigSettings = None,
+    metadata_directory: Optional[str] = None,
+) -> str:
+    if metadata_directory is not None:
+        # Paths are relative to the project, rather than the staging
+        # directory
+        metadata_directory = os.path.abspath(metadata_directory)
+    return build_archive(
+        wheel_directory,
+        lambda backend, directory: backend.build_wheel(
+            directory,
+            config_settings,
+            metadata_directory,
+        ),
+    )
+
+
+def build_sdist(
+    sdist_directory: str,
+    config_settings: ConfigSettings = None,
+) -> str:
+    return build_archive(
+        sdist_directory,
+        lambda backend, directory: backend.build_sdist(
+            directory,
+            config_settings,
+        ),
+    )
+
+
+OPTIONAL_HOOKS = {
+    "build_editable",
+    "get_requires_for_build_wheel",
+    "get_requires_for_build_sdist",
+    "get_requires_for_build_editable",
+    "prepare_metadata_for_build_wheel",
+    "prepare_metadata_for_build_editable",
+}
+"""
+Optional hooks, which are passed through to the wrapped backend unchanged,
+if it defines them. Metadata isn't affected by transforming Python files,
+and editable installs use the original source code.
+"""
+
+
+def __getattr__(name: str) -> Any:
+    # Frontends check which optional hooks are defined, so only define those
+    # which the wrapped backend defines
+    if name in OPTIONAL_HOOKS:
+        try:
+            return getattr(BackendConfig.load().wrapped(), name)
+        except AttributeError:
+            pass
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -4,7 +4,10 @@
 Definitions for error classes used by Transdoc.
 """
 from dataclasses import dataclass
-from libcst.metadata import CodePosition
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from libcst.metadata import CodePosition
 
 
 @dataclass
@@ -13,7 +16,7 @@ class TransformErrorInfo:
     A simple wrapper class for information about an error that occurred
     during documentation transformation
     """
-    position: CodePosition
+    position: 'CodePosition'
     error_info: Exception
 
 
@@ -4,9 +4,32 @@
 Rule for listing the attributes of the given object.
 """
 import importlib
-from typing import Optional, Callable, Any
+from functools import lru_cache
+from typing import Optional, Callable, Any, TypeVar
 
 
+NAME_ONLY_ATTRIBUTE = "__transdoc_name_only__"
+"""Attribute used to mark filters which only use the attribute's name"""
+
+CACHE_SIZE = 1024
+"""Maximum number of attribute listings cached by the `attributes` rule"""
+
+
+F = TypeVar("F", bound=Callable[[str, Any], bool])
+
+
+def name_only_filter(filter: F) -> F:
+    """
+    Mark an attribute filter as only using the name of the attribute. When
+    using such a filter, the attributes aren't accessed, which avoids
+    triggering properties or lazy loaders, and `None` is given in place of
+    each attribute.
+    """
+    setattr(filter, NAME_ONLY_ATTRIBUTE, True)
+    return filter
+
+
+@name_only_filter
 def attributes_default_filter(attr_name: str, attr_object: Any) -> bool:
     """
     Default filter used by attributes rule.
@@ -56,7 +79,9 @@ def attributes(
       attribute, as well as a reference to it, then return `True` if the
       attribute should be included in the list, or `False` if it should be
       skipped. By default, this skips any attributes whose names start with an
-      underscore (`_`).
+      underscore (`_`). Filters which only use the name of the attribute
+      should be marked using `name_only_filter`, so that the attributes
+      aren't accessed.
 
     * `formatter` (`(str, Optional[str], str) -> str`, optional): a function to
       format the documentation for the attribute. It should accept the
@@ -66,23 +91,45 @@ def attributes(
       used to generate Markdown links, or do other useful things. By default,
       a bullet point followed by the name of the attribute will be provided,
       for example `"* position"`.
+
+    The list is cached for each combination of arguments, so each object's
+    attributes are only listed once.
     """
     if filter is None:
         filter = attributes_default_filter
     if formatter is None:
         formatter = attributes_default_formatter
 
+    return list_attributes(module, object, filter, formatter)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def list_attributes(
+    module: str,
+    object: Optional[str],
+    filter: Callable[[str, Any], bool],
+    formatter: Callable[[str, Optional[str], str], str],
+) -> str:
+    """
+    Generate the list of attributes for the `attributes` rule. Results are
+    cached, and the cache is shared by the rules created by
+    `attributes_generator`.
+    """
     if object is None:
         data = importlib.import_module(module)
     else:
         mod = importlib.import_module(module)
         data = getattr(mod, object)
 
-    return "\n".join(
-        formatter(module, object, attr)
-        for attr in dir(data)
-        if filter(attr, getattr(data, attr))
-    )
+    if getattr(filter, NAME_ONLY_ATTRIBUTE, False) is True:
+        names = [attr for attr in dir(data) if filter(attr, None)]
+    else:
+        names = [
+            attr for attr in dir(data)
+            if filter(attr, getattr(data, attr))
+        ]
+
+    return "\n".join(formatter(module, object, attr) for attr in names)
 
 
 # Sneaky little redefinition so we can use it in the function below
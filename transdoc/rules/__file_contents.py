@@ -1,18 +1,248 @@
 """
 # Transdoc / Rules / File contents
 
-Rule for getting the contents of a file.
+Rules for getting the contents of a file, or part of a file.
 """
-from functools import cache
+import mmap
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional
+
+
+DEFAULT_CACHE_BYTES = 32 * 1024 * 1024
+"""Default maximum total size of the contents stored by a `FileCache`"""
+
+MMAP_THRESHOLD = 1024 * 1024
+"""
+Files of at least this many bytes are memory-mapped when reading part of
+them, rather than being read entirely
+"""
+
+DEFAULT_END_MARKER = "# endregion"
+"""Default marker for the end of a region used by `file_region`"""
+
+
+class FileCache:
+    """
+    Least-recently-used cache of data read from files, bounded by the total
+    size of the data.
+
+    Entries are invalidated when the modification time or size of their
+    file changes, so that edits are picked up when Transdoc is used in watch
+    mode.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_CACHE_BYTES) -> None:
+        self.max_bytes = max_bytes
+        self.size = 0
+        """Total size of the data currently stored, in bytes"""
+        self.__entries: OrderedDict[
+            Hashable,
+            tuple[tuple[int, int], str, int],
+        ] = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def get(
+        self,
+        path: str,
+        key: Hashable,
+        read: Callable[[str], tuple[str, int]],
+    ) -> str:
+        """
+        Returns the data for the given key of the given file, calling
+        `read(path)` to read the data and its size in bytes if it isn't
+        cached, or if the file has changed.
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        key = (path, key)
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None and entry[0] == stamp:
+                self.__entries.move_to_end(key)
+                return entry[1]
+
+        value, size = read(path)
+
+        with self.__lock:
+            previous = self.__entries.pop(key, None)
+            if previous is not None:
+                self.size -= previous[2]
+            if size <= self.max_bytes:
+                self.__entries[key] = (stamp, value, size)
+                self.size += size
+            while self.size > self.max_bytes:
+                _, (_, _, evicted) = self.__entries.popitem(last=False)
+                self.size -= evicted
+        return value
+
+    def clear(self) -> None:
+        """
+        Remove all data from the cache.
+        """
+        with self.__lock:
+            self.__entries.clear()
+            self.size = 0
+
+
+FILE_CACHE = FileCache()
+"""Cache shared by the rules defined in this module"""
+
+
+def decode(data: bytes) -> str:
+    """
+    Decode part of a file, translating newlines in the same way as reading
+    a file in text mode.
+    """
+    return data.decode('utf-8').replace('\r\n', '\n').replace('\r', '\n')
+
+
+def read_slice(
+    path: str,
+    find: Callable[[bytes], tuple[int, int]],
+) -> tuple[str, int]:
+    """
+    Read part of a file, where `find(data)` returns the start and end of the
+    required part of the file's bytes. Large files are memory-mapped, so
+    that only the required part of them is decoded.
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size < MMAP_THRESHOLD:
+            data = f.read()
+            start, end = find(data)
+            return decode(data[start:end]), end - start
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            # mmap supports the `find` method used by all callers, and
+            # slicing, which is all that is required
+            start, end = find(mapped)  # type: ignore[arg-type]
+            return decode(mapped[start:end]), end - start
+
+
+def line_end(data: bytes, start: int) -> int:
+    """
+    Returns the position just after the end of the line containing `start`.
+    """
+    end = data.find(b'\n', start)
+    return len(data) if end == -1 else end + 1
+
+
+def strip_newline(data: bytes, start: int, end: int) -> int:
+    """
+    Returns `end`, moved back so that the data doesn't end with a newline.
+    """
+    for newline in (b'\n', b'\r'):
+        if end > start and data[end - 1:end] == newline:
+            end -= 1
+    return end
 
 
-@cache
 def file_contents(path: str) -> str:
     """
     Transdoc rule that evaluates to the contents of a file.
 
-    This rule has simple cacheing to improve performance when used
-    repeatedly.
+    Contents are cached, so that files are only read once, unless they are
+    modified.
+    """
+    def read(path: str) -> tuple[str, int]:
+        with open(path, encoding='utf-8') as f:
+            contents = f.read()
+        return contents, os.path.getsize(path)
+
+    return FILE_CACHE.get(path, 'contents', read)
+
+
+def file_lines(path: str, start: int, end: Optional[int] = None) -> str:
+    """
+    Transdoc rule that evaluates to a range of lines from a file.
+
+    ## Args
+
+    * `path` (`str`): path to the file.
+    * `start` (`int`): number of the first line to include, counting from
+      `1`.
+    * `end` (`int`, optional): number of the last line to include. Defaults
+      to the end of the file.
+
+    ## Returns
+
+    The lines, without the newline at the end of the last line.
+    """
+    if start < 1:
+        raise ValueError(f"Line numbers start at 1, not {start}")
+    if end is not None and end < start:
+        raise ValueError(f"Line {end} is before line {start}")
+
+    def find(data: bytes) -> tuple[int, int]:
+        range_start = 0
+        for _ in range(start - 1):
+            range_start = line_end(data, range_start)
+        if end is None:
+            range_end = len(data)
+        else:
+            range_end = range_start
+            for _ in range(end - start + 1):
+                range_end = line_end(data, range_end)
+        return range_start, strip_newline(data, range_start, range_end)
+
+    return FILE_CACHE.get(
+        path,
+        ('lines', start, end),
+        lambda path: read_slice(path, find),
+    )
+
+
+def file_region(
+    path: str,
+    marker: str,
+    end_marker: str = DEFAULT_END_MARKER,
+) -> str:
+    """
+    Transdoc rule that evaluates to a region of a file, delimited by marker
+    comments.
+
+    ```py
+    # region: example
+    print("Hello, world!")
+    # endregion
+    ```
+
+    Using `{{file_region('example.py', '# region: example')}}` evaluates to
+    `print("Hello, world!")`.
+
+    ## Args
+
+    * `path` (`str`): path to the file.
+    * `marker` (`str`): text marking the start of the region. The region
+      begins on the line after the first line containing this text.
+    * `end_marker` (`str`, optional): text marking the end of the region.
+      The region ends on the line before the next line containing this text.
+      Defaults to `"# endregion"`.
+
+    ## Returns
+
+    The lines of the region, without the newline at the end of the last
+    line.
     """
-    with open(path, encoding='utf-8') as f:
-        return f.read()
+    def find(data: bytes) -> tuple[int, int]:
+        marker_start = data.find(marker.encode('utf-8'))
+        if marker_start == -1:
+            raise ValueError(f"Marker {marker!r} not found in {path!r}")
+        start = line_end(data, marker_start)
+        end_marker_start = data.find(end_marker.encode('utf-8'), start)
+        if end_marker_start == -1:
+            raise ValueError(
+                f"End marker {end_marker!r} not found after {marker!r} in "
+                f"{path!r}"
+            )
+        # Exclude the line containing the end marker
+        end = data.rfind(b'\n', start, end_marker_start) + 1
+        end = max(start, end)
+        return start, strip_newline(data, start, end)
+
+    return FILE_CACHE.get(
+        path,
+        ('region', marker, end_marker),
+        lambda path: read_slice(path, find),
+    )
@@ -5,11 +5,18 @@ This module contains definitions for some simple commonly-used rules.
 """
 __all__ = [
     "file_contents",
+    "file_lines",
+    "file_region",
     "attributes",
     "attributes_generator",
+    "name_only_filter",
     "markdown_docs_link_generator",
 ]
 
-from .__file_contents import file_contents
-from .__attributes import attributes, attributes_generator
+from .__file_contents import file_contents, file_lines, file_region
+from .__attributes import (
+    attributes,
+    attributes_generator,
+    name_only_filter,
+)
 from .__markdown_docs_link import markdown_docs_link_generator